@@ -3,10 +3,14 @@ from contextlib import contextmanager
 import platform
 import time
 import os
-from collections import defaultdict
-import itertools
+from collections import defaultdict, OrderedDict
 import json
 
+try:
+    from time import perf_counter as wall_time, process_time as cpu_time
+except ImportError: # python 2
+    from time import time as wall_time, clock as cpu_time
+
 def get_machine_info():
     """
     Return information about the machine, including host,
@@ -17,6 +21,113 @@ def get_machine_info():
             'python_version': ".".join(platform.python_version_tuple())}
 
 
+def _percentile(x, q):
+    """ The q-th percentile of the sorted list x, interpolating linearly """
+    i = (len(x) - 1) * q / 100.
+    lo = int(i)
+    hi = min(lo + 1, len(x) - 1)
+    return x[lo] + (x[hi] - x[lo]) * (i - lo)
+
+def summarize(samples):
+    """
+    Return the statistics of a list of timing samples: the number of
+    samples, total, min, max, median, mean, standard deviation and
+    interquartile range.
+    """
+    x = sorted(samples)
+    n = len(x)
+    if n == 0:
+        return {'n' : 0}
+    mean = sum(x) / n
+    std = (sum((xi - mean) ** 2 for xi in x) / (n - 1)) ** 0.5 if n > 1 else 0.
+    return {'n' : n, 'total' : sum(x), 'min' : x[0], 'max' : x[-1],
+            'median' : _percentile(x, 50), 'mean' : mean, 'std' : std,
+            'iqr' : _percentile(x, 75) - _percentile(x, 25)}
+
+def sample_stats(samples):
+    """
+    Return the statistics of the wall and CPU time of the samples of a tag,
+    see :func:`summarize`.
+    """
+    return dict((k, summarize(samples[k])) for k in ('wall', 'cpu'))
+
+def memory_max(memory):
+    """
+    Return the maximum over the ranks of the memory used by a tag, with
+    the rank of the highest peak of the Python allocations.
+    """
+    ranks = [i for i, m in enumerate(memory) if m is not None]
+    rank = max(ranks, key=lambda i: memory[i]['peak'])
+    return {'rss' : max(memory[i]['rss'] for i in ranks),
+            'peak' : memory[rank]['peak'], 'rank' : rank}
+
+def imbalance(values, samples=None, waits=None):
+    """
+    Return the load imbalance of a tag over the ranks that ran it.
+
+    The ranks start each sample together after a barrier; the time a rank
+    waited on the barrier is its entry wait, and the time it would wait for
+    the slowest rank at the end of the samples is its exit wait, from the
+    samples if all ranks have the same number of samples, else from the
+    values.
+
+    Parameters
+    ----------
+    values : list
+        the value of the tag by rank, None for the ranks that did not run it
+    samples : list, optional
+        the wall time samples by rank
+    waits : list, optional
+        the total entry wait ('entry') and the time in the communication of
+        a TracedComm ('mpi'), by rank
+
+    Returns
+    -------
+    dict
+        'max_over_mean' and 'slowest_rank' of the values, 'spread' the
+        difference between the slowest and the fastest rank, and by rank
+        'wait_entry', 'wait_exit' and 'mpi' if known; None if fewer than 2
+        ranks ran the tag
+    """
+    ranks = [i for i, v in enumerate(values) if v is not None]
+    if len(ranks) < 2:
+        return None
+    slowest = max(ranks, key=lambda i: values[i])
+    mean = sum(values[i] for i in ranks) / float(len(ranks))
+    fastest = min(values[i] for i in ranks)
+    result = {'max_over_mean' : values[slowest] / mean if mean > 0 else None,
+              'slowest_rank' : slowest,
+              'spread' : values[slowest] - fastest}
+
+    if (samples is not None and all(samples[i] is not None for i in ranks)
+        and len(set(len(samples[i]) for i in ranks)) == 1):
+        longest = [max(s) for s in zip(*[samples[i] for i in ranks])]
+        exits = [sum(m - w for m, w in zip(longest, samples[i])) for i in ranks]
+    else:
+        exits = [values[slowest] - values[i] for i in ranks]
+    result['wait_exit'] = [None] * len(values)
+    for i, e in zip(ranks, exits):
+        result['wait_exit'][i] = e
+
+    if waits is not None:
+        for key, name in [('entry', 'wait_entry'), ('mpi', 'mpi')]:
+            if any(w is not None and key in w for w in waits):
+                result[name] = [w.get(key) if w is not None else None for w in waits]
+    return result
+
+def reject_outliers(samples, k=1.5):
+    """
+    Return the indices of the samples within Tukey's fences,
+    ``[q1 - k * iqr, q3 + k * iqr]``; all samples if there are fewer
+    than four.
+    """
+    if len(samples) < 4:
+        return list(range(len(samples)))
+    x = sorted(samples)
+    q1, q3 = _percentile(x, 25), _percentile(x, 75)
+    lo, hi = q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+    return [i for i, xi in enumerate(samples) if lo <= xi <= hi]
+
 class BenchmarkLogger(object):
     """
     A class to serve as a session-wide benchmarking fixture, tracking
@@ -36,8 +147,27 @@ class BenchmarkLogger(object):
         the version of the source code being run
     git_hash : str, optional
         the short version of the git commit hash of the source code
+    reduce : bool, optional
+        if True, only the statistics of the samples of each rank are sent
+        to the root rank and written, rather than the samples
+    history : str, optional
+        the database of :class:`~runtests.history.BenchmarkHistory` to
+        append the results of the session to
+    baseline : str, optional
+        the results to compare to, see :func:`runtests.compare.load_baseline`;
+        the changes are in :attr:`changes` on the root rank and the number of
+        regressions in :attr:`regressions` on all ranks
+    threshold : float, optional
+        the relative change of a time that is a regression or an improvement
+    memory : bool, optional
+        if True, the timers of the tests also record the memory used by
+        each tag
+    profile : str, optional
+        the profiler of the tags of the timers of the tests, see
+        :data:`runtests.profiling.PROFILERS`
     """
-    def __init__(self, output_dir, comm=None, version=None, git_hash=None):
+    def __init__(self, output_dir, comm=None, version=None, git_hash=None, reduce=False,
+                 history=None, baseline=None, threshold=0.05, memory=False, profile=None):
 
         # the header
         self.header = {}
@@ -48,9 +178,20 @@ class BenchmarkLogger(object):
         self.header['commsize'] = 1 if comm is None else comm.size
 
         self.comm = comm
+        self.reduce = reduce
+        self.history = history
+        self.baseline = baseline
+        self.threshold = threshold
+        self.memory = memory
+        self.profile = profile
+        self.changes = None
+        self.regressions = 0
         self.benchmarks = defaultdict(dict)
         self.tests_counter = defaultdict(int)
 
+        # output file -> the names of its variants, in the order they were added
+        self.index = OrderedDict()
+
         # handle output dir
         self.output_dir = output_dir
         if self.comm is None or self.comm.rank == 0:
@@ -67,14 +208,29 @@ class BenchmarkLogger(object):
             an individual benchmark result
         """
         key = os.path.join(result.qualname, result.original_testname)
-        name = key + '_%d' % self.tests_counter[key]
 
         # copy over the result
         r = result.benchmark.copy()
         r['attrs'] = result.attrs.copy()
 
-        # add to total benchmarks
+        self.add_result(key, r)
+
+    def add_result(self, key, r):
+        """
+        Add the result of one variant of a test function.
+
+        Parameters
+        ----------
+        key : str
+            the test function, ``qualname/original_testname``
+        r : dict
+            the benchmark results and ``attrs`` of the variant
+        """
+        name = key + '_%d' % self.tests_counter[key]
+
+        # add to total benchmarks, and to the variants of its output file
         self.benchmarks[name].update(r)
+        self.index.setdefault(r['filename'], []).append(name)
 
         # increment test counter
         self.tests_counter[key] += 1
@@ -88,24 +244,81 @@ class BenchmarkLogger(object):
         function (via parametrization) are stored in the same file.
 
         Benchmark results for a single test variant are stored as a list,
-        equal to the length of the comm size.
+        equal to the length of the comm size. The samples of each tag are
+        stored in ``samples`` and their statistics in ``stats``, also as a
+        list by rank. With memory tracking, the maximum over the samples of
+        the memory used by each tag is stored in ``memory`` as a list by
+        rank, and the maximum over the ranks in ``memory_max``. With
+        profiling, the summary of the profile of each tag is stored in
+        ``profile`` as a list by rank. With more than one rank, the load
+        imbalance of each tag is stored in ``imbalance``, see :func:`imbalance`.
+        For the tags of :meth:`BenchmarkTimer.run`, the number of calls per
+        sample and the number of rejected samples are stored in ``calibration``.
+
+        The tests and tags are those of any rank, e.g. a tag that only ran
+        on some ranks; the variants of a test are matched by name.
 
         .. note::
             When using MPI, this should be collectively, as benchmark
-            results are gathered from all ranks. Only the
+            results are gathered from all ranks, with a single gather to
+            the root rank. Only the root rank writes the results.
         """
-        # group results by the file they will be written to
-        # NOTE: this name ignores the parametrization (parametrized results
-        # get written to same file)
-        keyfunc = lambda x: self.benchmarks[x]['filename']
-        groups = itertools.groupby(self.benchmarks.keys(), key=keyfunc)
+        # send the results of all tests of this rank to the root
+        local = self._pack()
+        if self.comm is None:
+            ranks = [local]
+        else:
+            ranks = self.comm.gather(local, root=0)
+            if self.comm.rank != 0:
+                if self.baseline is not None:
+                    self.regressions = self.comm.bcast(None)
+                return
+
+        try:
+            self._report(ranks)
+        finally:
+            # the other ranks wait for the regressions, also on errors
+            if self.comm is not None and self.baseline is not None:
+                self.comm.bcast(self.regressions)
+
+    def _merge(self, ranks):
+        """
+        The union over the ranks of the variants of each output file, and
+        of the tags of each variant.
+        """
+        index = OrderedDict()
+        groups = {}
+        for rank in ranks:
+            for filename, names in rank['index'].items():
+                variants = index.setdefault(filename, [])
+                variants.extend(name for name in names if name not in variants)
+            for name, meta in rank['meta'].items():
+                group = groups.setdefault(name, dict(meta, tags=[]))
+                group['tags'].extend(tag for tag in meta['tags'] if tag not in group['tags'])
+                group['memory'] = group['memory'] or meta['memory']
+                group['profile'] = group['profile'] or meta['profile']
+        return index, groups
+
+    def _report(self, ranks):
+        """
+        Write the results gathered from the ranks; on the root rank.
+        """
+        index, groups = self._merge(ranks)
+        ranks = [rank['results'] for rank in ranks]
 
-        # sort groups so we avoid MPI issues
-        groups = [(key, list(subgroup)) for key, subgroup in groups]
-        groups = sorted(groups, key=lambda x: x[0])
+        # load the baseline before the results overwrite it or join the history
+        if self.baseline is not None:
+            from .compare import load_baseline
+            baseline, self.baseline_description = load_baseline(
+                    self.baseline, self.history, self.header['commsize'])
+
+        # the results of each file, for the history
+        results = {}
 
         # loop over each parametrized test function
-        for filename, subgroup in groups:
+        # NOTE: the file name ignores the parametrization (parametrized results
+        # get written to same file)
+        for filename in sorted(index):
 
             # start with the info for this test
             result = {}
@@ -114,7 +327,7 @@ class BenchmarkLogger(object):
 
             # loop over subgroups
             # NOTE: these are the parametrized test variants
-            for i, key in enumerate(sorted(subgroup)):
+            for i, key in enumerate(index[filename]):
 
                 # extract the name of this test
                 name = key.split('/')[-1]
@@ -126,29 +339,122 @@ class BenchmarkLogger(object):
                 # a group of benchmarks
                 # NOTE: contains results for all tags within a single function run
                 # for a parametrized variant
-                benchmark_group = self.benchmarks[key]
+                benchmark_group = groups[key]
                 tags = sorted(benchmark_group['tags'])
 
-                # for each tag, gather the benchmark results from each rank
+                # for each tag, collect the benchmark results of each rank
+                result[name]['samples'] = {}
+                result[name]['stats'] = {}
+                if benchmark_group['memory']:
+                    result[name]['memory'] = {}
+                    result[name]['memory_max'] = {}
+                if benchmark_group['profile']:
+                    result[name]['profile'] = {}
                 for tag in tags:
-                    if self.comm is None:
-                        benchmarks = [benchmark_group[tag]]
-                    else:
-                        benchmarks = self.comm.allgather(benchmark_group[tag])
-                    result[name][tag] = benchmarks
+                    benchmarks = [rank.get(key, {}).get(tag, (None,) * 7) for rank in ranks]
+                    result[name][tag] = [b[0] for b in benchmarks]
+                    samples = [b[1] for b in benchmarks]
+                    stats = [b[2] for b in benchmarks]
+                    # NOTE: the ranks that did not run the tag, e.g. outside
+                    # of the communicator of a scaling test, have None
+                    if any(s is not None for s in samples):
+                        result[name]['samples'][tag] = samples
+                        stats = [None if s is None else sample_stats(s) for s in samples]
+                    if any(s is not None for s in stats):
+                        result[name]['stats'][tag] = stats
+                    memory = [b[3] for b in benchmarks]
+                    if 'memory' in result[name] and any(m is not None for m in memory):
+                        result[name]['memory'][tag] = memory
+                        result[name]['memory_max'][tag] = memory_max(memory)
+                    profile = [b[4] for b in benchmarks]
+                    if 'profile' in result[name] and any(p is not None for p in profile):
+                        result[name]['profile'][tag] = profile
+                    waits = [b[5] for b in benchmarks]
+                    wall = [None if s is None else s['wall'] for s in samples]
+                    balance = imbalance(result[name][tag], wall if any(wall) else None,
+                                        waits if any(waits) else None)
+                    if balance is not None:
+                        result[name].setdefault('imbalance', {})[tag] = balance
+                    # the same on all ranks that ran the tag
+                    calibration = [b[6] for b in benchmarks if b[6] is not None]
+                    if len(calibration) > 0:
+                        result[name].setdefault('calibration', {})[tag] = calibration[0]
 
                 # store meta data
+                result[name]['tags'] = tags
                 result[name]['testname'] = benchmark_group['testname']
                 result[name]['attrs'] = benchmark_group['attrs']
 
+                # the analysis of a scaling test, see MPIScalingTest
+                if 'scaling' in benchmark_group['attrs']:
+                    from .scaling import analyze
+                    result[name]['scaling'] = analyze(result[name])
+
                 # track section names for each test
                 if i == 0:
                     result['tags'] = tags
 
             # write out
-            if self.comm is None or self.comm.rank == 0:
-                filename = os.path.join(self.output_dir, filename) + '.json'
-                json.dump(result, open(filename, 'w'))
+            self._write(os.path.join(self.output_dir, filename) + '.json', result)
+            results[filename] = result
+
+        if self.baseline is not None:
+            from .compare import compare, from_results
+            self.changes = compare(baseline, from_results(results), self.threshold)
+            self.regressions = len([c for c in self.changes if c['status'] == 'regression'])
+
+        if self.history is not None and len(results) > 0:
+            from .history import BenchmarkHistory
+            history = BenchmarkHistory(self.history)
+            history.append(self.header, results)
+            history.close()
+
+    def _write(self, filename, result):
+        """
+        Write the results of a file atomically, so that readers never see
+        a partial file.
+        """
+        with open(filename + '.tmp', 'w') as ff:
+            json.dump(result, ff)
+        os.rename(filename + '.tmp', filename)
+
+    def _pack(self):
+        """
+        The results of this rank: the variants of each output file, the
+        tags and attributes of each variant, and for each variant and tag,
+        the value, the samples, their statistics, the maximal memory used,
+        the summary of the profile, the total waits and the calibration of
+        :meth:`BenchmarkTimer.run`; with
+        :attr:`reduce`, only the statistics are computed here and the
+        samples are left out.
+        """
+        packed = {}
+        meta = {}
+        for key, benchmark_group in self.benchmarks.items():
+            meta[key] = {'tags' : benchmark_group['tags'],
+                         'testname' : benchmark_group['testname'],
+                         'attrs' : benchmark_group['attrs'],
+                         'memory' : 'memory' in benchmark_group,
+                         'profile' : 'profile' in benchmark_group}
+            packed[key] = {}
+            for tag in benchmark_group['tags']:
+                samples = benchmark_group.get('samples', {}).get(tag)
+                memory = benchmark_group.get('memory', {}).get(tag)
+                if memory is not None:
+                    memory = {'rss' : max(memory['rss']), 'peak' : max(memory['peak']),
+                              'top' : memory['top']}
+                profile = benchmark_group.get('profile', {}).get(tag)
+                wait = benchmark_group.get('wait', {}).get(tag)
+                if wait is not None:
+                    wait = dict((k, sum(v)) for k, v in wait.items())
+                calibration = benchmark_group.get('calibration', {}).get(tag)
+                if self.reduce and samples is not None:
+                    packed[key][tag] = (benchmark_group[tag], None, sample_stats(samples),
+                                        memory, profile, wait, calibration)
+                else:
+                    packed[key][tag] = (benchmark_group[tag], samples, None, memory, profile,
+                                        wait, calibration)
+        return {'index' : self.index, 'meta' : meta, 'results' : packed}
 
 class BenchmarkTimer(object):
     """
@@ -164,8 +470,17 @@ class BenchmarkTimer(object):
         ``module_name . func_name``
     node :
         the request node corresponding to to this test function.
+    comm : MPI communicator, optional
+        the communicator of the test
+    memory : bool, optional
+        if True, also record the memory used by each tag, see
+        :class:`~runtests.memory.MemoryTracker`
+    profile : str, optional
+        profile each tag with a profiler of :data:`runtests.profiling.PROFILERS`
+    profile_dir : str, optional
+        the directory to save the profiles to, if the profiler saves them
     """
-    def __init__(self, qualname, node, comm=None):
+    def __init__(self, qualname, node, comm=None, memory=False, profile=None, profile_dir=None):
 
         # add the testname
         self.qualname = qualname
@@ -185,29 +500,319 @@ class BenchmarkTimer(object):
         # store benchmarks here
         self.benchmark = {'filename':self.filename, 'testname':self.testname}
         self.benchmark['tags'] = []
+        self.benchmark['samples'] = {}
+
+        # the memory of each tag, if requested
+        self._memory = None
+        if memory:
+            from .memory import MemoryTracker
+            self._memory = MemoryTracker(exclude=[__file__])
+            self.benchmark['memory'] = {}
+
+        # the profile of each tag, if requested
+        self._profiler = None
+        self.profile_dir = profile_dir
+        if profile is not None:
+            from .profiling import PROFILERS
+            self._profiler = PROFILERS[profile](exclude=[__file__])
 
         # store meta-data here
         self.attrs = {}
 
+        # the tags of the enclosing contexts
+        self._stack = []
+
+        # the tags timed with run(); their value is the median
+        self._run_tags = set()
+
+        # the time spent in the communication of a TracedComm by the active tags
+        self._active = []
+        self._mpi = {}
+        self._traced = False
+
+    def _record(self, tag, wall, cpu):
+        """
+        Record a sample of ``tag``; the value of the tag is the total wall
+        time of its samples.
+        """
+        if tag not in self.benchmark['samples']:
+            self.benchmark['tags'].append(tag)
+            self.benchmark['samples'][tag] = {'wall' : [], 'cpu' : []}
+            self.benchmark[tag] = 0.
+        self.benchmark['samples'][tag]['wall'].append(wall)
+        self.benchmark['samples'][tag]['cpu'].append(cpu)
+        self.benchmark[tag] += wall
+
+    def _barrier(self):
+        """
+        Synchronize the ranks; returns the time this rank waited for the
+        others, None without a communicator.
+        """
+        if self.comm is None:
+            return None
+        start = wall_time()
+        self.comm.barrier()
+        return wall_time() - start
+
+    def _record_wait(self, tag, entry, mpi=None):
+        """
+        Record the time a sample of ``tag`` waited for the other ranks on
+        entry, and the time spent in the communication of a TracedComm.
+        """
+        if entry is None and mpi is None:
+            return
+        wait = self.benchmark.setdefault('wait', {}).setdefault(tag, {'entry' : []})
+        if entry is not None:
+            wait['entry'].append(entry)
+        if mpi is not None:
+            wait.setdefault('mpi', []).append(mpi)
+
+    def _add_mpi(self, elapsed):
+        for tag in self._active:
+            self._mpi[tag] += elapsed
+
+    def trace(self, comm):
+        """
+        Return a :class:`TracedComm` of ``comm``, which records the time
+        spent in its communication by each tag, apart from the computation.
+        """
+        self._traced = True
+        return TracedComm(comm, self)
+
+    def _record_memory(self, tag, usage):
+        """
+        Record the memory used by a sample of ``tag``; the top allocation
+        sites are those of the sample with the highest peak.
+        """
+        memory = self.benchmark['memory'].setdefault(tag, {'rss' : [], 'peak' : [], 'top' : []})
+        if len(memory['peak']) == 0 or usage['peak'] >= max(memory['peak']):
+            memory['top'] = usage['top']
+        memory['rss'].append(usage['rss'])
+        memory['peak'].append(usage['peak'])
+
     @contextmanager
     def __call__(self, tag):
         """
-        A context manager that uses :func:`time.time` to compute the elapsed
-        time spent in the context.
+        A context manager that records the wall time (with
+        :func:`time.perf_counter`) and the CPU time (with
+        :func:`time.process_time`) spent in the context.
+
+        Nested contexts are recorded under the tags of the enclosing
+        contexts joined by '/', e.g. 'solve/iteration'. Entering a tag
+        again, e.g. in a loop, adds a sample to the tag.
+
+        With a communicator, the ranks are synchronized with a barrier
+        before the context; the time each rank waited is recorded, see
+        :func:`imbalance`.
+
+        With memory tracking or profiling, the memory used in the context
+        is also recorded, or the context is profiled; these are outside of
+        the timing of the context, but inside the timing of the enclosing
+        contexts.
 
         Parameters
         ----------
         tag : str
             an identifying tag to label this benchmark
         """
-        if self.comm is not None:
-            self.comm.barrier()
-
-        start = time.time()
-        yield
-        end = time.time()
+        name, tag = tag, '/'.join(self._stack + [tag])
+        if tag in self._run_tags:
+            raise ValueError("tag '%s' is timed with run(); use another tag" % tag)
+        entry = self._barrier()
+
+        self._stack.append(name)
+        self._active.append(tag)
+        self._mpi[tag] = 0.
+        frame = self._memory.start() if self._memory is not None else None
+        profile = self._profiler.start(tag) if self._profiler is not None else None
+        start, cpu_start = wall_time(), cpu_time()
+        try:
+            yield
+        finally:
+            end, cpu_end = wall_time(), cpu_time()
+            if self._profiler is not None:
+                self._profiler.stop(profile)
+            usage = self._memory.stop(frame) if frame is not None else None
+            self._stack.pop()
+            self._active.pop()
+            mpi = self._mpi.pop(tag)
 
         # record the results in benchmarks attribute
-        elapsed = end-start
-        self.benchmark[tag] = elapsed
-        self.benchmark['tags'].append(tag)
+        self._record(tag, end - start, cpu_end - cpu_start)
+        self._record_wait(tag, entry, mpi if self._traced else None)
+        if usage is not None:
+            self._record_memory(tag, usage)
+
+    @contextmanager
+    def scope(self, name, comm):
+        """
+        A context manager for a part of the test that runs on another
+        communicator, e.g. a sub-communicator of a scaling test: the tags
+        in the context are recorded under ``name``, and timed on ``comm``.
+        """
+        saved = self.comm
+        self.comm = comm
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self.comm = saved
+
+    def finish(self):
+        """
+        Summarize the profile of each tag, and save the profiles if the
+        profiler saves them; called once the test is done.
+        """
+        if self._profiler is None:
+            return
+        from .profiling import pstats_filename
+        rank = 0 if self.comm is None else self.comm.rank
+        self.benchmark['profile'] = {}
+        for tag in self.benchmark['tags']:
+            summary = self._profiler.summary(tag)
+            if summary is not None:
+                self.benchmark['profile'][tag] = summary
+            if hasattr(self._profiler, 'save') and self.profile_dir is not None:
+                self._profiler.save(tag, pstats_filename(self.profile_dir, self.filename,
+                                                         self.testname, tag, rank))
+        if hasattr(self._profiler, 'close'):
+            self._profiler.close()
+
+    def stats(self, tag):
+        """
+        Return the statistics of the wall and CPU time samples of a tag on
+        this rank, see :func:`summarize`.
+        """
+        return sample_stats(self.benchmark['samples'][tag])
+
+    def _time(self, func, args, kwargs, number):
+        start, cpu_start = wall_time(), cpu_time()
+        for i in range(number):
+            func(*args, **kwargs)
+        return wall_time() - start, cpu_time() - cpu_start
+
+    def run(self, tag, func, args=(), kwargs=None, warmup=1, repeat=5,
+            target_time=0.2, max_number=1000000):
+        """
+        Time ``func(*args, **kwargs)`` robustly.
+
+        The function is called ``warmup`` times untimed; then the number of
+        calls per sample is calibrated such that a sample takes at least
+        ``target_time`` seconds; then ``repeat`` samples are taken, and the
+        samples outside Tukey's fences are rejected. With a communicator,
+        the number of calls is the same on all ranks, each sample starts
+        with a barrier, and the samples are rejected by the slowest rank,
+        such that all ranks keep the same samples.
+
+        The samples are the time of one call; the value of the tag is the
+        median, hence a tag of run() cannot also be timed in a with block.
+        The number of calls per sample and the number of rejected samples
+        are recorded in ``calibration``. With memory tracking or profiling,
+        all the samples are a single region of code.
+
+        Parameters
+        ----------
+        tag : str
+            an identifying tag to label this benchmark
+        func : callable
+            the function to time
+        args : tuple, optional
+            the positional arguments of the function
+        kwargs : dict, optional
+            the keyword arguments of the function
+        warmup : int, optional
+            the number of untimed calls
+        repeat : int, optional
+            the number of samples
+        target_time : float, optional
+            the minimal duration of a sample, in seconds
+        max_number : int, optional
+            the maximal number of calls per sample
+
+        Returns
+        -------
+        dict
+            the statistics of the samples of the tag on this rank
+        """
+        if kwargs is None:
+            kwargs = {}
+        tag = '/'.join(self._stack + [tag])
+        if tag in self.benchmark['samples'] and tag not in self._run_tags:
+            raise ValueError("tag '%s' is timed in a with block; use another tag" % tag)
+        self._run_tags.add(tag)
+
+        for i in range(warmup):
+            func(*args, **kwargs)
+
+        # calibrate on the slowest rank, such that all ranks agree
+        number = 1
+        while True:
+            elapsed = self._time(func, args, kwargs, number)[0]
+            if self.comm is not None:
+                elapsed = max(self.comm.allgather(elapsed))
+            if elapsed >= target_time or number >= max_number:
+                break
+            if elapsed <= 0:
+                number *= 10
+            else:
+                number = max(number * 2, int(number * 1.2 * target_time / elapsed))
+            number = min(number, max_number)
+
+        wall, cpu, entry = [], [], []
+        frame = self._memory.start() if self._memory is not None else None
+        profile = self._profiler.start(tag) if self._profiler is not None else None
+        for i in range(repeat):
+            entry.append(self._barrier())
+            w, c = self._time(func, args, kwargs, number)
+            wall.append(w / number)
+            cpu.append(c / number)
+        if self._profiler is not None:
+            self._profiler.stop(profile)
+
+        # a sample is as slow as its slowest rank
+        slowest = wall
+        if self.comm is not None:
+            slowest = [max(w) for w in zip(*self.comm.allgather(wall))]
+        kept = reject_outliers(slowest)
+        for i in kept:
+            self._record(tag, wall[i], cpu[i])
+            self._record_wait(tag, entry[i])
+        if frame is not None:
+            self._record_memory(tag, self._memory.stop(frame))
+
+        calibration = self.benchmark.setdefault('calibration', {}).setdefault(
+                tag, {'number' : number, 'rejected' : 0})
+        calibration['number'] = number
+        calibration['rejected'] += repeat - len(kept)
+        stats = self.stats(tag)
+        self.benchmark[tag] = stats['wall']['median']
+        return stats
+
+class TracedComm(object):
+    """
+    A proxy of a communicator that attributes the time spent in its
+    methods, e.g. ``allreduce`` or ``Send``, to the active tags of a
+    :class:`BenchmarkTimer`; see :meth:`BenchmarkTimer.trace`.
+
+    Only calls through the proxy are timed; the proxy is not a
+    communicator for mpi4py, e.g. as an argument of another call, use
+    :attr:`comm` there.
+    """
+    def __init__(self, comm, timer):
+        self.comm = comm
+        self.timer = timer
+
+    def __getattr__(self, name):
+        attr = getattr(self.comm, name)
+        if not callable(attr):
+            return attr
+        timer = self.timer
+
+        def traced(*args, **kwargs):
+            start = wall_time()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                timer._add_mpi(wall_time() - start)
+        return traced
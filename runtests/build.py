@@ -0,0 +1,598 @@
+"""
+    Helpers for building and installing the project into ``build/testenv``.
+"""
+import os
+import re
+import sys
+import time
+import json
+import shutil
+import select
+import hashlib
+import platform
+import sysconfig
+import subprocess
+
+def _file_digest(path):
+    """
+    Return the sha1 hex digest of the content of a file.
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as ff:
+        while True:
+            chunk = ff.read(1 << 20)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def list_source_files(root, exclude=('build', 'build.log', '.git')):
+    """
+    Return the paths (relative to ``root``) of the source files of the project.
+
+    In a git checkout this is the list of tracked and untracked but not
+    ignored files; otherwise the directory tree is walked.
+
+    Parameters
+    ----------
+    root : str
+        the root directory of the source package
+    exclude : list of str
+        top-level names to skip; the build products live there
+    """
+    def keep(path):
+        return path.split('/')[0] not in exclude
+
+    try:
+        null = open(os.devnull, 'w')
+        out = subprocess.check_output(['git', 'ls-files', '-z', '--cached',
+                                       '--others', '--exclude-standard'],
+                                      cwd=root, stderr=null)
+        paths = [p for p in out.decode().split('\0') if p]
+        return sorted(set(p for p in paths if keep(p)))
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        if rel == '.':
+            dirnames[:] = [d for d in dirnames if keep(d)]
+            filenames = [f for f in filenames if keep(f)]
+            rel = ''
+        for fn in filenames:
+            paths.append(os.path.join(rel, fn).replace(os.sep, '/'))
+    return sorted(paths)
+
+class SourceManifest(object):
+    """
+    A snapshot of the source tree, recording the mtime, size and content
+    hash of every source file.
+
+    Content hashes are only recomputed for files whose mtime or size
+    differ from the previous snapshot, so scanning an unchanged tree
+    costs one ``stat`` per file.
+
+    Parameters
+    ----------
+    root : str
+        the root directory of the source package
+    files : dict, optional
+        mapping from relative path to ``[mtime, size, digest]``
+    """
+    def __init__(self, root, files=None):
+        self.root = root
+        self.files = {} if files is None else files
+
+    @classmethod
+    def load(cls, root, filename):
+        """
+        Load a manifest saved by :meth:`save`; return None if there is none.
+        """
+        try:
+            with open(filename, 'r') as ff:
+                return cls(root, json.load(ff)['files'])
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def save(self, filename):
+        """
+        Save the manifest to a JSON file.
+        """
+        # write and rename; never write into a hard-linked file
+        with open(filename + '.tmp', 'w') as ff:
+            json.dump({'files' : self.files}, ff)
+        os.rename(filename + '.tmp', filename)
+
+    @classmethod
+    def scan(cls, root, previous=None):
+        """
+        Take a snapshot of the source tree at ``root``, reusing the hashes
+        of ``previous`` for files that have not been touched.
+        """
+        old = {} if previous is None else previous.files
+        files = {}
+        for path in list_source_files(root):
+            fullpath = os.path.join(root, path)
+            try:
+                st = os.stat(fullpath)
+            except OSError:
+                # tracked but deleted from the working tree
+                continue
+            entry = old.get(path)
+            if entry is not None and entry[0] == st.st_mtime and entry[1] == st.st_size:
+                files[path] = entry
+            else:
+                files[path] = [st.st_mtime, st.st_size, _file_digest(fullpath)]
+        return cls(root, files)
+
+    def changed(self, other):
+        """
+        Return the sorted list of paths whose content differs between
+        this manifest and ``other``, including added and removed files.
+        """
+        paths = set(self.files) | set(other.files)
+        def digest(files, path):
+            entry = files.get(path)
+            return None if entry is None else entry[2]
+        return sorted(p for p in paths
+                      if digest(self.files, p) != digest(other.files, p))
+
+def read_install_record(filename, site_dirs):
+    """
+    Read the list of installed files written by ``setup.py install --record``.
+
+    Returns
+    -------
+    installed : dict
+        mapping from the path relative to its site directory to the absolute
+        installed path; None if the record does not exist
+    """
+    try:
+        with open(filename, 'r') as ff:
+            lines = [l.strip() for l in ff if l.strip()]
+    except (IOError, OSError):
+        return None
+
+    installed = {}
+    for path in lines:
+        for site_dir in site_dirs:
+            if path.startswith(site_dir + os.sep):
+                rel = os.path.relpath(path, site_dir).replace(os.sep, '/')
+                installed[rel] = path
+                break
+    return installed
+
+def link_tree(src, dst):
+    """
+    Replicate the directory tree ``src`` at ``dst`` with hard links,
+    falling back to copies where linking is not possible (e.g. across
+    file systems). Symbolic links are recreated as is.
+    """
+    for dirpath, dirnames, filenames in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(dirpath, src))
+        if not os.path.exists(target):
+            os.makedirs(target)
+
+        links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+        dirnames[:] = [d for d in dirnames if d not in links]
+
+        for fn in filenames + links:
+            s = os.path.join(dirpath, fn)
+            d = os.path.join(target, fn)
+            if os.path.islink(s):
+                os.symlink(os.readlink(s), d)
+                continue
+            try:
+                os.link(s, d)
+            except OSError:
+                shutil.copy2(s, d)
+
+def unshare_tree(path):
+    """
+    Give every hard-linked file under ``path`` a private copy, such that
+    writing into the tree does not modify the other links.
+    """
+    for dirpath, dirnames, filenames in os.walk(path):
+        for fn in filenames:
+            f = os.path.join(dirpath, fn)
+            if os.path.islink(f) or os.stat(f).st_nlink <= 1:
+                continue
+            tmp = f + '.unshare'
+            shutil.copy2(f, tmp)
+            os.rename(tmp, f)
+
+def get_abi_tag():
+    """
+    Return a string identifying the ABI of the running interpreter.
+    """
+    return '-'.join([platform.python_implementation(),
+                     str(sysconfig.get_config_var('SOABI')),
+                     platform.machine(),
+                     sys.version])
+
+class BuildCache(object):
+    """
+    A content-addressed cache of installations of the project.
+
+    Each entry is a copy of ``build/testenv`` keyed by a hash of the source
+    tree, the build flags and the interpreter ABI. Entries are stored and
+    restored with hard links, so a cache hit costs one link per installed
+    file instead of a build.
+
+    Parameters
+    ----------
+    cache_dir : str
+        the directory holding the cache entries
+    max_entries : int, optional
+        the number of entries to keep; the least recently used are removed
+    """
+    KEY_FILE = '.build_cache_key'
+
+    def __init__(self, cache_dir, max_entries=8):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.manifest_file = os.path.join(cache_dir, 'source_manifest.json')
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, root, debug=False):
+        """
+        Return the cache key of the source tree at ``root`` built with
+        the given flags by the running interpreter.
+        """
+        previous = SourceManifest.load(root, self.manifest_file)
+        manifest = SourceManifest.scan(root, previous)
+        manifest.save(self.manifest_file)
+
+        h = hashlib.sha1()
+        for path in sorted(manifest.files):
+            h.update(('%s %s\n' % (path, manifest.files[path][2])).encode())
+        h.update(('debug=%s\n' % bool(debug)).encode())
+        h.update(get_abi_tag().encode())
+        return h.hexdigest()
+
+    def current(self, dest_dir):
+        """
+        Return the key of the entry ``dest_dir`` was built or restored as.
+        """
+        try:
+            with open(os.path.join(dest_dir, self.KEY_FILE), 'r') as ff:
+                return ff.read().strip()
+        except (IOError, OSError):
+            return None
+
+    def _mark(self, dest_dir, key):
+        # write and rename; the old marker may be linked into an entry
+        marker = os.path.join(dest_dir, self.KEY_FILE)
+        with open(marker + '.tmp', 'w') as ff:
+            ff.write(key)
+        os.rename(marker + '.tmp', marker)
+
+    def restore(self, key, dest_dir):
+        """
+        Restore the entry ``key`` into ``dest_dir``.
+
+        Returns
+        -------
+        bool
+            True on a cache hit, False if there is no such entry
+        """
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            return False
+
+        # mark as recently used
+        os.utime(entry, None)
+
+        if self.current(dest_dir) == key:
+            return True
+
+        if os.path.exists(dest_dir):
+            shutil.rmtree(dest_dir)
+        link_tree(entry, dest_dir)
+        return True
+
+    def store(self, key, dest_dir):
+        """
+        Store the installation in ``dest_dir`` as the entry ``key``.
+        """
+        self._mark(dest_dir, key)
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.exists(entry):
+            return
+
+        tmp = entry + '.tmp'
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        link_tree(dest_dir, tmp)
+        os.rename(tmp, entry)
+        self.prune()
+
+    def prune(self):
+        """
+        Remove the least recently used entries beyond :attr:`max_entries`.
+        """
+        entries = [os.path.join(self.cache_dir, e) for e in os.listdir(self.cache_dir)]
+        entries = [e for e in entries if os.path.isdir(e) and not e.endswith('.tmp')]
+        entries = sorted(entries, key=os.path.getmtime, reverse=True)
+        for entry in entries[self.max_entries:]:
+            shutil.rmtree(entry)
+
+class BuildMonitor(object):
+    """
+    Follow the output of a build as it arrives, writing it to a log file
+    and reporting progress: the number of compiled translation units,
+    the extension being built and the elapsed time.
+
+    On a terminal the progress line is updated in place; otherwise a line is
+    printed whenever a new extension is started, and at least every
+    ``interval`` seconds while the build produces output (to allow continuous
+    integration environments kill a hanging process accurately if it produces
+    no output).
+
+    Parameters
+    ----------
+    log : file
+        a binary file to tee the output to
+    stream : file, optional
+        where to report progress
+    interval : float, optional
+        the maximum number of seconds between progress reports on a
+        non-terminal stream
+    """
+    COMPILERS = set(['cc', 'gcc', 'clang', 'c++', 'g++', 'clang++', 'icc', 'icpc',
+                     'gfortran', 'f77', 'f90', 'f95', 'ifort', 'mpicc', 'mpicxx', 'nvcc'])
+    WRAPPERS = set(['ccache', 'sccache', 'f90cache'])
+    EXTENSION = re.compile(r"building '([^']+)' extension")
+
+    def __init__(self, log, stream=None, interval=60.):
+        self.log = log
+        self.stream = sys.stdout if stream is None else stream
+        self.interval = interval
+        self.isatty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+
+        self.start = time.time()
+        self.last_report = self.start
+        self.ncompiled = 0
+        self.extension = None
+
+    def is_compile(self, line):
+        """
+        Whether a line of build output is a compiler invocation of a
+        translation unit.
+        """
+        words = line.split()
+        while words and os.path.basename(words[0]) in self.WRAPPERS:
+            words = words[1:]
+        if not words or '-c' not in words:
+            return False
+        compiler = re.sub(r'-[\d.]+$', '', os.path.basename(words[0]))
+        if compiler.startswith('x86_64-') or compiler.startswith('aarch64-'):
+            compiler = compiler.split('-')[-1]
+        return compiler in self.COMPILERS
+
+    def status(self):
+        """
+        A one-line description of the progress of the build.
+        """
+        s = "    ... %.1f s, %d unit(s) compiled" % (time.time() - self.start, self.ncompiled)
+        if self.extension is not None:
+            s += ", building '%s'" % self.extension
+        return s
+
+    def feed(self, line):
+        """
+        Process one line of the build output.
+        """
+        self.log.write(line)
+
+        text = line.decode('utf-8', 'replace')
+        new_extension = False
+        match = self.EXTENSION.search(text)
+        if match:
+            new_extension = match.group(1) != self.extension
+            self.extension = match.group(1)
+        if self.is_compile(text):
+            self.ncompiled += 1
+
+        now = time.time()
+        if self.isatty:
+            if now - self.last_report > 0.2 or new_extension:
+                self.stream.write('\r\x1b[K' + self.status())
+                self.stream.flush()
+                self.last_report = now
+        elif new_extension or now - self.last_report > self.interval:
+            self.stream.write(self.status() + '\n')
+            self.stream.flush()
+            self.last_report = now
+
+    def run(self, proc):
+        """
+        Follow the stdout pipe of ``proc`` until the process exits.
+
+        The pipe is not followed to its end: a daemon started by the build
+        (e.g. the sccache server) inherits it and keeps it open. We stop
+        once ``proc`` has exited and the pipe has no more pending output.
+
+        Returns
+        -------
+        int
+            the return code of ``proc``
+        """
+        fd = proc.stdout.fileno()
+        pending = b''
+        while True:
+            ready, _, _ = select.select([fd], [], [], 0.1)
+            if ready:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    self.feed(line + b'\n')
+            elif proc.poll() is not None:
+                break
+        if pending:
+            self.feed(pending)
+        proc.stdout.close()
+        ret = proc.wait()
+        self.log.flush()
+        if self.isatty:
+            self.stream.write('\r\x1b[K')
+            self.stream.flush()
+        return ret
+
+    def summary(self):
+        """
+        A summary of the build, to be printed after it finished.
+        """
+        return "%d unit(s) compiled in %.1f s" % (self.ncompiled, time.time() - self.start)
+
+def get_cpu_count():
+    """
+    Return the number of CPUs available to this process, honoring the
+    CPU affinity mask where the platform supports it.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    import multiprocessing
+    return multiprocessing.cpu_count()
+
+def _which(name, path):
+    for d in path.split(os.pathsep):
+        f = os.path.join(d, name)
+        if os.path.isfile(f) and os.access(f, os.X_OK):
+            return f
+    return None
+
+class CompilerCache(object):
+    """
+    Detect a compiler cache (ccache or sccache) for the build and report
+    its hit rate.
+
+    The masquerading directories on ``extra_path`` that exist are put on
+    ``PATH``. If there are none, but a ``ccache`` or ``sccache`` executable
+    is found and ``CC`` is not set, the compiler of the interpreter is
+    wrapped through ``CC`` and ``CXX``.
+
+    Parameters
+    ----------
+    extra_path : list of str
+        candidate directories holding compiler wrappers
+    env : dict
+        the environment of the build; updated in place
+    """
+    def __init__(self, extra_path, env):
+        self.env = env
+        self.path = [d for d in extra_path if os.path.isdir(d)]
+        env['PATH'] = os.pathsep.join(self.path + env.get('PATH', '').split(os.pathsep))
+
+        self.tool = None
+        names = ['ccache'] if self.path else ['ccache', 'sccache']
+        for name in names:
+            if _which(name, env['PATH']) is not None:
+                self.tool = name
+                break
+
+        if self.tool is not None and not self.path and 'CC' not in env:
+            for var in ['CC', 'CXX']:
+                compiler = sysconfig.get_config_var(var)
+                if compiler:
+                    env[var] = self.tool + ' ' + compiler
+
+    def stats(self):
+        """
+        Return the number of cache hits and misses so far, or None if
+        unknown.
+        """
+        if self.tool is None:
+            return None
+        null = open(os.devnull, 'w')
+        try:
+            if self.tool == 'ccache':
+                try:
+                    out = subprocess.check_output(['ccache', '--print-stats'],
+                                                  env=self.env, stderr=null).decode()
+                    stats = dict(l.split('\t', 1) for l in out.splitlines() if '\t' in l)
+                    hits = int(stats.get('direct_cache_hit', 0)) + int(stats.get('preprocessed_cache_hit', 0))
+                    return hits, int(stats.get('cache_miss', 0))
+                except subprocess.CalledProcessError:
+                    # older ccache
+                    out = subprocess.check_output(['ccache', '-s'],
+                                                  env=self.env, stderr=null).decode()
+                    hits = sum(int(n) for n in re.findall(r'^cache hit \(\w+\)\s+(\d+)', out, re.M))
+                    misses = re.findall(r'^cache miss\s+(\d+)', out, re.M)
+                    return hits, int(misses[0]) if misses else 0
+            else:
+                out = subprocess.check_output(['sccache', '--show-stats'],
+                                              env=self.env, stderr=null).decode()
+                hits = re.findall(r'^Cache hits\s+(\d+)', out, re.M)
+                misses = re.findall(r'^Cache misses\s+(\d+)', out, re.M)
+                return int(hits[0]) if hits else 0, int(misses[0]) if misses else 0
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, before, after):
+        """
+        Describe the hit rate between two calls to :meth:`stats`.
+        """
+        if before is None or after is None:
+            return None
+        hits = after[0] - before[0]
+        misses = after[1] - before[1]
+        if hits + misses == 0:
+            return "%s: no cacheable compilations" % self.tool
+        return "%s: %d hit(s), %d miss(es), %.0f%% hit rate" % (
+                self.tool, hits, misses, 100. * hits / (hits + misses))
+
+def parallel_compile(njobs):
+    """
+    Patch distutils to compile the sources of an extension in a pool of
+    ``njobs`` workers, for setup.py scripts that do not support ``-j``.
+
+    Each source is compiled by a compiler subprocess, hence a pool
+    of threads is sufficient to keep ``njobs`` compilers running.
+    """
+    try:
+        import setuptools
+    except ImportError:
+        pass
+    import distutils.ccompiler
+    from multiprocessing.pool import ThreadPool
+
+    def compile(self, sources, output_dir=None, macros=None,
+                include_dirs=None, debug=0, extra_preargs=None,
+                extra_postargs=None, depends=None):
+        macros, objects, extra_postargs, pp_opts, build = \
+                self._setup_compile(output_dir, macros, include_dirs,
+                                    sources, depends, extra_postargs)
+        cc_args = self._get_cc_args(pp_opts, debug, extra_preargs)
+
+        def compile_one(obj):
+            try:
+                src, ext = build[obj]
+            except KeyError:
+                return
+            self._compile(obj, src, ext, cc_args, extra_postargs, pp_opts)
+
+        pool = ThreadPool(njobs)
+        try:
+            pool.map(compile_one, objects)
+        finally:
+            pool.close()
+        return objects
+
+    distutils.ccompiler.CCompiler.compile = compile
+
+def run_setup_with_compile_pool():
+    """
+    Run ``setup.py`` with :func:`parallel_compile` in effect; the command
+    line is ``python -c ... njobs setup.py [args]``.
+    """
+    import runpy
+    njobs = int(sys.argv[1])
+    sys.argv = sys.argv[2:]
+    parallel_compile(njobs)
+    runpy.run_path(sys.argv[0], run_name='__main__')
@@ -0,0 +1,216 @@
+"""
+    Comparing the benchmark results of a run to a baseline, for
+    ``--bench-compare``.
+"""
+import os
+import json
+import math
+from glob import glob
+
+from .history import BenchmarkHistory, flatten_results
+
+# the least number of samples on each side for the rank test; with fewer
+# samples, only the threshold decides
+MIN_SAMPLES = 4
+
+def mann_whitney(x, y):
+    """
+    The two-sided p-value of the Mann-Whitney U test of the samples ``x``
+    and ``y``, with the normal approximation corrected for ties.
+    """
+    n1, n2 = len(x), len(y)
+    n = n1 + n2
+    values = sorted([(v, 0) for v in x] + [(v, 1) for v in y])
+
+    # the sum of the ranks of x, with ties given their average rank
+    r1 = 0.
+    ties = 0.
+    i = 0
+    while i < n:
+        j = i
+        while j < n and values[j][0] == values[i][0]:
+            j += 1
+        rank = (i + j + 1) / 2.
+        r1 += rank * sum(1 for v in values[i:j] if v[1] == 0)
+        ties += (j - i) ** 3 - (j - i)
+        i = j
+
+    u = r1 - n1 * (n1 + 1) / 2.
+    mu = n1 * n2 / 2.
+    sigma2 = n1 * n2 / 12. * ((n + 1) - ties / (n * (n - 1.)))
+    if sigma2 <= 0:
+        return 1.
+    z = max(abs(u - mu) - 0.5, 0) / math.sqrt(sigma2)
+    return math.erfc(z / math.sqrt(2))
+
+def critical_path(values, samples):
+    """
+    The time of the critical path of a tag over the ranks, the maximum
+    over the ranks, and its samples: the maximum over the ranks of each
+    sample if all ranks have the same number of samples, as the ranks
+    take them in step, else the samples of the slowest rank.
+    """
+    # the ranks that ran the tag
+    ranks = [i for i, v in enumerate(values) if v is not None]
+    if len(ranks) == 0:
+        return None, None
+    values = [values[i] for i in ranks]
+    value = max(values)
+    if samples is None or any(samples[i] is None for i in ranks):
+        return value, None
+    samples = [samples[i] for i in ranks]
+    if len(set(len(s) for s in samples)) == 1:
+        return value, [max(s) for s in zip(*samples)]
+    return value, samples[values.index(value)]
+
+def from_results(results):
+    """
+    The results of a run, keyed by the name of the output file, as a dict
+    from (test, tag) to the values and the samples by rank.
+    """
+    return dict(((test, tag), (values, samples))
+                for test, tag, values, samples, stats, memory, attrs in flatten_results(results))
+
+def load_baseline(spec, history=None, commsize=None):
+    """
+    Load the results of a baseline run.
+
+    Parameters
+    ----------
+    spec : str
+        a directory of benchmark results, a single result file, or a git
+        hash (or a prefix of it) of the runs in the history; each test
+        is taken from the latest run of the hash that has it
+    history : str, optional
+        the history database, for a git hash
+    commsize : int, optional
+        the comm size of the run in the history, for a git hash
+
+    Returns
+    -------
+    baseline : dict
+        as :func:`from_results`; empty if there is no such run
+    description : str
+        where the baseline comes from
+    """
+    if os.path.isdir(spec) or os.path.isfile(spec):
+        if os.path.isdir(spec):
+            filenames = sorted(glob(os.path.join(spec, '*.json')))
+        else:
+            filenames = [spec]
+        results = {}
+        for filename in filenames:
+            try:
+                with open(filename, 'r') as ff:
+                    result = json.load(ff)
+                result['tests']
+            except (IOError, ValueError, KeyError, TypeError):
+                continue
+            results[os.path.basename(filename)[:-len('.json')]] = result
+        return from_results(results), os.path.abspath(spec)
+
+    if history is None or not os.path.exists(history):
+        return {}, "git hash %s (no history)" % spec
+    history = BenchmarkHistory(history)
+    try:
+        runs = history.find_runs(spec, commsize=commsize)
+        if len(runs) == 0:
+            return {}, "git hash %s (not in the history)" % spec
+
+        # a git hash may be benchmarked by several runs, each with some of
+        # the tests; every test comes from the latest run that has it
+        baseline = {}
+        source = {}
+        for run in runs:
+            results = history.results(run)
+            tests = set(test for test, tag in results)
+            for key in list(baseline):
+                if key[0] in tests:
+                    del baseline[key]
+            baseline.update(results)
+            source.update((test, run) for test in tests)
+        used = sorted(set(source.values()))
+        return baseline, "git hash %s (%s %s of the history)" % (
+                spec, "run" if len(used) == 1 else "runs", ', '.join('%d' % r for r in used))
+    finally:
+        history.close()
+
+def compare(baseline, current, threshold=0.05, alpha=0.05):
+    """
+    Compare the critical path time of each tag in the current run to the
+    baseline.
+
+    A tag regresses (improves) if its time grew (shrank) by more than
+    ``threshold``, relative to the baseline, and, if both runs have at
+    least :data:`MIN_SAMPLES` samples, the Mann-Whitney test of the samples
+    rejects equal distributions at the level ``alpha``.
+
+    Parameters
+    ----------
+    baseline, current : dict
+        as :func:`from_results`
+
+    Returns
+    -------
+    changes : list of dict
+        with 'test', 'tag', 'baseline', 'current', 'ratio', 'p' (None if
+        not tested) and 'status', one of 'regression', 'improvement',
+        'unchanged' or 'new'; the regressions first, the worst first, then
+        the improvements, the best first
+    """
+    changes = []
+    for key in sorted(current):
+        test, tag = key
+        value, samples = critical_path(*current[key])
+        if value is None:
+            continue
+        change = {'test' : test, 'tag' : tag, 'current' : value,
+                  'baseline' : None, 'ratio' : None, 'p' : None, 'status' : 'new'}
+        changes.append(change)
+        if key not in baseline:
+            continue
+        base, base_samples = critical_path(*baseline[key])
+        if base is None or base <= 0:
+            continue
+        change['baseline'] = base
+        change['ratio'] = value / base
+
+        significant = True
+        if (samples is not None and base_samples is not None
+            and min(len(samples), len(base_samples)) >= MIN_SAMPLES):
+            change['p'] = mann_whitney(samples, base_samples)
+            significant = change['p'] < alpha
+
+        if significant and change['ratio'] > 1 + threshold:
+            change['status'] = 'regression'
+        elif significant and change['ratio'] < 1 - threshold:
+            change['status'] = 'improvement'
+        else:
+            change['status'] = 'unchanged'
+
+    order = {'regression' : 0, 'improvement' : 1, 'unchanged' : 2, 'new' : 3}
+    def sortkey(change):
+        ratio = change['ratio'] or 1.
+        return (order[change['status']], -ratio if change['status'] == 'regression' else ratio)
+    return sorted(changes, key=sortkey)
+
+def format_changes(changes, description):
+    """
+    Return the lines of a table of the regressions and the improvements.
+    """
+    lines = ["compared to %s; times are the maximum over the ranks" % description]
+    shown = [c for c in changes if c['status'] in ('regression', 'improvement')]
+    if len(shown) > 0:
+        width = max(len(c['test']) + len(c['tag']) for c in shown) + 3
+        lines.append("%-12s %-*s %12s %12s %8s %8s" % (
+                     'status', width, 'test [tag]', 'baseline', 'current', 'ratio', 'p'))
+        for c in shown:
+            lines.append("%-12s %-*s %12.6g %12.6g %8.3f %8s" % (
+                         c['status'], width, '%s [%s]' % (c['test'], c['tag']),
+                         c['baseline'], c['current'], c['ratio'],
+                         '-' if c['p'] is None else '%.3g' % c['p']))
+    counts = dict((s, len([c for c in changes if c['status'] == s]))
+                  for s in ('regression', 'improvement', 'unchanged', 'new'))
+    lines.append("%(regression)d regression(s), %(improvement)d improvement(s), "
+                 "%(unchanged)d unchanged, %(new)d new" % counts)
+    return lines
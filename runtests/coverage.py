@@ -15,7 +15,7 @@ class Coverage(object):
     """
 
     def __init__(self, source, with_coverage=False, html_cov=False,
-                    config_file=None, root='', comm=None):
+                    config_file=None, root='', comm=None, impact=None):
         """
         Parameters
         ----------
@@ -31,10 +31,17 @@ class Coverage(object):
             this specifies the root of the package
         comm : MPI communicator, optional
             the MPI communicator
+        impact : ImpactMap, optional
+            a map to update with the source files executed by each test;
+            the tester switches the coverage context for each test
         """
         self.comm = comm
         self.source = source
         self.root = root
+        self.impact = impact
+
+        if impact is not None and not hasattr(coverage.Coverage, 'switch_context'):
+            raise RuntimeError("recording the impact of tests requires coverage >= 5.0")
 
         # options
         self.with_coverage = with_coverage
@@ -68,6 +75,41 @@ class Coverage(object):
             )
             self.cov.start()
 
+    def switch_context(self, name):
+        """
+        Attribute the lines executed from now on to the context ``name``,
+        e.g. the node id of a test.
+        """
+        if self.with_coverage and self.impact is not None:
+            self.cov.switch_context(name)
+
+    def begin_worker(self, index):
+        """
+        Switch to a separate data file in a forked worker process; the
+        data of the workers is combined when the context exits in the
+        main process.
+        """
+        if not self.with_coverage:
+            return
+
+        self.cov.stop()
+        self.cov = coverage.coverage(source=[self.source],
+            config_file=self.config_file,
+            data_file=os.path.join(self.tmpdir, self.tmp_datafile),
+            data_suffix='worker%d' % index
+        )
+        self.cov.start()
+
+    def end_worker(self):
+        """
+        Save the data recorded in a forked worker process.
+        """
+        if not self.with_coverage:
+            return
+
+        self.cov.stop()
+        self.cov.save()
+
     def __exit__(self, type, value, tb):
         if not self.with_coverage:
             return
@@ -77,7 +119,17 @@ class Coverage(object):
         # with only one rank, just write out the coverage
         if self.comm is None or self.comm.size == 1:
             self.cov.get_data().write()
-            self.report(self.cov)
+
+            # combine with the data of the worker processes, if any
+            workers = glob.glob(os.path.join(self.tmpdir, self.tmp_datafile + '.worker*'))
+            if len(workers) > 0:
+                combined_cov = coverage.coverage(config_file=self.config_file)
+                combined_cov.combine(data_paths=glob.glob(os.path.join(
+                                        self.tmpdir, '*')))
+                combined_cov.get_data().write()
+                self.report(combined_cov)
+            else:
+                self.report(self.cov)
 
         # parallel -- combine coverage from all ranks
         else:
@@ -118,6 +170,10 @@ class Coverage(object):
         # and report (to screen)
         cov.report()
 
+        if self.impact is not None:
+            self.impact.update(cov.get_data())
+            self.impact.save()
+
         # write html
         if self.html_cov:
             html_dir = os.path.join(self.root, 'build', 'coverage')
@@ -0,0 +1,88 @@
+import os
+import json
+
+class DurationStore(object):
+    """
+    The wall time and outcome of each test in previous runs, keyed by the
+    pytest node id; the node id of a test parametrized by :func:`MPITest`
+    includes the commsize, so each commsize variant has its own entry.
+
+    The store is a compact JSON file, usually ``build/durations.json``,
+    mapping node ids to ``[duration, failed]``. Durations are smoothed with
+    an exponential moving average over the runs.
+
+    Parameters
+    ----------
+    filename : str
+        the file to load from and save to
+    smoothing : float, optional
+        the weight of the latest run in the moving average
+    """
+    VERSION = 1
+
+    def __init__(self, filename, smoothing=0.5):
+        self.filename = filename
+        self.smoothing = smoothing
+        try:
+            with open(filename, 'r') as ff:
+                d = json.load(ff)
+            if d['version'] != self.VERSION:
+                raise ValueError
+            self.tests = d['tests']
+        except (IOError, ValueError, KeyError, TypeError):
+            self.tests = {}
+
+    def get(self, nodeid, default=None):
+        """
+        Return the expected duration of a test.
+        """
+        entry = self.tests.get(nodeid)
+        return default if entry is None else entry[0]
+
+    def failed(self, nodeid):
+        """
+        Whether a test failed in the last run it was part of.
+        """
+        entry = self.tests.get(nodeid)
+        return entry is not None and bool(entry[1])
+
+    def record(self, nodeid, duration, failed=False):
+        """
+        Record the duration and outcome of a test in this run.
+        """
+        previous = self.get(nodeid)
+        if previous is not None:
+            duration = self.smoothing * duration + (1 - self.smoothing) * previous
+        self.tests[nodeid] = [round(duration, 6), int(failed)]
+
+    def order(self, nodeids, order):
+        """
+        Return the node ids reordered.
+
+        Parameters
+        ----------
+        nodeids : list of str
+            the node ids, in the default order
+        order : {'default', 'duration', 'failed-first'}
+            'duration' runs the longest tests first, with unknown tests
+            first of all; 'failed-first' runs the tests that failed in
+            their last run first. Ties keep the default order.
+        """
+        if order == 'duration':
+            inf = float('inf')
+            return sorted(nodeids, key=lambda x: -self.get(x, inf))
+        elif order == 'failed-first':
+            return sorted(nodeids, key=lambda x: not self.failed(x))
+        return list(nodeids)
+
+    def save(self):
+        """
+        Save the store to :attr:`filename`.
+        """
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(self.filename + '.tmp', 'w') as ff:
+            json.dump({'version' : self.VERSION, 'tests' : self.tests}, ff,
+                      separators=(',', ':'))
+        os.rename(self.filename + '.tmp', self.filename)
@@ -0,0 +1,302 @@
+"""
+    The history of the benchmark results over many runs, for tracking the
+    performance of a code across git revisions, machines and comm sizes.
+
+    The history is a SQLite database, usually ``build/benchmarks/history.db``;
+    every run of ``--bench`` appends to it. It can be inspected with
+
+    .. code::
+
+        python -m runtests.history list
+        python -m runtests.history export test_module.test_func "tag A"
+
+"""
+import os
+import json
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    datetime TEXT,
+    git_hash TEXT,
+    source_version TEXT,
+    host TEXT,
+    system TEXT,
+    python_version TEXT,
+    commsize INTEGER
+);
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER REFERENCES runs(id),
+    test TEXT,
+    tag TEXT,
+    rank INTEGER,
+    value REAL,
+    n INTEGER,
+    min REAL,
+    median REAL,
+    mean REAL,
+    std REAL,
+    samples TEXT,
+    attrs TEXT,
+    rss INTEGER,
+    peak INTEGER
+);
+CREATE INDEX IF NOT EXISTS results_test ON results (test, tag);
+"""
+
+# the columns of a run, in the order of the table
+RUN_COLUMNS = ['id', 'datetime', 'git_hash', 'source_version', 'host',
+               'system', 'python_version', 'commsize']
+
+# the statistics of a tag that can be exported
+STATS = ['value', 'n', 'min', 'median', 'mean', 'std', 'rss', 'peak']
+
+class BenchmarkHistory(object):
+    """
+    An append-only store of benchmark results.
+
+    Each run is recorded with the git hash, the machine info of
+    :func:`runtests.benchmark.get_machine_info` and the comm size; each
+    result is the value of a tag in a test variant on a rank, with the
+    statistics and the wall time samples of the tag if there are any.
+
+    Tests are named by their module and their pytest name, including the
+    parametrization, e.g. ``test_benchmark.test_benchmark2[1]``.
+
+    Parameters
+    ----------
+    filename : str
+        the database file; created if it does not exist
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def append(self, header, results):
+        """
+        Append the results of a run, in a single transaction.
+
+        Parameters
+        ----------
+        header : dict
+            the header of the run, see :class:`runtests.benchmark.BenchmarkLogger`
+        results : dict
+            the results of each output file of the run, keyed by the name
+            of the file, as written by :meth:`runtests.benchmark.BenchmarkLogger.report`
+
+        Returns
+        -------
+        run : int
+            the id of the run
+        """
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO runs (%s) VALUES (?, ?, ?, ?, ?, ?, ?)" % ', '.join(RUN_COLUMNS[1:]),
+                [header.get(c) for c in RUN_COLUMNS[1:]])
+            run = cursor.lastrowid
+
+            rows = []
+            for test, tag, values, samples, stats, memory, attrs in flatten_results(results):
+                attrs = json.dumps(attrs)
+                for rank, value in enumerate(values):
+                    if value is None:
+                        continue
+                    wall = stats[rank]['wall'] if stats and stats[rank] else {}
+                    wall_samples = json.dumps(samples[rank]) if samples and samples[rank] else None
+                    used = memory[rank] if memory and memory[rank] else {}
+                    rows.append((run, test, tag, rank, value,
+                                 wall.get('n'), wall.get('min'), wall.get('median'),
+                                 wall.get('mean'), wall.get('std'),
+                                 wall_samples, attrs, used.get('rss'), used.get('peak')))
+            self.db.executemany("INSERT INTO results VALUES (%s)" % ', '.join(['?'] * 14), rows)
+        return run
+
+    def runs(self, git_hash=None, host=None, commsize=None):
+        """
+        Return the runs, the oldest first, as a list of dict with the
+        columns of :data:`RUN_COLUMNS`; optionally only those of a git hash,
+        a host or a comm size.
+        """
+        where, args = self._where(git_hash=git_hash, host=host, commsize=commsize)
+        cursor = self.db.execute("SELECT %s FROM runs%s ORDER BY id" % (
+                                 ', '.join(RUN_COLUMNS), where), args)
+        return [dict(zip(RUN_COLUMNS, row)) for row in cursor]
+
+    def tests(self):
+        """
+        Return the sorted list of (test, tag) recorded in any run.
+        """
+        cursor = self.db.execute("SELECT DISTINCT test, tag FROM results ORDER BY test, tag")
+        return [tuple(row) for row in cursor]
+
+    def series(self, test, tag, stat='value', reduce='max', git_hash=None, host=None, commsize=None):
+        """
+        Return the time series of a statistic of a tag, one entry per run
+        containing the tag, the oldest first.
+
+        Parameters
+        ----------
+        test : str
+            the name of the test, e.g. ``test_benchmark.test_benchmark2[1]``
+        tag : str
+            the tag
+        stat : str
+            one of :data:`STATS`; 'value' is the value reported for the tag,
+            the total or, for :meth:`BenchmarkTimer.run`, the median time;
+            'rss' and 'peak' are the memory used, with ``--bench-memory``
+        reduce : {'max', 'min', 'avg'}
+            how the ranks of a run are combined; the slowest rank by default
+        git_hash, host, commsize : optional
+            only the runs of a git hash, a host or a comm size
+
+        Returns
+        -------
+        series : list of dict
+            the columns of the run and ``value``
+        """
+        if stat not in STATS:
+            raise ValueError("unknown statistic %s, must be one of %s" % (stat, ', '.join(STATS)))
+        if reduce not in ('max', 'min', 'avg'):
+            raise ValueError("unknown reduction %s" % reduce)
+        where, args = self._where(git_hash=git_hash, host=host, commsize=commsize)
+        where = (where + ' AND' if where else ' WHERE') + ' results.test = ? AND results.tag = ?'
+        columns = ', '.join('runs.' + c for c in RUN_COLUMNS)
+        cursor = self.db.execute(
+            "SELECT %s, %s(results.%s) FROM runs JOIN results ON results.run = runs.id"
+            "%s GROUP BY runs.id ORDER BY runs.id" % (columns, reduce, stat, where),
+            args + [test, tag])
+        return [dict(zip(RUN_COLUMNS + ['value'], row)) for row in cursor]
+
+    def samples(self, run, test, tag):
+        """
+        Return the wall time samples of a tag in a run, as a list by rank;
+        None for the ranks without samples.
+        """
+        cursor = self.db.execute(
+            "SELECT samples FROM results WHERE run = ? AND test = ? AND tag = ? ORDER BY rank",
+            [run, test, tag])
+        return [None if row[0] is None else json.loads(row[0]) for row in cursor]
+
+    def find_runs(self, git_hash, commsize=None):
+        """
+        Return the ids of the runs of a git hash, or of any hash it is a
+        prefix of, the oldest first.
+        """
+        where, args = self._where(commsize=commsize)
+        where = (where + ' AND' if where else ' WHERE') + ' runs.git_hash LIKE ?'
+        cursor = self.db.execute("SELECT id FROM runs%s ORDER BY id" % where,
+                                 args + [git_hash + '%'])
+        return [row[0] for row in cursor]
+
+    def results(self, run):
+        """
+        Return the results of a run, as a dict from (test, tag) to the
+        list of the values and the list of the samples by rank; the samples
+        of a rank are None if they were not recorded, and the values and
+        the samples of the ranks that did not run the tag are None.
+        """
+        cursor = self.db.execute(
+            "SELECT test, tag, rank, value, samples FROM results WHERE run = ? "
+            "ORDER BY test, tag, rank", [run])
+        results = {}
+        for test, tag, rank, value, samples in cursor:
+            values, all_samples = results.setdefault((test, tag), ([], []))
+            while len(values) < rank:
+                values.append(None)
+                all_samples.append(None)
+            values.append(value)
+            all_samples.append(None if samples is None else json.loads(samples))
+        return dict((key, (values, samples if any(s is not None for s in samples) else None))
+                    for key, (values, samples) in results.items())
+
+    @staticmethod
+    def _where(**kws):
+        columns = [(k, v) for k, v in sorted(kws.items()) if v is not None]
+        if not columns:
+            return '', []
+        return (' WHERE ' + ' AND '.join('runs.%s = ?' % k for k, v in columns),
+                [v for k, v in columns])
+
+def flatten_results(results):
+    """
+    Iterate over the results of the output files of a run, as written by
+    :meth:`runtests.benchmark.BenchmarkLogger.report` and keyed by the name
+    of the file; yields the test, the tag, and by rank the values, the wall
+    time samples, the statistics and the memory used (each None if not
+    recorded), and the attrs of the test.
+    """
+    for filename, result in sorted(results.items()):
+        module = filename.rsplit('.', 1)[0]
+        for name in result['tests']:
+            variant = result[name]
+            test = module + '.' + variant['testname']
+            # NOTE: files written before the tags of each variant were
+            # recorded only have the tags of the first variant
+            for tag in variant.get('tags', result.get('tags', [])):
+                samples = variant.get('samples', {}).get(tag)
+                if samples is not None:
+                    samples = [None if s is None else s['wall'] for s in samples]
+                yield (test, tag, variant[tag], samples, variant.get('stats', {}).get(tag),
+                       variant.get('memory', {}).get(tag), variant['attrs'])
+
+def main(args=None):
+    from argparse import ArgumentParser
+    import csv
+    import sys
+
+    parser = ArgumentParser(prog='python -m runtests.history',
+                            description="query the history of the benchmark results")
+    parser.add_argument('--db', default=os.path.join('build', 'benchmarks', 'history.db'),
+                        help="the history database; default is build/benchmarks/history.db")
+    subparsers = parser.add_subparsers(dest='command')
+
+    p = subparsers.add_parser('list', help="list the runs, or the tests with --tests")
+    p.add_argument('--tests', action='store_true', default=False,
+                   help="list the tests and tags instead of the runs")
+    for name in ('git-hash', 'host'):
+        p.add_argument('--' + name)
+    p.add_argument('--commsize', type=int)
+
+    p = subparsers.add_parser('export', help="export the series of a test and tag as CSV")
+    p.add_argument('test')
+    p.add_argument('tag')
+    p.add_argument('--stat', default='value', choices=STATS)
+    p.add_argument('--reduce', default='max', choices=['max', 'min', 'avg'],
+                   help="how the ranks of a run are combined")
+    for name in ('git-hash', 'host'):
+        p.add_argument('--' + name)
+    p.add_argument('--commsize', type=int)
+
+    args = parser.parse_args(args)
+    if args.command is None:
+        parser.error("a command is required")
+    if not os.path.exists(args.db):
+        parser.error("no history at %s" % args.db)
+
+    history = BenchmarkHistory(args.db)
+    selection = dict(git_hash=args.git_hash, host=args.host, commsize=args.commsize)
+    if args.command == 'list':
+        if args.tests:
+            for test, tag in history.tests():
+                print("%s\t%s" % (test, tag))
+        else:
+            for run in history.runs(**selection):
+                print("%(id)5d  %(datetime)s  %(git_hash)s  %(host)s  commsize=%(commsize)s" % run)
+    else:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(RUN_COLUMNS + [args.stat])
+        for row in history.series(args.test, args.tag, stat=args.stat,
+                                  reduce=args.reduce, **selection):
+            writer.writerow([row[c] for c in RUN_COLUMNS + ['value']])
+    history.close()
+
+if __name__ == "__main__":
+    main()
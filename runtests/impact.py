@@ -0,0 +1,125 @@
+"""
+    Test-impact analysis: record which source files each test executes,
+    and select the tests affected by the files changed since.
+"""
+import os
+import json
+import subprocess
+
+# changes to these files may affect any test
+BUILD_FILES = set(['setup.py', 'setup.cfg', 'pyproject.toml', 'MANIFEST.in', 'conftest.py'])
+BUILD_EXTENSIONS = set(['.c', '.h', '.cc', '.cpp', '.cxx', '.hpp', '.pyx', '.pxd',
+                        '.pxi', '.f', '.f90', '.F90', '.cu'])
+
+def get_changed_files(root, since):
+    """
+    Return the files (relative to ``root``) that differ between the working
+    tree and the git revision ``since``, including untracked files.
+    """
+    null = open(os.devnull, 'w')
+    diff = subprocess.check_output(['git', 'diff', '--name-only', since],
+                                   cwd=root, stderr=null)
+    untracked = subprocess.check_output(['git', 'ls-files', '--others', '--exclude-standard'],
+                                        cwd=root, stderr=null)
+    paths = diff.decode().splitlines() + untracked.decode().splitlines()
+    return sorted(set(p for p in paths if p))
+
+class ImpactMap(object):
+    """
+    The source files executed by each test, keyed by the pytest node id.
+
+    Source files are stored relative to the directory containing the
+    package, e.g. ``mypackage/core.py``, regardless of whether they were
+    measured in the installed or in the source copy.
+
+    Parameters
+    ----------
+    filename : str
+        the JSON file to load from and save to
+    package : str
+        the name of the package that is measured
+    git_hash : str, optional
+        the git revision of the source being tested, saved with updates
+    """
+    def __init__(self, filename, package, git_hash=None):
+        self.filename = filename
+        self.package = package
+        self.source_git_hash = git_hash
+        try:
+            with open(filename, 'r') as ff:
+                d = json.load(ff)
+            self.git_hash = d['git_hash']
+            self.tests = d['tests']
+        except (IOError, ValueError, KeyError):
+            self.git_hash = None
+            self.tests = {}
+
+    def _relpath(self, filename):
+        parts = os.path.abspath(filename).split(os.sep)
+        if self.package not in parts:
+            return None
+        i = len(parts) - 1 - parts[::-1].index(self.package)
+        return '/'.join(parts[i:])
+
+    def update(self, data):
+        """
+        Update the map from coverage data recorded with one context per
+        test; tests in ``data`` replace their previous entries.
+
+        Parameters
+        ----------
+        data : coverage.CoverageData
+            the coverage data
+        """
+        tests = {}
+        for filename in data.measured_files():
+            path = self._relpath(filename)
+            if path is None:
+                continue
+            for contexts in data.contexts_by_lineno(filename).values():
+                for context in contexts:
+                    if context:
+                        tests.setdefault(context, set()).add(path)
+
+        for nodeid in tests:
+            self.tests[nodeid] = sorted(tests[nodeid])
+        self.git_hash = self.source_git_hash
+
+    def save(self):
+        """
+        Save the map to :attr:`filename`.
+        """
+        with open(self.filename + '.tmp', 'w') as ff:
+            json.dump({'git_hash' : self.git_hash, 'tests' : self.tests}, ff)
+        os.rename(self.filename + '.tmp', self.filename)
+
+    def affected(self, nodeids, changed):
+        """
+        Return the subset of ``nodeids`` that may be affected by changes
+        to the files ``changed``.
+
+        Tests that are not in the map are always selected, and all tests are
+        selected if a build input (setup.py, a compiled source, ...) changed.
+        The file defining a test is always a dependency of the test.
+        """
+        changed_py = []
+        for path in changed:
+            name = os.path.basename(path)
+            if name in BUILD_FILES or os.path.splitext(name)[1] in BUILD_EXTENSIONS:
+                return list(nodeids)
+            if name.endswith('.py'):
+                changed_py.append(path)
+
+        def touches(files):
+            for f in files:
+                for path in changed_py:
+                    if path == f or path.endswith('/' + f):
+                        return True
+            return False
+
+        def depends(nodeid):
+            testfile = self._relpath(nodeid.split('::')[0])
+            return self.tests[nodeid] + ([testfile] if testfile else [])
+
+        return [nodeid for nodeid in nodeids
+                if nodeid not in self.tests or touches(depends(nodeid))]
@@ -0,0 +1,139 @@
+"""
+    Memory instrumentation of the benchmark blocks, for ``--bench-memory``.
+"""
+import sys
+
+try:
+    import tracemalloc
+except ImportError: # python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError: # windows
+    resource = None
+
+def read_rss():
+    """
+    Return the resident set size of the process and its high-water mark,
+    in bytes; the current size is None if it is unknown.
+    """
+    try:
+        with open('/proc/self/status', 'r') as ff:
+            status = dict(line.split(':', 1) for line in ff if ':' in line)
+        return (int(status['VmRSS'].split()[0]) * 1024,
+                int(status['VmHWM'].split()[0]) * 1024)
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+    if resource is None:
+        return None, 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return None, maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+def reset_rss_peak():
+    """
+    Reset the high-water mark of the resident set size to the current
+    size; returns False if the OS does not support it (linux >= 4.0 does).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as ff:
+            ff.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+class MemoryTracker(object):
+    """
+    Measure the memory used by nested blocks of code: the increase of
+    the peak resident set size of the process, from the OS, and the peak
+    of the Python allocations with their top allocation sites, from
+    :mod:`tracemalloc`. Tracing is started on creation if needed.
+
+    The peaks are reset at the start of each block; the peaks of the
+    enclosing blocks are kept by folding them in before the reset.
+    Without a resettable high-water mark, the RSS increase of a block
+    also includes the earlier peaks of the process, if they were higher.
+
+    The top allocation sites are only recorded for the outermost blocks:
+    a snapshot of the allocations takes time in the number of live
+    allocations, and would be taken inside the enclosing blocks.
+
+    Parameters
+    ----------
+    top : int, optional
+        the number of top allocation sites to record
+    exclude : list of str, optional
+        the files whose allocations are not allocation sites, e.g. of the
+        instrumentation itself
+    """
+    def __init__(self, top=5, exclude=[]):
+        self.top = top
+        self.exclude = [tracemalloc.__file__, __file__] + list(exclude) if tracemalloc else []
+        self.frames = []
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _peaks(self):
+        rss, hwm = read_rss()
+        traced = tracemalloc.get_traced_memory()[1] if tracemalloc is not None else 0
+        return hwm, traced
+
+    def _fold(self, hwm, traced):
+        for frame in self.frames:
+            frame['hwm'] = max(frame['hwm'], hwm)
+            frame['traced_peak'] = max(frame['traced_peak'], traced)
+
+    def start(self):
+        """
+        Start measuring a block; returns the frame to pass to :meth:`stop`.
+        """
+        self._fold(*self._peaks())
+        reset_rss_peak()
+        frame = {'hwm' : 0, 'traced_peak' : 0, 'snapshot' : None}
+        frame['rss'], hwm = read_rss()
+        if frame['rss'] is None:
+            frame['rss'] = hwm
+        if tracemalloc is not None:
+            if hasattr(tracemalloc, 'reset_peak'): # python >= 3.9
+                tracemalloc.reset_peak()
+            frame['traced'] = tracemalloc.get_traced_memory()[0]
+            if self.top > 0 and len(self.frames) == 0:
+                frame['snapshot'] = tracemalloc.take_snapshot()
+        else:
+            frame['traced'] = 0
+        self.frames.append(frame)
+        return frame
+
+    def stop(self, frame):
+        """
+        Stop measuring a block.
+
+        Returns
+        -------
+        dict
+            'rss', the increase of the peak resident set size, and 'peak',
+            the peak of the Python allocations, in bytes, relative to the
+            start of the block; 'top', the [site, bytes] of the largest
+            net allocations in the block, empty for a nested block
+        """
+        self.frames.remove(frame)
+        hwm, traced = self._peaks()
+        hwm = max(frame['hwm'], hwm)
+        traced = max(frame['traced_peak'], traced)
+        self._fold(hwm, traced)
+
+        top = []
+        if frame['snapshot'] is not None:
+            filters = [tracemalloc.Filter(False, filename) for filename in self.exclude]
+            snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+            start = frame['snapshot'].filter_traces(filters)
+            stats = [stat for stat in snapshot.compare_to(start, 'lineno') if stat.size_diff > 0]
+            stats = sorted(stats, key=lambda stat: -stat.size_diff)
+            for stat in stats[:self.top]:
+                where = stat.traceback[0]
+                top.append(['%s:%d' % (where.filename, where.lineno), stat.size_diff])
+
+        return {'rss' : max(hwm - frame['rss'], 0),
+                'peak' : max(traced - frame['traced'], 0),
+                'top' : top}
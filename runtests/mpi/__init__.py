@@ -1 +1 @@
-from .tester import Tester, MPITest, MPIWorld, nompi, MPITestFixture
+from .tester import Tester, MPITest, MPIWorld, nompi, MPITestFixture, MPIScalingTest
@@ -0,0 +1,174 @@
+"""
+    Bounded capture of the output of a rank in a mpisub.
+"""
+import os
+import gzip
+from collections import OrderedDict, deque
+
+def parse_size(value):
+    """ Parse a size in bytes, with an optional k, M or G suffix """
+    units = {'k' : 1024, 'M' : 1024 ** 2, 'G' : 1024 ** 3}
+    value = str(value).strip()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+class Window(object):
+    """
+    The head and the tail of a stream of text.
+
+    Parameters
+    ----------
+    size : int
+        the number of characters kept in each of the head and the tail
+    """
+    def __init__(self, size):
+        self.size = size
+        self.head = ''
+        # the chunks of the tail, with at most size characters beyond the
+        # first chunk; trimmed when read
+        self.chunks = deque()
+        self.taillen = 0
+        self.length = 0
+
+    def write(self, s):
+        self.length += len(s)
+        if len(self.head) < self.size:
+            n = self.size - len(self.head)
+            self.head += s[:n]
+            s = s[n:]
+        if s:
+            s = s[-self.size:]
+            self.chunks.append(s)
+            self.taillen += len(s)
+            while self.taillen - len(self.chunks[0]) >= self.size:
+                self.taillen -= len(self.chunks.popleft())
+
+    @property
+    def tail(self):
+        return ''.join(self.chunks)[-self.size:]
+
+    def getvalue(self, note=''):
+        tail = self.tail
+        omitted = self.length - len(self.head) - len(tail)
+        if omitted == 0:
+            return self.head + tail
+        return (self.head + "\n... %d characters omitted%s ...\n" % (omitted, note)
+                + tail)
+
+class SpillCapture(object):
+    """
+    A file-like object that captures text in memory up to a limit, then
+    spills all of it to a gzipped file and only keeps the head and the tail
+    in memory for display.
+
+    The output is also divided into named segments, one per test, with
+    :meth:`begin`; the last few segments can be retrieved with
+    :meth:`segment`, e.g. to show only the output of a failing test.
+
+    Parameters
+    ----------
+    filename : str
+        the gzipped file to spill to
+    limit : int
+        the number of characters to keep in memory before spilling
+    window : int
+        the number of characters of the head and of the tail to keep
+        for display, for the whole output and for each segment
+    keep : int
+        the number of segments to keep
+    """
+    encoding = 'utf-8'
+
+    def __init__(self, filename, limit, window=65536, keep=8):
+        self.filename = filename
+        self.limit = limit
+        self.window = window
+        self.keep = keep
+
+        self.chunks = []
+        self.length = 0
+        self.file = None
+        self.whole = Window(window)
+
+        # name -> (start, Window), the latest last
+        self.segments = OrderedDict()
+        self.current = None
+
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    def write(self, s):
+        self.whole.write(s)
+        if self.current is not None:
+            self.current[1].write(s)
+
+        if self.file is None:
+            self.chunks.append(s)
+            self.length += len(s)
+            if self.length > self.limit:
+                self._spill()
+        else:
+            self._write_file(s)
+
+    def _write_file(self, s):
+        if not isinstance(s, bytes):
+            s = s.encode('utf-8', 'replace')
+        self.file.write(s)
+
+    def _spill(self):
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.file = gzip.open(self.filename, 'wb')
+        for s in self.chunks:
+            self._write_file(s)
+        self.chunks = []
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def isatty(self):
+        return False
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def begin(self, name):
+        """
+        Start a new segment; later writes belong to this segment.
+        """
+        self.segments.pop(name, None)
+        self.current = (self.whole.length, Window(self.window))
+        self.segments[name] = self.current
+        while len(self.segments) > self.keep:
+            self.segments.popitem(last=False)
+
+    def _note(self):
+        return "; the full output is in %s" % self.filename
+
+    def getvalue(self):
+        """
+        The whole output; only the head and the tail after spilling.
+        """
+        if self.file is None:
+            return ''.join(self.chunks)
+        return self.whole.getvalue(self._note())
+
+    def segment(self, name):
+        """
+        The output of the latest segment named ``name``; None if it is no
+        longer kept.
+        """
+        if name not in self.segments:
+            return None
+        start, window = self.segments[name]
+        if self.file is None:
+            return ''.join(self.chunks)[start:start + window.length]
+        return window.getvalue(self._note())
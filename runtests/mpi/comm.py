@@ -0,0 +1,114 @@
+"""
+    A pool of the communicators used by the tests.
+"""
+
+class CommPool(object):
+    """
+    Communicators split from COMM_WORLD, created on first use and reused by
+    all later tests; keyed by the size and the layout of the split.
+
+    Layouts:
+
+    - 'head' : the first ``size`` ranks (color 0); the other ranks get
+      a communicator of the rest (color 1). The world itself is used if the
+      size is the size of the world, and COMM_SELF for size 1.
+    - 'slots' : disjoint slots of ``size`` ranks (color ``rank // size``);
+      the ranks beyond the last full slot get None (color None).
+
+    Getting a communicator that is not yet in the pool is collective over
+    COMM_WORLD, hence all ranks must request the same communicators in the
+    same order.
+    """
+    def __init__(self):
+        self.comms = {}
+        self.dups = []
+        self.requests = 0
+        self.splits = 0
+        self.reused = 0
+        self.split_keys = set()
+
+        # the communicators of the 'head' layout by size; kept as the
+        # module-level communicators dict of runtests.mpi.tester
+        self.head = {}
+
+    def get(self, size, layout='head'):
+        """
+        Return the communicator of this rank and its color.
+        """
+        from mpi4py import MPI
+        world = MPI.COMM_WORLD
+        self.requests += 1
+        key = (size, layout)
+        if key in self.comms:
+            if key in self.split_keys:
+                self.reused += 1
+            return self.comms[key]
+
+        if layout == 'head':
+            color = 0 if world.rank < size else 1
+            if size in self.head:
+                comm = self.head[size]
+            elif size == world.size:
+                comm = world
+            elif size == 1:
+                comm = MPI.COMM_SELF
+            else:
+                comm = world.Split(color)
+                self.splits += 1
+                self.split_keys.add(key)
+            self.head[size] = comm
+        elif layout == 'slots':
+            nslots = world.size // size
+            color = world.rank // size if world.rank < nslots * size else None
+            comm = world.Split(MPI.UNDEFINED if color is None else color)
+            self.splits += 1
+            self.split_keys.add(key)
+            if comm == MPI.COMM_NULL:
+                comm = None
+        else:
+            raise ValueError("unknown layout %s" % layout)
+
+        self.comms[key] = (comm, color)
+        return comm, color
+
+    def dup(self, comm):
+        """
+        Return a duplicate of ``comm``, for a test that modifies its
+        communicator; collective over ``comm``. The duplicate is freed by
+        :meth:`free` unless freed earlier.
+        """
+        dup = comm.Dup()
+        self.dups.append(dup)
+        return dup
+
+    def release(self, dup):
+        """
+        Free a duplicate from :meth:`dup`; collective over the duplicate.
+        """
+        self.dups.remove(dup)
+        dup.Free()
+
+    def summary(self):
+        return "%d communicator(s) split for %d request(s); %d split(s) saved by reuse" % (
+                self.splits, self.requests, self.reused)
+
+    def free(self):
+        """
+        Free the communicators in the pool; collective over COMM_WORLD.
+        """
+        from mpi4py import MPI
+        for dup in self.dups:
+            if dup != MPI.COMM_NULL:
+                dup.Free()
+        for comm, color in self.comms.values():
+            if comm is not None and comm not in (MPI.COMM_WORLD, MPI.COMM_SELF):
+                comm.Free()
+        self.comms.clear()
+        self.head.clear()
+        self.split_keys.clear()
+        self.dups = []
+
+pool = CommPool()
+
+# the communicators of the first ranks by size, for compatibility
+communicators = pool.head
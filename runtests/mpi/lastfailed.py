@@ -0,0 +1,92 @@
+"""
+    The tests that failed in the last MPI run, for ``--mpi-lf`` and ``--mpi-ff``.
+"""
+import os
+import json
+from glob import glob
+
+class LastFailedStore(object):
+    """
+    The node ids of the tests that failed in the last run, with the ranks
+    they failed on.
+
+    Rank 0 owns the store file, usually ``build/lastfailed.json``, and
+    writes it once the outcome of a run is decided. A failing rank cannot
+    rely on rank 0 for that, as rank 0 may be blocked in a collective when
+    the world is aborted; so each failing rank also writes its own fragment
+    next to the store, which rank 0 folds into the store at the start of
+    the next run, before :meth:`update` records the outcome of that run.
+
+    Parameters
+    ----------
+    filename : str
+        the file of the store
+    """
+    VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def _fragment(self, rank):
+        return '%s.rank-%d' % (self.filename, rank)
+
+    def _read(self, filename):
+        try:
+            with open(filename, 'r') as ff:
+                d = json.load(ff)
+            if d['version'] != self.VERSION:
+                raise ValueError
+            return d['failed']
+        except (IOError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _write(self, filename, failed):
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(filename + '.tmp', 'w') as ff:
+            json.dump({'version' : self.VERSION, 'failed' : failed}, ff)
+        os.rename(filename + '.tmp', filename)
+
+    def load(self):
+        """
+        Return the failed tests, as a dict from node id to the sorted list
+        of failing ranks, including the fragments of the failing ranks.
+        """
+        failed = self._read(self.filename)
+        for filename in glob(self.filename + '.rank-*'):
+            for nodeid, ranks in self._read(filename).items():
+                failed[nodeid] = sorted(set(failed.get(nodeid, []) + ranks))
+        return failed
+
+    def collect(self):
+        """
+        Fold the fragments into the store; called on rank 0 before the
+        tests of every run. Returns the failed tests as :meth:`load`.
+        """
+        failed = self.load()
+        fragments = glob(self.filename + '.rank-*')
+        if len(fragments) > 0:
+            self._write(self.filename, failed)
+            for filename in fragments:
+                os.remove(filename)
+        return failed
+
+    def save_fragment(self, rank, nodeids):
+        """
+        Record the tests that failed on a failing rank.
+        """
+        self._write(self._fragment(rank), dict((nodeid, [rank]) for nodeid in nodeids))
+
+    def update(self, ran, failed, rank=0):
+        """
+        Update the store with the outcome of a run: the tests in ``ran``
+        that are not in ``failed`` are removed, and those in ``failed``
+        are added; tests that did not run are kept.
+        """
+        store = self._read(self.filename)
+        for nodeid in ran:
+            store.pop(nodeid, None)
+        for nodeid in failed:
+            store[nodeid] = [rank]
+        self._write(self.filename, store)
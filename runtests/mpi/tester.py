@@ -1,4 +1,10 @@
 from ..tester import Tester as BaseTester
+from .lastfailed import LastFailedStore
+from .capture import SpillCapture, parse_size
+from .comm import pool
+
+# re-exported; the communicators of MPITest by size, as in earlier versions
+from .comm import communicators
 
 import pytest
 import traceback
@@ -10,28 +16,129 @@ import time
 from argparse import ArgumentParser
 from contextlib import contextmanager
 
-if sys.version_info[0] == 2:
-    from cStringIO import StringIO
-else:
-    from io import StringIO
 import re
+import array
+import hashlib
 
 def fix_titles(s):
     pattern = '=====+'
     return re.sub(pattern, lambda x: x.group(0).replace('=', '-'), s)
 
-class Rotator(object):
-    """ in a rotator every range runs in terms """
-    def __init__(self, comm):
-        self.comm = comm
-    def __enter__(self):
-        self.comm.Barrier()
-        for i in range(self.comm.rank):
-            self.comm.Barrier()
-    def __exit__(self, type, value, tb):
-        for i in range(self.comm.rank, self.comm.size):
-            self.comm.Barrier()
-        self.comm.Barrier()
+def format_ranks(ranks):
+    """ Format a sorted list of ranks as ranges, e.g. '1-3, 5' """
+    ranges = []
+    for rank in ranks:
+        if ranges and ranges[-1][1] == rank - 1:
+            ranges[-1][1] = rank
+        else:
+            ranges.append([rank, rank])
+    return ', '.join('%d' % a if a == b else '%d-%d' % (a, b) for a, b in ranges)
+
+def strip_timings(text):
+    """ Remove the timings, e.g. 'in 0.12s', from the output of a session """
+    return re.sub(r'\d+\.\d+s\b', '', text)
+
+def gather_output(comm, text, key=None):
+    """
+    Collect the text of all ranks on the root rank, deduplicated.
+
+    The digests of the texts are exchanged in one collective; then only
+    the lowest rank with each distinct non-empty text sends it to the root.
+    Texts are compared after applying ``key``, e.g. :func:`strip_timings`.
+
+    Returns
+    -------
+    list of (ranks, text)
+        on the root, the distinct texts with the ranks that produced them,
+        ordered by the first rank; None on the other ranks.
+    """
+    data = text if key is None else key(text)
+    data = data if isinstance(data, bytes) else data.encode('utf-8')
+    digest = hashlib.sha1(data).hexdigest() if text else None
+    digests = comm.allgather(digest)
+
+    first = {}
+    for rank, d in enumerate(digests):
+        if d is not None:
+            first.setdefault(d, rank)
+
+    if comm.rank != 0:
+        if digest is not None and first[digest] == comm.rank:
+            comm.send(text, dest=0, tag=0x7e57)
+        return None
+
+    groups = []
+    for d, rank in sorted(first.items(), key=lambda x: x[1]):
+        if rank == 0:
+            t = text
+        else:
+            t = comm.recv(source=rank, tag=0x7e57)
+        groups.append(([r for r in range(comm.size) if digests[r] == d], t))
+    return groups
+
+def any_rank(comm, flag):
+    """
+    Whether ``flag`` is true on any rank of ``comm``; a single allreduce
+    of one integer, without pickling.
+    """
+    from mpi4py import MPI
+    buf = array.array('i', [1 if flag else 0])
+    comm.Allreduce(MPI.IN_PLACE, buf, op=MPI.MAX)
+    return buf[0] != 0
+
+class CollectiveFailure(Exception):
+    """
+    A test failed on some ranks of its communicator; raised on the other
+    ranks of the communicator, with the tracebacks of all failing ranks.
+    The failing ranks raise their own exception, with this failure as its
+    ``mpi_failure`` attribute.
+
+    Attributes
+    ----------
+    ranks : list of int
+        the failing ranks, in the communicator
+    world : bool
+        whether all ranks of the world agreed on the failure
+    """
+    def __init__(self, comm, errors):
+        from mpi4py import MPI
+        self.ranks = [rank for rank, error in enumerate(errors) if error is not None]
+        self.world = comm.size == MPI.COMM_WORLD.size
+
+        groups = []
+        for rank in self.ranks:
+            for ranks, error in groups:
+                if error == errors[rank]:
+                    ranks.append(rank)
+                    break
+            else:
+                groups.append(([rank], errors[rank]))
+
+        def name(ranks):
+            return ("rank %s" if len(ranks) == 1 else "ranks %s") % format_ranks(ranks)
+
+        message = "failed on %s of %d" % (name(self.ranks), comm.size)
+        for ranks, error in groups:
+            message += "\n" + "-" * 16 + " %s " % name(ranks) + "-" * 16 + "\n" + error
+        Exception.__init__(self, message)
+
+def agree_on_failure(comm, error):
+    """
+    Agree on the outcome of a test on all ranks of ``comm``; collective.
+
+    Parameters
+    ----------
+    error : str or None
+        the traceback of the failure on this rank, or None
+
+    Returns
+    -------
+    CollectiveFailure or None
+        the failure of the test, if it failed on any rank
+    """
+    if not any_rank(comm, error is not None):
+        return None
+    return CollectiveFailure(comm, comm.allgather(error))
 
 @contextmanager
 def nompi(comm):
@@ -43,7 +150,7 @@ def nompi(comm):
         errored = True
         error = e
     finally:
-        anyerrored = any(comm.allgather(errored))
+        anyerrored = any_rank(comm, errored)
 
     if anyerrored:
         if error is None:
@@ -52,9 +159,69 @@ def nompi(comm):
             raise error
 
 
-communicators = {
+# the slot communicators of --mpi-pack, by size; each rank is in at most
+# one slot of each size
+slots = {
 }
 
+def create_slots(sizes):
+    """
+    Split COMM_WORLD into disjoint slots of each size, for running tests of
+    that size side by side; collective over COMM_WORLD.
+
+    Ranks beyond the last full slot of a size are in no slot of that size.
+    """
+    for size in sorted(sizes):
+        slots[size] = pool.get(size, 'slots')[0]
+
+def pack_plan(bysize, durations, worldsize):
+    """
+    Plan the slots of ``--mpi-pack``: the tests of each size are spread
+    over the slots of that size, longest first.
+
+    Parameters
+    ----------
+    bysize : dict
+        the node ids of the tests to pack, by commsize
+    durations : DurationStore or dict
+        the durations of previous runs, by node id
+    worldsize : int
+        the size of COMM_WORLD
+
+    Returns
+    -------
+    plan : list of tuple
+        ``(nodeid, size, slot)`` in the order to run the tests
+    """
+    from ..workers import schedule
+
+    plan = []
+    for size in sorted(bysize):
+        nodeids = bysize[size]
+        shards = schedule([durations.get(nodeid) for nodeid in nodeids],
+                          worldsize // size)
+        for slot, shard in enumerate(shards):
+            plan.extend((nodeids[i], size, slot) for i in shard)
+    return plan
+
+def format_packed(results):
+    """
+    Format the outcomes of the packed tests, one line per test, sorted.
+
+    Parameters
+    ----------
+    results : list of tuple
+        ``(nodeid, size, slot, outcome, duration)``
+    """
+    lines = []
+    for nodeid, size, slot, outcome, duration in sorted(results):
+        if size == 1:
+            ranks = "rank %d" % slot
+        else:
+            ranks = "ranks %d-%d" % (slot * size, slot * size + size - 1)
+        lines.append("%-8s %8.2fs  %-12s %s" % (outcome, duration, ranks, nodeid))
+    return lines
+
 class WorldTooSmall(Exception): pass
 
 def create_comm(size, mpi_missing_policy='fail'):
@@ -71,20 +238,15 @@ def create_comm(size, mpi_missing_policy='fail'):
     if MPI.COMM_WORLD.size < size:
         raise WorldTooSmall
 
-    color = 0 if MPI.COMM_WORLD.rank < size else 1
-    if size not in communicators:
-        if MPI.COMM_WORLD.size == size:
-            comm = MPI.COMM_WORLD
-        elif size == 1:
-            comm = MPI.COMM_SELF
-        else:
-            comm = MPI.COMM_WORLD.Split(color)
-        communicators[size] = comm
+    return pool.get(size)
 
-    return communicators[size], color
+def MPITestFixture(commsize, scope='function', mpi_missing_policy='fail', dup=False):
+    """
+    Create a test fixture for MPI Communicators of various commsizes
 
-def MPITestFixture(commsize, scope='function', mpi_missing_policy='fail'):
-    """ Create a test fixture for MPI Communicators of various commsizes """
+    The communicators are shared by all tests; with ``dup=True`` each use
+    of the fixture gets a duplicate, for tests that modify the communicator.
+    """
 
     @pytest.fixture(params=commsize, scope=scope)
     def fixture(request):
@@ -97,20 +259,22 @@ def MPITestFixture(commsize, scope='function', mpi_missing_policy='fail'):
             MPI.COMM_WORLD.barrier()
         try:
             comm, color = create_comm(request.param, mpi_missing_policy=mpi_missing_policy)
-
-            if color != 0:
-                pytest.skip("Not using communicator %d" %(request.param))
-                return None
-            else:
-                return comm
-
         except WorldTooSmall:
             pytest.skip("Not using communicator %d" % request.param)
-            return None
+
+        if color != 0:
+            pytest.skip("Not using communicator %d" %(request.param))
+
+        if dup and comm is not None:
+            comm = pool.dup(comm)
+            yield comm
+            pool.release(comm)
+        else:
+            yield comm
 
     return fixture
 
-def MPITest(commsize, mpi_missing_policy='fail'):
+def MPITest(commsize, mpi_missing_policy='fail', dup=False):
     """
     A decorator that repeatedly calls the wrapped function,
     with communicators of varying sizes.
@@ -124,6 +288,9 @@ def MPITest(commsize, mpi_missing_policy='fail'):
         Sizes of communicator to use
     mpi_missing_policy: {"fail", "ignore"}
         wether to fail or to pass comm=None when mpi4py is not available
+    dup: boolean
+        pass a duplicate of the shared communicator, for tests that
+        modify the communicator (attributes, error handlers)
     Usage
     -----
     @MPITest(commsize=[1, 2, 3])
@@ -145,30 +312,147 @@ def MPITest(commsize, mpi_missing_policy='fail'):
 
         @pytest.mark.parametrize("size", sizes)
         def wrapped(size, *args):
-            if MPI is None:
+            __tracebackhide__ = True
+
+            # with --mpi-pack, only the ranks of a slot run the test
+            group = MPI.COMM_WORLD if MPI is not None else None
+            if size in slots:
+                group = slots[size]
+
+            if group is None:
                 func_names = [func.__name__]
             else:
-                func_names = MPI.COMM_WORLD.allgather(func.__name__)
+                func_names = group.allgather(func.__name__)
             if not all(func_names[0] == i for i in func_names):
                 raise RuntimeError("function calls mismatched", func_names)
 
+            if size in slots:
+                comm, color = group, 0
+            else:
+                try:
+                    comm, color = create_comm(size)
+                except WorldTooSmall:
+                    return pytest.skip("Test skipped because world is too small. Include the test with mpirun -n %d" % (size))
+
+            duplicated = dup and color == 0 and comm is not None
+            if duplicated:
+                comm = pool.dup(comm)
+
+            # agree on the outcome on all ranks of the group, such that the
+            # failure is reported everywhere and the ranks stay in step;
+            # a failing rank raises its own exception, the others raise
+            # the CollectiveFailure
+            failure = None
             try:
-                comm, color = create_comm(size)
-            except WorldTooSmall:
-                return pytest.skip("Test skipped because world is too small. Include the test with mpirun -n %d" % (size))
-
-            try:
-                if color == 0:
-                    rt = func(*args, comm=comm)
-                if color == 1:
-                    rt = None
-                    #pytest.skip("rank %d not needed for comm of size %d" %(MPI.COMM_WORLD.rank, size))
+                try:
+                    if color == 0:
+                        rt = func(*args, comm=comm)
+                    if color == 1:
+                        rt = None
+                        #pytest.skip("rank %d not needed for comm of size %d" %(MPI.COMM_WORLD.rank, size))
+                except Exception as e:
+                    if group is None:
+                        raise
+                    e.mpi_failure = agree_on_failure(group, traceback.format_exc())
+                    raise
+                if group is not None:
+                    failure = agree_on_failure(group, None)
             finally:
-                if MPI is not None:
-                    MPI.COMM_WORLD.barrier()
+                if duplicated:
+                    pool.release(comm)
 
+            if failure is not None:
+                raise failure
             return rt
         wrapped.__name__ = func.__name__
+        wrapped._mpitest = True
+        return wrapped
+    return dec
+
+def MPIScalingTest(commsize, mode='strong', mpi_missing_policy='fail'):
+    """
+    A decorator for a benchmark that runs on communicators of increasing
+    sizes, for a strong or a weak scaling analysis.
+
+    The wrapped function is called once per comm size on the ranks of the
+    communicator, with the ``benchmark`` fixture, the communicator and the
+    scale of the problem: 1 for strong scaling (a fixed problem) and the
+    comm size for weak scaling (a problem that grows with the ranks). The
+    tags of each comm size are timed on its communicator and recorded
+    under ``commsize=N/``, all in a single result; the speedup, the
+    efficiency and the serial fraction are in ``scaling`` in the result,
+    see :mod:`runtests.scaling`.
+
+    Comm sizes larger than the world are left out.
+
+    Parameters
+    ----------
+    commsize: scalar or tuple
+        Sizes of communicator to use
+    mode: {"strong", "weak"}
+        the kind of scaling
+    mpi_missing_policy: {"fail", "ignore"}
+        wether to fail or to run only with comm=None when mpi4py is not available
+
+    Usage
+    -----
+    @MPIScalingTest(commsize=[1, 2, 4], mode='weak')
+    def test_scaling(benchmark, comm, scale):
+        with benchmark("solve"):
+            solve(1000 * scale, comm)
+    """
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        if mpi_missing_policy != 'ignore':
+            raise
+        MPI = None
+    if mode not in ('strong', 'weak'):
+        raise ValueError("mode must be 'strong' or 'weak', not %s" % mode)
+    if not isinstance(commsize, (tuple, list)):
+        commsize = (commsize,)
+
+    sizes = sorted(list(commsize))
+
+    def dec(func):
+
+        def wrapped(benchmark):
+            __tracebackhide__ = True
+            ran = []
+            benchmark.attrs['scaling'] = {'mode' : mode, 'commsize' : ran}
+
+            for size in sizes:
+                if MPI is None:
+                    if size != 1:
+                        continue
+                    comm, color = None, 0
+                else:
+                    try:
+                        comm, color = create_comm(size)
+                    except WorldTooSmall:
+                        continue
+                ran.append(size)
+                scale = 1 if mode == 'strong' else size
+
+                # agree on the outcome on all ranks, as in MPITest
+                error = None
+                try:
+                    if color == 0:
+                        with benchmark.scope('commsize=%d' % size, comm):
+                            func(benchmark=benchmark, comm=comm, scale=scale)
+                except Exception:
+                    if MPI is None:
+                        raise
+                    error = traceback.format_exc()
+                if MPI is not None and any_rank(MPI.COMM_WORLD, error is not None):
+                    raise CollectiveFailure(MPI.COMM_WORLD, MPI.COMM_WORLD.allgather(error))
+
+            if len(ran) == 0:
+                return pytest.skip("Test skipped because world is too small. Include the test with mpirun -n %d" % sizes[0])
+
+        # the benchmark is named after the module of the test
+        wrapped.__name__ = func.__name__
+        wrapped.__module__ = func.__module__
         return wrapped
     return dec
 
@@ -241,8 +525,7 @@ def MPIWorld(NTask, required=1, optional=False, mpi_missing_policy="fail"):
                                      "mpirun -n {0}."
                                      .format(maxsize, MPI.COMM_WORLD.size))
 
-                color = 0 if MPI.COMM_WORLD.rank < size else 1
-                comm = MPI.COMM_WORLD.Split(color)
+                comm, color = pool.get(size)
 
             if color == 0:
                 rt = func(*args, comm=comm)
@@ -252,8 +535,6 @@ def MPIWorld(NTask, required=1, optional=False, mpi_missing_policy="fail"):
             if color == 1:
                 #pytest.skip("rank %d not needed for comm of size %d" %(MPI.COMM_WORLD.rank, size))
                 rt = None
-            if comm is not None:
-                comm.Free()
             return rt
         wrapped.__name__ = func.__name__
         return wrapped
@@ -293,6 +574,37 @@ class Tester(BaseTester):
 
         parser.addoption("--mpisub-site-dir", default=None, help="site-dir in mpisub")
 
+        parser.addoption("--mpi-lf", "--mpi-last-failed", action="store_true", default=False,
+                dest="mpi_lf",
+                help="only run the tests that failed in the last MPI run, "
+                     "on any rank; '--lf' is an alias under MPI")
+
+        parser.addoption("--mpi-ff", "--mpi-failed-first", action="store_true", default=False,
+                dest="mpi_ff",
+                help="run the tests that failed in the last MPI run first; "
+                     "'--ff' is an alias under MPI")
+
+        parser.addoption("--capture-limit", default='16M', type=parse_size,
+                help="the output of a rank kept in memory in a mpisub, e.g. 16M; beyond that "
+                     "it is compressed to build/test/output.rank-N.gz and only its head and "
+                     "tail are shown")
+
+        parser.addoption("--mpi-keep-going", action="store_true", default=False,
+                help="do not stop after the first failure; failures of MPITest are agreed on "
+                     "by all ranks of the test, so the run can go on")
+
+        parser.addoption("--mpi-pack", action="store_true", default=False,
+                help="run the commsize variants of MPITest side by side on disjoint "
+                     "slots of the world, instead of one at a time")
+
+    # pytest options replaced by the rank-aware versions in a mpisub
+    LASTFAILED_ALIASES = {
+        '--lf' : '--mpi-lf',
+        '--last-failed' : '--mpi-lf',
+        '--ff' : '--mpi-ff',
+        '--failed-first' : '--mpi-ff',
+    }
+
 
     def __init__(self, *args, **kwargs):
         """
@@ -313,6 +625,23 @@ class Tester(BaseTester):
             del kwargs['mpi_missing_policy']
         super(Tester, self).__init__(*args, **kwargs)
 
+        self.LASTFAILED_FILE = os.path.join(self.BUILD_DIR, 'lastfailed.json')
+
+        # the packed items run on this rank, for --mpi-pack; whether the
+        # outcomes of the slots are yet to be settled over the world, and
+        # the packed tests that failed on any rank
+        self._packed = {}
+        self._unsettled = False
+        self._packed_failed = set()
+
+        # the capture of the output of this rank, in a mpisub
+        self._capture = None
+
+        # the failures agreed on by all ranks of a test, and whether by all
+        # ranks of the world
+        self._agreed = {}
+        self._keep_going = False
+
     @property
     def comm(self):
         try:
@@ -327,13 +656,35 @@ class Tester(BaseTester):
         # must bail after first dead test; avoiding a fault MPI collective state.
         argv.insert(1, '-x')
 
+        if '--mpisub' in argv:
+            # the last-failed data of pytest's cache provider is written by
+            # every rank; use the rank-aware store instead
+            argv[:] = [self.LASTFAILED_ALIASES.get(arg, arg) for arg in argv]
+            if self.comm.rank != 0:
+                argv += ['-p', 'no:cacheprovider']
+
         config = self._get_pytest_config(argv)
         args = config.known_args_namespace
 
+        if args.mpi_keep_going:
+            config.option.maxfail = 0
+            self._keep_going = True
+
         # print help and exit
         if args.help:
             return config.hook.pytest_cmdline_main(config=config)
 
+        if args.server or args.server_daemon:
+            raise ValueError("the persistent test server does not support MPI; use run-tests.py")
+
+        if args.workers > 1:
+            raise ValueError("--workers does not support MPI; use run-tests.py")
+
+        if args.mpi_pack and args.bench:
+            # the benchmarks are gathered over the world, while the slots
+            # run different tests
+            raise ValueError("--mpi-pack does not support --bench")
+
         # import project from system path
         args.pyargs = True
 
@@ -399,10 +750,7 @@ class Tester(BaseTester):
 
 
         # extract the coverage-related options
-        covargs = {}
-        covargs['with_coverage'] = args.with_coverage
-        covargs['config_file'] = args.cov_config
-        covargs['html_cov'] = args.html_cov
+        covargs = self._get_coverage_args(args)
 
         if args.mpisub:
             self._begin_capture(args)
@@ -415,6 +763,7 @@ class Tester(BaseTester):
 
         except:
             if args.mpisub:
+                self._save_last_failed(None)
                 self._sleep()
                 self.oldstderr.write("Fatal Error on Rank %d\n" % self.comm.rank)
                 self.oldstderr.write(traceback.format_exc())
@@ -425,10 +774,248 @@ class Tester(BaseTester):
                 sys.exit(1)
 
         if args.mpisub:
-            self._end_capture_and_exit(code)
+            self._end_capture_and_exit(code, verbose=config.option.verbose > 0)
         else:
+            self._save_last_failed(code)
             sys.exit(code)
 
+    def pytest_collection_modifyitems(self, session, config, items):
+        """
+        Select or reorder the tests that failed in the last run, for
+        ``--mpi-lf`` and ``--mpi-ff``, then pack the tests for ``--mpi-pack``;
+        consistently on all ranks.
+        """
+        BaseTester.pytest_collection_modifyitems(self, session, config, items)
+
+        failed = self._collect_last_failed()
+        if config.getoption('mpi_lf') or config.getoption('mpi_ff'):
+            self._select_last_failed(config, items, failed)
+
+        if (config.getoption('mpi_pack') and self.comm is not None
+                and self.comm.size > 1 and not config.option.collectonly):
+            self._pack_items(session, config, items)
+
+    def _collect_last_failed(self):
+        """
+        Fold the fragments of the failing ranks of the last run into the
+        store, before any rank of this run can write its own; on every
+        run, such that the store is updated with the outcome of this run.
+        """
+        if self.comm is None or self.comm.rank == 0:
+            failed = LastFailedStore(self.LASTFAILED_FILE).collect()
+        else:
+            failed = None
+        if self.comm is not None:
+            failed = self.comm.bcast(failed)
+        return failed
+
+    def _select_last_failed(self, config, items, failed):
+        # like pytest, run all tests if none of them failed last time
+        if not any(item.nodeid in failed for item in items):
+            if self.comm is None or self.comm.rank == 0:
+                print("No failures recorded in the last run; running all tests")
+            return
+
+        if config.getoption('mpi_lf'):
+            deselected = [item for item in items if item.nodeid not in failed]
+            items[:] = [item for item in items if item.nodeid in failed]
+            if len(deselected) > 0:
+                config.hook.pytest_deselected(items=deselected)
+                self._deselected += len(deselected)
+        else:
+            items[:] = sorted(items, key=lambda x: x.nodeid not in failed)
+
+    def _pack_items(self, session, config, items):
+        """
+        Pack the commsize variants of MPITest onto disjoint slots of the
+        world, for ``--mpi-pack``; only the items of the slots of this rank
+        are kept, the others are deselected on this rank.
+
+        The packed items run first, by increasing size, each size spread
+        over its slots longest first; the other items (fixtures, MPIWorld,
+        tests using the full world) run last on all ranks. The plan is made
+        on rank 0, and the slot communicators are created on all ranks.
+
+        A failure in a slot is known to the ranks of the slot only, so the
+        ranks do not stop in the packed items; they settle the outcomes
+        over the world after them, see :meth:`_settle_packed`.
+        """
+        comm = self.comm
+        def packable(item):
+            if not getattr(getattr(item, 'obj', None), '_mpitest', False):
+                return False
+            size = item.callspec.params.get('size')
+            return size is not None and size < comm.size
+
+        if comm.rank == 0:
+            bysize = {}
+            for item in items:
+                if packable(item):
+                    bysize.setdefault(item.callspec.params['size'], []).append(item.nodeid)
+            plan = pack_plan(bysize, self.durations, comm.size)
+        else:
+            plan = None
+        plan = comm.bcast(plan)
+
+        create_slots(set(size for nodeid, size, slot in plan))
+
+        byid = dict((item.nodeid, item) for item in items)
+        packed = [byid[nodeid] for nodeid, size, slot in plan
+                  if comm.rank // size == slot and slots[size] is not None]
+        planned = set(nodeid for nodeid, size, slot in plan)
+        rest = [item for item in items if item.nodeid not in planned]
+
+        self._packed = dict((nodeid, (size, slot)) for nodeid, size, slot in plan)
+        self._packed_outcomes = {}
+
+        self._session = session
+        self._settle_after = packed[-1].nodeid if len(packed) > 0 else None
+        self._unsettled = len(plan) > 0
+        self._maxfail = config.option.maxfail
+        if self._unsettled:
+            config.option.maxfail = 0
+
+        kept = set(item.nodeid for item in packed)
+        elsewhere = [item for item in items if item.nodeid in planned and item.nodeid not in kept]
+        if len(elsewhere) > 0:
+            config.hook.pytest_deselected(items=elsewhere)
+            self._deselected += len(elsewhere)
+        items[:] = packed + rest
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        BaseTester.pytest_runtest_logstart(self, nodeid, location)
+        if self._capture is not None:
+            self._capture.begin(nodeid)
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        BaseTester.pytest_runtest_logfinish(self, nodeid, location)
+        if self._capture is not None:
+            self._capture.begin('')
+        if self._unsettled and nodeid == self._settle_after:
+            self._settle_packed()
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        # a rank without packed items settles before the other items
+        if self._unsettled and item.nodeid not in self._packed:
+            self._settle_packed()
+            if item.session.shouldfail or item.session.shouldstop:
+                return True
+        return None
+
+    def _settle_packed(self):
+        """
+        Agree on the outcomes of the packed tests over the world, once this
+        rank ran the packed items of its slots; collective over COMM_WORLD.
+
+        The failures of all slots become known to all ranks, such that the
+        run ends without aborting the world; unless ``--mpi-keep-going``,
+        all ranks stop before the other items if a packed test failed.
+        """
+        self._unsettled = False
+
+        failed = [nodeid for nodeid, outcome in self._packed_outcomes.items()
+                  if outcome == 'failed']
+        self._packed_failed = set(sum(self.comm.allgather(failed), []))
+
+        # all ranks are here, hence they all reach the end of the run
+        for nodeid in failed:
+            self._agreed[nodeid] = True
+
+        self._session.config.option.maxfail = self._maxfail
+        if self._maxfail and len(self._packed_failed) >= self._maxfail:
+            self._session.shouldfail = "stopping after %d failures in packed tests" % (
+                    len(self._packed_failed))
+
+    def pytest_runtest_makereport(self, item, call):
+        if call.excinfo is None:
+            return
+        # the failing ranks of MPITest keep their exception, and attach
+        # the failure agreed on by the ranks
+        failure = call.excinfo.value
+        if not isinstance(failure, CollectiveFailure):
+            failure = getattr(failure, 'mpi_failure', None)
+        if failure is not None:
+            self._agreed[item.nodeid] = failure.world
+
+    def _failures_agreed(self):
+        """
+        Whether all ranks know about the failures on this rank, such that
+        they all reach the end of the run; with -x, the failures must be
+        agreed on by the whole world, as the ranks stop after them.
+        """
+        failed = [nodeid for nodeid, (duration, fail) in self._run_durations.items() if fail]
+        if len(failed) == 0:
+            # packed failures are settled, and benchmark regressions are
+            # counted, on all ranks
+            if len(self._packed_failed) > 0:
+                return True
+            return self._bench_logger is not None and self._bench_logger.regressions > 0
+        if any(nodeid not in self._agreed for nodeid in failed):
+            return False
+        return self._keep_going or all(self._agreed[nodeid] for nodeid in failed)
+
+    def pytest_runtest_logreport(self, report):
+        BaseTester.pytest_runtest_logreport(self, report)
+        if report.nodeid in self._packed:
+            if report.when == 'call' or report.outcome != 'passed':
+                self._packed_outcomes.setdefault(report.nodeid, report.outcome)
+
+    def _report_packed(self):
+        """
+        Gather the outcomes of the packed items from the leading rank of
+        each slot, and print them on rank 0 in a deterministic order.
+        """
+        local = []
+        for nodeid, outcome in self._packed_outcomes.items():
+            size, slot = self._packed[nodeid]
+            if self.comm.rank == slot * size:
+                duration = self._run_durations.get(nodeid, (0., False))[0]
+                local.append((nodeid, size, slot, outcome, duration))
+
+        results = self.comm.gather(local)
+        if self.comm.rank != 0:
+            return
+
+        results = sum(results, [])
+        for nodeid, size, slot, outcome, duration in results:
+            if nodeid not in self._run_durations:
+                self.durations.record(nodeid, duration, outcome == 'failed')
+        BaseTester._save_durations(self)
+
+        print("")
+        print("=" * 24 + " packed MPI tests on %d ranks " % self.comm.size + "=" * 24)
+        for line in format_packed(results):
+            print(line)
+        sys.stdout.flush()
+
+    def _save_durations(self):
+        # with --mpi-pack, saved once the durations of the other slots
+        # are gathered
+        if len(self._packed) == 0:
+            BaseTester._save_durations(self)
+
+    def _save_last_failed(self, code):
+        """
+        Record the tests that failed on this rank, once the outcome of the
+        run is decided.
+
+        Rank 0 updates the store when all ranks agree on the outcome, or
+        when it fails itself; a failing rank writes a fragment of the store,
+        as the world is about to be aborted. ``code`` is None on an internal
+        error, where only the fragment is written.
+        """
+        failed = [nodeid for nodeid, (duration, fail) in self._run_durations.items() if fail]
+        rank = 0 if self.comm is None else self.comm.rank
+        store = LastFailedStore(self.LASTFAILED_FILE)
+        try:
+            if rank == 0 and code is not None:
+                store.update(self._run_durations.keys(), failed)
+            elif len(failed) > 0:
+                store.save_fragment(rank, failed)
+        except (IOError, OSError) as e:
+            sys.stderr.write("Failed to record the failed tests: %s\n" % e)
+
     def _launch_mpisub(self, args, site_dir):
 
         # extract the mpirun run argument
@@ -459,47 +1046,105 @@ class Tester(BaseTester):
         os.environ['OMPI_MCA_rmaps_base_no_oversubscribe'] = '0'
         os.environ['OMPI_MCA_mpi_yield_when_idle'] = '1'
 
+        # computed once here rather than on every rank
+        if args.bench:
+            os.environ['RUNTESTS_SOURCE_VERSION'] = self.source_version or ''
+            os.environ['RUNTESTS_SOURCE_GIT_HASH'] = self.source_git_hash or ''
+
         os.execvp(mpirun[0], mpirun + cmdargs + additional)
 
         # if we are here os.execvp has failed; bail
         sys.exit(1)
 
     def _sleep(self):
-        time.sleep(0.04 * self.comm.rank)
+        # stagger the output of failing ranks; bounded for large worlds
+        time.sleep(min(0.04 * self.comm.rank, 1.0))
 
     def _begin_capture(self, args):
         self.oldstdout = sys.stdout
         self.oldstderr = sys.stderr
-        self.newstdout = StringIO()
-        self.newstderr = StringIO()
 
         if args.capture != 'no':
             if self.comm.rank != 0:
-                sys.stdout = self.newstdout
-                sys.stderr = self.newstderr
+                filename = os.path.join(self.TEST_DIR, 'output.rank-%d.gz' % self.comm.rank)
+                self._capture = SpillCapture(filename, args.capture_limit)
+                self._capture.begin('')
+                sys.stdout = self._capture
+                sys.stderr = self._capture
 
-    def _end_capture_and_exit(self, code):
-        if code != 0:
-            # if any rank has a failure, print the error and abort the world.
+    def _stop_capture(self):
+        """
+        Stop capturing; return the captured output, or None if the output
+        was not captured.
+        """
+        if self._capture is None:
+            return None
+        sys.stdout = self.oldstdout
+        sys.stderr = self.oldstderr
+        self._capture.close()
+        return self._capture
+
+    def _failure_output(self, capture):
+        """
+        The output of the failed tests on this rank, followed by the end of
+        the session with the failure report; all of the output if the
+        failed tests are unknown.
+        """
+        failed = sorted(nodeid for nodeid, (duration, fail) in self._run_durations.items() if fail)
+        parts = []
+        for nodeid in failed:
+            text = capture.segment(nodeid)
+            if text:
+                parts.append("-" * 32 + " output of %s " % nodeid + "-" * 32 + "\n" + text)
+        if len(parts) == 0:
+            return capture.getvalue()
+        return ''.join(parts) + (capture.segment('') or '')
+
+    def _end_capture_and_exit(self, code, verbose=False):
+        if self._unsettled:
+            # no packed items and no other items on this rank
+            self._settle_packed()
+
+        if code != 0 and not self._failures_agreed():
+            # if any rank has an unexpected failure, print the error and abort the world.
+            self._save_last_failed(code)
+            capture = self._stop_capture()
             self._sleep()
-            if self.comm.rank != 0:
+            if capture is not None:
                 self.oldstderr.write("Test Failure due to rank %d\n" % self.comm.rank)
-                self.oldstderr.write(self.newstdout.getvalue())
-                self.oldstderr.write(self.newstderr.getvalue())
+                self.oldstderr.write(self._failure_output(capture))
                 self.oldstderr.flush()
             self.comm.Abort(-1)
 
         self.comm.barrier()
-        with Rotator(self.comm):
-            if self.comm.rank != 0:
+
+        # all ranks reached the end
+        if self.comm.rank == 0 or code != 0:
+            self._save_last_failed(code)
+
+        if len(self._packed) > 0:
+            self._report_packed()
+
+        if pool.requests > 0:
+            pool.free()
+            if self.comm.rank == 0 and verbose:
+                print("MPI communicators: %s" % pool.summary())
+
+        # the output of rank 0 is not captured
+        capture = self._stop_capture()
+        text = fix_titles(capture.getvalue()) if capture is not None else ''
+
+        groups = gather_output(self.comm, text, key=strip_timings)
+        if self.comm.rank == 0:
+            for ranks, text in groups:
+                name = "Rank" if len(ranks) == 1 else "Ranks"
                 self.oldstderr.write("\n")
-                self.oldstderr.write("=" * 32 + " Rank %d / %d " % (self.comm.rank, self.comm.size) + "=" * 32)
+                self.oldstderr.write("=" * 32 + " %s %s / %d " % (name, format_ranks(ranks), self.comm.size) + "=" * 32)
                 self.oldstderr.write("\n")
-                self.oldstderr.write(fix_titles(self.newstdout.getvalue()))
-                self.oldstderr.write(fix_titles(self.newstderr.getvalue()))
-                self.oldstderr.flush()
+                self.oldstderr.write(text)
+            self.oldstderr.flush()
 
-        sys.exit(0)
+        sys.exit(code)
 
     @contextlib.contextmanager
     def _run_from_testdir(self, args):
@@ -14,3 +14,15 @@ def test_benchmark2(benchmark, x):
     comm = benchmark.comm
     with benchmark("test 2"):
         time.sleep((1+comm.rank)*0.25)
+
+def test_benchmark3(benchmark):
+    # the number of calls is calibrated on the slowest rank
+    comm = benchmark.comm
+    benchmark.run("test 3", time.sleep, args=(0.001 * (1 + comm.rank),), repeat=3, target_time=0.02)
+
+def test_benchmark4(benchmark):
+    # the time in the communication of a traced comm is recorded apart
+    comm = benchmark.trace(benchmark.comm)
+    with benchmark("test 4"):
+        time.sleep(0.05 * (1 + comm.rank))
+        comm.allreduce(comm.rank)
@@ -0,0 +1,22 @@
+import pytest
+from runtests.mpi import MPITest
+from runtests.mpi.tester import CollectiveFailure
+
+def test_failure_on_one_rank():
+    from mpi4py import MPI
+    world = MPI.COMM_WORLD
+
+    def func(comm):
+        assert comm.rank != 0
+
+    test = MPITest(commsize=world.size)(func)
+    if world.rank == 0:
+        # the failing rank keeps its assertion, as rewritten by pytest
+        with pytest.raises(AssertionError) as e:
+            test(world.size)
+        assert 'assert 0 != 0' in str(e.value)
+        assert e.value.mpi_failure.ranks == [0]
+    else:
+        with pytest.raises(CollectiveFailure) as e:
+            test(world.size)
+        assert e.value.ranks == [0]
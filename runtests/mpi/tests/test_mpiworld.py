@@ -16,3 +16,17 @@ from runtests.mpi import MPIWorld
 def test_mpiworld(comm):
     assert comm is not None
 
+
+@MPITest(commsize=[1, 2], dup=True)
+def test_mpicomm_dup(comm):
+    comm.Set_name('modified')
+    assert comm.Get_name() == 'modified'
+
+@MPITest(commsize=[2])
+def test_mpicomm_communicators(comm):
+    from runtests.mpi.tester import communicators, slots
+    # with --mpi-pack the test runs on a slot of the world instead
+    if 2 in slots:
+        assert slots[2] is comm
+    else:
+        assert communicators[2] is comm
@@ -0,0 +1,21 @@
+from runtests.mpi import MPITest
+from runtests.mpi.tester import gather_output, format_ranks, strip_timings
+
+def test_format_ranks():
+    assert format_ranks([3]) == '3'
+    assert format_ranks([0, 1, 2, 5, 7, 8]) == '0-2, 5, 7-8'
+
+def test_strip_timings():
+    assert strip_timings("1 passed in 0.12s") == "1 passed in "
+
+@MPITest(commsize=[1, 4])
+def test_gather_output(comm):
+    text = ["1 passed in 0.1s", "", "1 failed", "1 passed in 0.2s"][comm.rank]
+    groups = gather_output(comm, text, key=strip_timings)
+    if comm.rank != 0:
+        assert groups is None
+    elif comm.size == 1:
+        assert groups == [([0], "1 passed in 0.1s")]
+    else:
+        # the text of the lowest rank of a group; empty texts are dropped
+        assert groups == [([0, 3], "1 passed in 0.1s"), ([2], "1 failed")]
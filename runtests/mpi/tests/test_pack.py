@@ -0,0 +1,32 @@
+from runtests.mpi import MPITest
+from runtests.mpi.tester import pack_plan, format_packed
+
+# run with --mpi-pack to run the variants side by side
+@MPITest(commsize=[1, 2, 4])
+def test_pack(comm):
+    assert comm.allreduce(1) == comm.size
+
+@MPITest(commsize=[1, 2])
+def test_pack_slot(comm):
+    from mpi4py import MPI
+    # a slot is a block of consecutive ranks starting at a multiple of its size
+    ranks = comm.allgather(MPI.COMM_WORLD.rank)
+    assert ranks == list(range(ranks[0], ranks[0] + comm.size))
+    assert ranks[0] % comm.size == 0
+
+def test_pack_plan():
+    bysize = {1 : ['a', 'b', 'c'], 2 : ['d', 'e']}
+    durations = {'a' : 1., 'b' : 3., 'c' : 2., 'd' : 1., 'e' : 2.}
+    plan = pack_plan(bysize, durations, 4)
+    assert plan == [('b', 1, 0), ('c', 1, 1), ('a', 1, 2),
+                    ('e', 2, 0), ('d', 2, 1)]
+
+    # a single slot of size 2 on 3 ranks
+    assert pack_plan({2 : ['d', 'e']}, durations, 3) == [('e', 2, 0), ('d', 2, 0)]
+
+def test_format_packed():
+    results = [('b', 2, 1, 'failed', 0.5), ('a', 1, 3, 'passed', 1.)]
+    assert format_packed(results) == [
+        "passed       1.00s  rank 3       a",
+        "failed       0.50s  ranks 2-3    b",
+    ]
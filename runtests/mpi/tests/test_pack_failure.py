@@ -0,0 +1,7 @@
+from runtests.mpi import MPITest
+
+# run with --mpi-pack; the failure is known to the ranks of its slot, then
+# to the world once the slots settle their outcomes
+@MPITest(commsize=[1, 2])
+def test_pack_failure(comm):
+    assert comm.allreduce(1) == 0
@@ -0,0 +1,17 @@
+from runtests.mpi import MPIScalingTest
+import time
+
+@MPIScalingTest(commsize=[1, 2, 4], mode='strong')
+def test_strong(benchmark, comm, scale):
+    # a fixed problem with a serial part
+    with benchmark("solve"):
+        time.sleep(0.02 + 0.08 / comm.size)
+
+@MPIScalingTest(commsize=[1, 2, 4], mode='weak')
+def test_weak(benchmark, comm, scale):
+    # a problem that grows with the ranks, with a cost of communication
+    work = 0.05 * scale / comm.size
+    with benchmark("solve"):
+        time.sleep(work + 0.005 * (comm.size - 1))
+        comm.allreduce(comm.rank)
+    benchmark.run("allreduce", comm.allreduce, args=(comm.rank,), repeat=5, target_time=0.01)
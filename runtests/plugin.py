@@ -0,0 +1,77 @@
+"""
+    The part of the pytest plugin of :class:`~runtests.tester.Tester` that
+    needs pytest to be defined: the benchmark fixtures and the hooks with
+    an order.
+
+    It is registered with the tester when the pytest configuration is
+    created; hence importing the tester, e.g. in the client of the test
+    server, does not import pytest.
+"""
+from .benchmark import BenchmarkTimer
+import pytest
+
+class TesterPlugin(object):
+    """
+    The fixtures and ordered hooks of ``tester``; the hooks call the
+    methods of the tester.
+    """
+    def __init__(self, tester):
+        self.tester = tester
+
+    @pytest.fixture(scope="session")
+    def session_benchmark(self, request):
+        """
+        A session-wide benchmark to time and record benchmarks,
+        corresponding to :class:`BenchmarkLogger`
+
+        This class acts as a logger to store and save all benchmark
+        results from the testing session.
+        """
+        benchmark = self.tester._make_benchmark_logger(request.config)
+
+        # yield to user
+        yield benchmark
+
+        if self.tester._worker is not None:
+            # a worker process; the main process reports
+            self.tester._worker.send('benchmark', list(benchmark.benchmarks.items()))
+            return
+
+        # finalize by reporting (needs to be COLLECTIVE call)
+        benchmark.report()
+
+    @staticmethod
+    @pytest.fixture(scope="function")
+    def benchmark(session_benchmark, request):
+        """
+        An object to benchmark an individual test function. When called,
+        this object acts a context manager that does the timing.
+
+        This object has a ``attrs`` dict that the user can add meta-data to,
+        and it reports its results to the ``session_benchmark`` object.
+        """
+        # the qualified name of the function being run
+        func = request.node.function
+        mod, name = func.__module__, func.__name__
+        qualname = mod + '.' + name
+
+        # initialize the timer
+        timer = BenchmarkTimer(qualname, request.node, comm=session_benchmark.comm,
+                               memory=session_benchmark.memory,
+                               profile=session_benchmark.profile,
+                               profile_dir=session_benchmark.output_dir)
+
+        # return the session-wide benchmark
+        yield timer
+
+        # add result to total
+        timer.finish()
+        session_benchmark.add_benchmark(timer)
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtestloop(self, session):
+        return self.tester._run_workers(session)
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_sessionfinish(self, session):
+        self.tester._finish_session(session)
@@ -0,0 +1,266 @@
+"""
+    Profiling of the benchmark blocks, for ``--bench-profile``.
+
+    Each profiler measures named regions of code, possibly nested and
+    repeated, and summarizes each region with :meth:`summary`:
+
+    - 'cprofile' : :mod:`cProfile` of the outermost regions; the profile
+      of each region is also saved as a ``.pstats`` file.
+    - 'perf-stat' : the hardware counters of the process (cycles,
+      instructions, cache references and misses) from the linux
+      perf_event interface, when they are available.
+    - 'sample' : a sampling profiler, in a thread that samples the stack
+      of the thread running the regions.
+"""
+import os
+import re
+import sys
+import time
+import threading
+
+# the number of functions in the summary of a region
+TOP = 10
+
+def describe(filename, lineno, name):
+    """ The name of a function in a summary """
+    return '%s:%d(%s)' % (filename, lineno, name)
+
+def pstats_filename(output_dir, filename, testname, tag, rank):
+    """
+    The file of the profile of a tag of a test on a rank, next to the
+    JSON results of the test.
+    """
+    module = filename.rsplit('.', 1)[0]
+    name = re.sub(r'[^\w.-]+', '_', '%s.%s.%s' % (module, testname, tag))
+    return os.path.join(output_dir, '%s.rank-%d.pstats' % (name, rank))
+
+class CProfiler(object):
+    """
+    Profile the regions with :mod:`cProfile`. Only one profiler can be
+    active at a time, hence a region nested in a profiled region is not
+    profiled on its own; it is part of the profile of the outer region.
+
+    The profile of a repeated region accumulates over the repeats.
+
+    Parameters
+    ----------
+    exclude : list of str, optional
+        the files whose functions are left out of the summary, e.g. of the
+        instrumentation itself
+    """
+    def __init__(self, exclude=[]):
+        import cProfile
+        self._create = cProfile.Profile
+        self.exclude = set([__file__] + list(exclude))
+        self.profiles = {}
+        self.active = None
+
+    def start(self, tag):
+        if self.active is not None:
+            return None
+        profile = self.profiles.setdefault(tag, self._create())
+        self.active = tag
+        profile.enable()
+        return tag
+
+    def stop(self, frame):
+        if frame is None:
+            return
+        self.profiles[frame].disable()
+        self.active = None
+
+    def save(self, tag, filename):
+        """ Save the profile of a region as a .pstats file """
+        if tag in self.profiles:
+            self.profiles[tag].dump_stats(filename)
+
+    def summary(self, tag):
+        """
+        The functions with the most time spent in the region, excluding
+        their callees, as a list of [function, seconds, calls].
+        """
+        if tag not in self.profiles:
+            return None
+        import pstats
+        stats = pstats.Stats(self.profiles[tag]).stats
+        stats = [(func, stat) for func, stat in stats.items()
+                 if func[0] not in self.exclude and '_lsprof.Profiler' not in func[2]]
+        top = sorted(stats, key=lambda x: -x[1][2])[:TOP]
+        return {'top' : [[describe(*func), tt, nc] for func, (cc, nc, tt, ct, callers) in top]}
+
+class PerfCounters(object):
+    """
+    Count hardware events in the regions, with the perf_event_open system
+    call on linux; only the events of the user space of this process are
+    counted. The counters are opened once and read at the start and the
+    end of each region.
+
+    :attr:`error` describes why no counter is available, if so. The
+    ``exclude`` parameter of the other profilers does not apply.
+    """
+    # PERF_TYPE_HARDWARE events
+    EVENTS = [('cycles', 0), ('instructions', 1), ('cache-references', 2),
+              ('cache-misses', 3)]
+
+    # the system call on each architecture
+    SYSCALLS = {'x86_64' : 298, 'i386' : 336, 'i686' : 336,
+                'aarch64' : 241, 'arm64' : 241, 'ppc64le' : 319}
+
+    def __init__(self, exclude=[]):
+        self.fds = {}
+        self.error = None
+        self.counts = {}
+        try:
+            self._open()
+        except (OSError, AttributeError, KeyError, ImportError) as e:
+            self.error = str(e) or e.__class__.__name__
+            self.close()
+
+    def _open(self):
+        import ctypes
+        import struct
+        import platform
+        libc = ctypes.CDLL(None, use_errno=True)
+        syscall = self.SYSCALLS[platform.machine()]
+        for name, config in self.EVENTS:
+            # struct perf_event_attr, PERF_ATTR_SIZE_VER0: type, size, config,
+            # sample_period, sample_type, read_format (time enabled and
+            # running, to scale multiplexed counts), flags (exclude_kernel,
+            # exclude_hv), wakeup_events, bp_type, config1
+            attr = struct.pack('IIQQQQQIIQ', 0, 64, config, 0, 0, 3,
+                               (1 << 5) | (1 << 6), 0, 0, 0)
+            buf = ctypes.create_string_buffer(attr, len(attr))
+            fd = libc.syscall(syscall, buf, 0, -1, -1, 0)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "perf_event_open(%s) failed: %s" % (
+                              name, os.strerror(ctypes.get_errno())))
+            self.fds[name] = fd
+
+    def _read(self):
+        import struct
+        values = {}
+        for name, fd in self.fds.items():
+            value, enabled, running = struct.unpack('QQQ', os.read(fd, 24))
+            values[name] = (value, enabled, running)
+        return values
+
+    def start(self, tag):
+        if self.error is not None:
+            return None
+        return (tag, self._read())
+
+    def stop(self, frame):
+        if frame is None:
+            return
+        tag, start = frame
+        end = self._read()
+        counts = self.counts.setdefault(tag, dict((name, 0) for name in self.fds))
+        for name in self.fds:
+            value = end[name][0] - start[name][0]
+            enabled = end[name][1] - start[name][1]
+            running = end[name][2] - start[name][2]
+            if running > 0 and running < enabled:
+                value = int(value * float(enabled) / running)
+            counts[name] += value
+
+    def summary(self, tag):
+        """
+        The counts of the events in the region, with the instructions per
+        cycle and the cache miss rate; the error if there are no counters.
+        """
+        if self.error is not None:
+            return {'error' : self.error}
+        if tag not in self.counts:
+            return None
+        counts = dict(self.counts[tag])
+        if counts['cycles'] > 0:
+            counts['ipc'] = counts['instructions'] / float(counts['cycles'])
+        if counts['cache-references'] > 0:
+            counts['cache-miss-rate'] = counts['cache-misses'] / float(counts['cache-references'])
+        return counts
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+class SamplingProfiler(object):
+    """
+    Sample the stack of the thread running the regions from another
+    thread, every ``interval`` seconds while a region is active. A sample
+    counts for all the active regions.
+
+    The sampling thread needs the GIL, hence the samples are missing
+    while a C extension holds it.
+
+    Parameters
+    ----------
+    exclude : list of str, optional
+        the files whose functions are not counted, e.g. of the
+        instrumentation itself; the samples count for their callers
+    interval : float, optional
+        the time between samples, in seconds
+    """
+    def __init__(self, exclude=[], interval=0.005):
+        self.exclude = set([__file__] + list(exclude))
+        self.interval = interval
+        self.active = {}
+        self.counts = {}
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.target = None
+
+    def start(self, tag):
+        with self.lock:
+            self.target = threading.current_thread().ident
+            self.active[tag] = self.active.get(tag, 0) + 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+        return tag
+
+    def stop(self, frame):
+        with self.lock:
+            self.active[frame] -= 1
+            if self.active[frame] == 0:
+                del self.active[frame]
+            thread = self.thread if not self.active else None
+            if thread is not None:
+                self.thread = None
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        me = threading.current_thread()
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if self.thread is not me:
+                    return
+                frame = sys._current_frames().get(self.target)
+                while frame is not None and frame.f_code.co_filename in self.exclude:
+                    frame = frame.f_back
+                if frame is None:
+                    continue
+                code = frame.f_code
+                func = describe(code.co_filename, code.co_firstlineno, code.co_name)
+                for tag in self.active:
+                    counts = self.counts.setdefault(tag, {})
+                    counts[func] = counts.get(func, 0) + 1
+                    self.samples[tag] = self.samples.get(tag, 0) + 1
+
+    def summary(self, tag):
+        """
+        The functions the thread was most often in, excluding their
+        callees, as a list of [function, samples], and the number of
+        samples and the interval.
+        """
+        if tag not in self.counts:
+            return None
+        top = sorted(self.counts[tag].items(), key=lambda x: -x[1])[:TOP]
+        return {'top' : [[func, n] for func, n in top], 'samples' : self.samples[tag],
+                'interval' : self.interval}
+
+PROFILERS = {'cprofile' : CProfiler, 'perf-stat' : PerfCounters, 'sample' : SamplingProfiler}
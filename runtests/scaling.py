@@ -0,0 +1,145 @@
+"""
+    The analysis of the scaling benchmarks of :func:`runtests.mpi.MPIScalingTest`.
+
+    The tags of a scaling benchmark are recorded once per comm size, as
+    ``commsize=N/tag``; the time of a tag at a comm size is the maximum
+    over the ranks. The scaling tables of the results can be printed with
+
+    .. code::
+
+        python -m runtests.scaling build/benchmarks
+
+"""
+import os
+import re
+import json
+from glob import glob
+
+TAG = re.compile(r'^commsize=(\d+)/(.*)$')
+
+def points(variant):
+    """
+    The times of the tags of a scaling benchmark, as a dict from the tag to
+    a dict from the comm size to the maximal time over the ranks.
+    """
+    times = {}
+    for tag in variant.get('tags', []):
+        match = TAG.match(tag)
+        if match is None:
+            continue
+        values = [v for v in variant[tag] if v is not None]
+        if len(values) > 0:
+            times.setdefault(match.group(2), {})[int(match.group(1))] = max(values)
+    return times
+
+def fit_amdahl(sizes, times):
+    """
+    The serial fraction of Amdahl's law, ``T(p) = T(1) (f + (1 - f) / p)``,
+    from a least squares fit of the times of a fixed problem; None with
+    less than two comm sizes.
+    """
+    if len(sizes) < 2:
+        return None
+    x = [1. / p for p in sizes]
+    mx = sum(x) / len(x)
+    my = sum(times) / len(times)
+    b = sum((xi - mx) * (yi - my) for xi, yi in zip(x, times)) / sum((xi - mx) ** 2 for xi in x)
+    a = my - b * mx
+    if a + b <= 0:
+        return None
+    return min(max(a / (a + b), 0.), 1.)
+
+def fit_gustafson(sizes, speedups):
+    """
+    The serial fraction of Gustafson's law, ``S(p) = p - f (p - 1)``, from
+    a least squares fit of the scaled speedups; None without a comm size
+    larger than 1.
+    """
+    pairs = [(p, s) for p, s in zip(sizes, speedups) if p > 1]
+    if len(pairs) == 0:
+        return None
+    f = sum((p - s) * (p - 1) for p, s in pairs) / float(sum((p - 1) ** 2 for p, s in pairs))
+    return min(max(f, 0.), 1.)
+
+def scaling_table(times, mode):
+    """
+    The speedup and the parallel efficiency at each comm size, relative to
+    the smallest comm size, and the serial fraction.
+
+    For strong scaling (a fixed problem), the speedup at ``p`` ranks is
+    ``p0 T(p0) / T(p)``; for weak scaling (a problem that grows with the
+    ranks), the scaled speedup is ``p T(p0) / T(p)``; the smallest comm
+    size ``p0`` is taken as perfectly efficient. The efficiency is the
+    speedup over ``p``. The serial fraction is from Amdahl's law for
+    strong scaling and from Gustafson's law for weak scaling.
+    """
+    sizes = sorted(times)
+    t = [times[p] for p in sizes]
+    p0, t0 = sizes[0], t[0]
+    if mode == 'strong':
+        speedup = [p0 * t0 / ti if ti > 0 else None for ti in t]
+        fraction = fit_amdahl(sizes, t)
+        law = 'amdahl'
+    else:
+        speedup = [p * t0 / ti if ti > 0 else None for p, ti in zip(sizes, t)]
+        fraction = fit_gustafson(sizes, [s or 0. for s in speedup])
+        law = 'gustafson'
+    efficiency = [None if s is None else s / p for p, s in zip(sizes, speedup)]
+    return {'mode' : mode, 'commsize' : sizes, 'time' : t, 'speedup' : speedup,
+            'efficiency' : efficiency, 'serial_fraction' : fraction, 'law' : law}
+
+def analyze(variant):
+    """
+    The scaling tables of the tags of a scaling benchmark, as stored in
+    the result of the test variant.
+    """
+    mode = variant['attrs']['scaling']['mode']
+    return dict((tag, scaling_table(times, mode)) for tag, times in points(variant).items())
+
+def format_table(test, tag, table):
+    """
+    Return the lines of the scaling table of a tag.
+    """
+    fraction = table['serial_fraction']
+    lines = ["%s [%s]: %s scaling, serial fraction %s (%s)" % (
+             test, tag, table['mode'], '-' if fraction is None else '%.4f' % fraction,
+             table['law'])]
+    lines.append("%10s %12s %10s %10s" % ('commsize', 'time', 'speedup', 'efficiency'))
+    for p, t, s, e in zip(table['commsize'], table['time'], table['speedup'], table['efficiency']):
+        lines.append("%10d %12.6g %10s %10s" % (p, t, '-' if s is None else '%.3f' % s,
+                                                 '-' if e is None else '%.3f' % e))
+    return lines
+
+def main(args=None):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='python -m runtests.scaling',
+                            description="print the scaling tables of the scaling benchmarks")
+    parser.add_argument('paths', nargs='*', default=[os.path.join('build', 'benchmarks')],
+                        help="the benchmark results, files or directories; "
+                             "default is build/benchmarks")
+    args = parser.parse_args(args)
+
+    filenames = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(glob(os.path.join(path, '*.json'))))
+        else:
+            filenames.append(path)
+
+    for filename in filenames:
+        with open(filename, 'r') as ff:
+            result = json.load(ff)
+        module = os.path.basename(filename)[:-len('.json')].rsplit('.', 1)[0]
+        for name in result.get('tests', []):
+            variant = result[name]
+            if 'scaling' not in variant:
+                continue
+            for tag in sorted(variant['scaling']):
+                for line in format_table(module + '.' + variant['testname'], tag,
+                                         variant['scaling'][tag]):
+                    print(line)
+                print('')
+
+if __name__ == "__main__":
+    main()
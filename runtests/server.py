@@ -0,0 +1,279 @@
+"""
+    A persistent test server that keeps the heavy dependencies of a
+    project imported, and runs each test session in a forked child.
+
+    The client sends a JSON request on a Unix socket; the output of the
+    session is streamed back on the same socket, followed by
+    :data:`MARKER` and the exit code.
+
+    Sessions build the project before they run the tests, and all of them
+    share the installation in ``build/testenv``; hence the server runs
+    one session at a time, and other clients wait in the listen queue.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import select
+import hashlib
+import tempfile
+import traceback
+
+MARKER = b'\0runtests-exit '
+
+# the exit status of a session child asking the server to restart, and
+# the value returned by send_request in that case
+RESTART_STATUS = 75
+RESTART = -1
+
+def get_socket_path(root):
+    """
+    Return the path of the server socket of the project at ``root``.
+
+    This is ``build/runtests.sock`` unless that path is too long for a
+    Unix socket, in which case a path in the temporary directory is used.
+    """
+    path = os.path.join(root, 'build', 'runtests.sock')
+    if len(path) < 100:
+        return path
+    digest = hashlib.sha1(root.encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), 'runtests-%s.sock' % digest)
+
+def connect(path):
+    """
+    Connect to the server at ``path``; return None if it is not running.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+def send_request(sock, request, stream=None):
+    """
+    Send a request to the server, and copy the output of the session to
+    ``stream`` as it arrives.
+
+    Returns
+    -------
+    int
+        the exit code of the session, :data:`RESTART` if the session
+        changed the installation and the server is restarting, or None if
+        the server dropped the request without an answer (e.g. because
+        it is restarting)
+    """
+    if stream is None:
+        stream = getattr(sys.stdout, 'buffer', sys.stdout)
+
+    try:
+        sock.sendall(json.dumps(request).encode() + b'\n')
+    except socket.error:
+        return None
+
+    # hold back enough bytes to strip the trailing marker
+    tail = b''
+    received = False
+    while True:
+        try:
+            data = sock.recv(65536)
+        except socket.error:
+            data = b''
+        if not data:
+            break
+        received = True
+        tail += data
+        keep = len(MARKER) + 16
+        if len(tail) > keep:
+            stream.write(tail[:-keep])
+            stream.flush()
+            tail = tail[-keep:]
+    sock.close()
+
+    if not received:
+        return None
+
+    i = tail.rfind(MARKER)
+    if i < 0:
+        stream.write(tail)
+        stream.flush()
+        return 1
+    stream.write(tail[:i])
+    stream.flush()
+    value = tail[i + len(MARKER):]
+    if value == b'restart':
+        return RESTART
+    return int(value)
+
+class TestServer(object):
+    """
+    A server running test sessions for a :class:`~runtests.tester.Tester`.
+
+    Each request is handled in a forked child, which calls
+    ``tester._serve_request(request, server)`` with its stdout and stderr
+    redirected to the client; hence every session starts from the module
+    state of the server, with only the preloaded modules imported.
+    Requests are handled one at a time.
+
+    The server re-executes itself when a watched directory (the site
+    directory of the installation) changes and a module imported by the
+    server was loaded from there. A session that finds so after its build
+    exits with :data:`RESTART_STATUS`, and the client sends the request
+    again without building.
+
+    Parameters
+    ----------
+    tester : Tester
+        the tester that runs the sessions
+    path : str
+        the path of the Unix socket to listen on
+    watch_dirs : list of str
+        the directories to watch for changes
+    preload : list of str, optional
+        the names of the modules to import before serving
+    idle_timeout : float, optional
+        exit after this many seconds without requests
+    """
+    def __init__(self, tester, path, watch_dirs, preload=(), idle_timeout=3600.):
+        self.tester = tester
+        self.path = path
+        self.watch_dirs = [os.path.abspath(d) for d in watch_dirs]
+        self.preload = list(preload)
+        self.idle_timeout = idle_timeout
+        self.stamp = None
+
+    def _stamp(self):
+        """
+        A summary of the watched directories that changes if any file
+        in there is added, removed or modified.
+        """
+        stamp = []
+        for d in self.watch_dirs:
+            for dirpath, dirnames, filenames in os.walk(d):
+                dirnames[:] = [dn for dn in dirnames if dn != '__pycache__']
+                for fn in filenames:
+                    if fn.endswith('.pyc'):
+                        continue
+                    try:
+                        st = os.stat(os.path.join(dirpath, fn))
+                    except OSError:
+                        continue
+                    stamp.append((dirpath, fn, st.st_mtime, st.st_size))
+        return sorted(stamp)
+
+    def _has_watched_modules(self):
+        """
+        Whether a module imported by the server was loaded from a watched
+        directory.
+        """
+        for module in list(sys.modules.values()):
+            filename = getattr(module, '__file__', None)
+            if filename is None:
+                continue
+            filename = os.path.abspath(filename)
+            for d in self.watch_dirs:
+                if filename.startswith(d + os.sep):
+                    return True
+        return False
+
+    def installation_changed(self):
+        """
+        Whether a watched directory changed since the last check of the
+        server, and a module imported by the server was loaded from there.
+        """
+        return self._stamp() != self.stamp and self._has_watched_modules()
+
+    def _restart(self, sock):
+        sock.close()
+        os.unlink(self.path)
+        print("Installation changed; restarting the server")
+        sys.stdout.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def serve_forever(self):
+        """
+        Import the preloaded modules, and serve requests until a stop
+        request is received or the server is idle for too long.
+        """
+        for name in self.preload:
+            __import__(name)
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        sock.listen(8)
+        print("Serving tests on %s" % self.path)
+        sys.stdout.flush()
+
+        self.stamp = self._stamp()
+        last_request = time.time()
+        try:
+            while True:
+                ready, _, _ = select.select([sock], [], [], 1.0)
+                new_stamp = self._stamp()
+                if new_stamp != self.stamp:
+                    self.stamp = new_stamp
+                    if self._has_watched_modules():
+                        self._restart(sock)
+
+                if not ready:
+                    if time.time() - last_request > self.idle_timeout:
+                        break
+                    continue
+
+                conn, _ = sock.accept()
+                last_request = time.time()
+                if not self._handle(sock, conn):
+                    break
+        finally:
+            sock.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _handle(self, sock, conn):
+        """
+        Handle one request; return False on a stop request.
+
+        This waits for the session to finish: the sessions build into the
+        same installation, so they must not run concurrently.
+        """
+        line = conn.makefile('rb').readline()
+        try:
+            request = json.loads(line.decode())
+        except ValueError:
+            conn.close()
+            return True
+
+        if request.get('stop'):
+            conn.sendall(MARKER + b'0')
+            conn.close()
+            return False
+
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                sock.close()
+                os.dup2(conn.fileno(), 1)
+                os.dup2(conn.fileno(), 2)
+                code = self.tester._serve_request(request, self)
+            except SystemExit as e:
+                code = e.code
+            except:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code if isinstance(code, int) else 1)
+
+        _, status = os.waitpid(pid, 0)
+        code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+        if code == RESTART_STATUS:
+            conn.sendall(MARKER + b'restart')
+        else:
+            conn.sendall(MARKER + str(code).encode())
+        conn.close()
+        return True
@@ -1,6 +1,9 @@
-from .coverage import Coverage
-from .benchmark import BenchmarkLogger, BenchmarkTimer
-import pytest
+from .benchmark import BenchmarkLogger
+from .build import SourceManifest, BuildCache, BuildMonitor, CompilerCache
+from .build import read_install_record, unshare_tree, get_cpu_count
+from .durations import DurationStore
+from .workers import WorkerPool
+from .impact import ImpactMap, get_changed_files
 import traceback
 import sys
 import os
@@ -8,17 +11,60 @@ import contextlib
 import shutil
 import subprocess
 import time
+import json
 
-def get_git_revision_short_hash():
+def get_git_revision_short_hash(root=None):
     null = open(os.devnull, 'w')
-    toret = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=null)
+    toret = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=null, cwd=root)
     return toret.strip().decode()
 
-def get_source_version(module):
+def get_source_version(module, root=None):
     null = open(os.devnull, 'w')
-    toret = subprocess.check_output(['python', 'setup.py', '--version'], stderr=null)
+    toret = subprocess.check_output([sys.executable, 'setup.py', '--version'], stderr=null, cwd=root)
     return toret.strip().decode()
 
+def _source_version_key(root):
+    """
+    The mtimes of the files that a change of the source version would touch:
+    setup.py, the git HEAD and the branch HEAD refers to.
+    """
+    paths = [os.path.join(root, 'setup.py'), os.path.join(root, '.git', 'HEAD')]
+    try:
+        with open(paths[-1], 'r') as ff:
+            head = ff.read().strip()
+        if head.startswith('ref:'):
+            paths.append(os.path.join(root, '.git', head[4:].strip()))
+    except IOError:
+        pass
+
+    key = []
+    for path in paths:
+        try:
+            key.append(os.stat(path).st_mtime)
+        except OSError:
+            key.append(None)
+    return key
+
+def _parse_parallel(value):
+    """
+    Parse the number of build jobs; 'auto' is the number of available CPUs.
+    """
+    if value == 'auto':
+        return get_cpu_count()
+    return int(value)
+
+def _get_raw_option(argv, name, default=None):
+    """
+    Return the value of the option ``name`` on a command line that is not
+    parsed yet.
+    """
+    for i, arg in enumerate(argv):
+        if arg == name and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith(name + '='):
+            return arg[len(name) + 1:]
+    return default
+
 def _make_clean_dir(path):
     print("Purging %s ..." % path)
     try:
@@ -40,19 +86,14 @@ class Tester(object):
         $ python runtests.py
         $ python runtests.py --bench
     """
-    @pytest.fixture(scope="session")
-    def session_benchmark(self, request):
+    def _make_benchmark_logger(self, config):
         """
-        A session-wide benchmark to time and record benchmarks,
-        corresponding to :class:`BenchmarkLogger`
-
-        This class acts as a logger to store and save all benchmark
-        results from the testing session.
+        Return the :class:`BenchmarkLogger` of the session
         """
         comm = self.comm if hasattr(self, 'comm') else None
 
         # determine the output dir
-        benchdir = request.config.getoption('bench_dir')
+        benchdir = config.getoption('bench_dir')
         if benchdir is not None:
             benchdir = os.path.join(self.ROOT_DIR, benchdir)
             benchdir = os.path.relpath(benchdir, self.TEST_DIR)
@@ -61,37 +102,25 @@ class Tester(object):
 
         # initialize
         kws = {'version':self.source_version, 'git_hash':self.source_git_hash}
-        benchmark = BenchmarkLogger(benchdir, comm=comm, **kws)
-
-        # yield to user
-        yield benchmark
-
-        # finalize by reporting (needs to be COLLECTIVE call)
-        benchmark.report()
-
-    @staticmethod
-    @pytest.fixture(scope="function")
-    def benchmark(session_benchmark, request):
-        """
-        An object to benchmark an individual test function. When called,
-        this object acts a context manager that does the timing.
-
-        This object has a ``attrs`` dict that the user can add meta-data to,
-        and it reports its results to the ``session_benchmark`` object.
-        """
-        # the qualified name of the function being run
-        func = request.node.function
-        mod, name = func.__module__, func.__name__
-        qualname = mod + '.' + name
-
-        # initialize the timer
-        timer = BenchmarkTimer(qualname, request.node, comm=session_benchmark.comm)
-
-        # return the session-wide benchmark
-        yield timer
-
-        # add result to total
-        session_benchmark.add_benchmark(timer)
+        kws['reduce'] = config.getoption('bench_reduce')
+        history = config.getoption('bench_history')
+        if history is None:
+            kws['history'] = os.path.join(benchdir, 'history.db')
+        elif history != '':
+            history = os.path.join(self.ROOT_DIR, history)
+            kws['history'] = os.path.relpath(history, self.TEST_DIR)
+
+        # a baseline is a path relative to the root dir, or a git hash
+        baseline = config.getoption('bench_compare')
+        if baseline is not None and os.path.exists(os.path.join(self.ROOT_DIR, baseline)):
+            baseline = os.path.relpath(os.path.join(self.ROOT_DIR, baseline), self.TEST_DIR)
+        kws['baseline'] = baseline
+        kws['threshold'] = config.getoption('bench_threshold')
+        kws['memory'] = config.getoption('bench_memory')
+        kws['profile'] = config.getoption('bench_profile')
+
+        self._bench_logger = BenchmarkLogger(benchdir, comm=comm, **kws)
+        return self._bench_logger
 
     @staticmethod
     def pytest_addoption(parser):
@@ -104,7 +133,18 @@ class Tester(object):
         parser.addoption("--clean-build", action="store_true", default=False,
                         help="cleanly build, purging the build directory first. ")
 
-        parser.addoption("--parallel", default=0, type=int, help="run a parallel build")
+        parser.addoption("--incremental", action="store_true", default=False,
+                        help="keep build/testenv and only reinstall the source files changed since the last build")
+
+        parser.addoption("--build-cache", action="store_true", default=False,
+                        help="reuse a cached installation of an identical source tree from build/cache")
+
+        parser.addoption("--parallel", default=0, type=_parse_parallel,
+                        help="run a parallel build with N jobs; 'auto' uses all available CPUs")
+        parser.addoption("--compile-pool", action="store_true", default=False,
+                        help="compile extension sources in a pool of --parallel workers "
+                             "(all available CPUs if --parallel is not given), "
+                             "for setup.py scripts that do not support -j")
         parser.addoption("--enable-debug", default=False, action="store_true", help="Compile with debugging information. May need --clean-build for a clean rebuild of all targets.")
 
         parser.addoption("--build-only", action="store_true", default=False,
@@ -113,12 +153,44 @@ class Tester(object):
         parser.addoption("--shell", action="store_true", default=False,
                         help="start a shell with the installed package properly set up in the path")
 
+        parser.addoption("--server", action="store_true", default=False,
+                        help="run the tests in a persistent server process, starting it if needed; "
+                             "the installation is kept between runs, as with --incremental")
+
+        parser.addoption("--server-preload", default="",
+                        help="comma separated modules for the server to keep imported, e.g. numpy,scipy")
+
+        parser.addoption("--server-stop", action="store_true", default=False,
+                        help="stop the persistent server and exit")
+
+        parser.addoption("--server-daemon", action="store_true", default=False,
+                        help="run process as the persistent server")
+
+        parser.addoption("--server-site-dir", default=None, help="site-dir in the server")
+
         parser.addoption("--show-build-log", action="store_true",
                         help="show build output rather than using a log file")
 
+        parser.addoption("--workers", default=1, type=_parse_parallel,
+                        help="run the tests in N forked worker processes; 'auto' uses all available CPUs")
+
+        parser.addoption("--order", default='default',
+                        choices=['default', 'duration', 'failed-first'],
+                        help="the order to run the tests: 'duration' runs the longest tests first, "
+                             "'failed-first' runs the tests that failed last time first; "
+                             "based on build/durations.json")
+
         parser.addoption("--with-coverage", action="store_true", default=False,
                         help="report coverage of project code to a .coverage file")
 
+        parser.addoption("--record-impact", action="store_true", default=False,
+                        help="record the source files executed by each test to build/impact.json "
+                             "(implies --with-coverage)")
+
+        parser.addoption("--affected", action="store_true", default=False,
+                        help="only run the tests affected by the files changed since "
+                             "the revision recorded by --record-impact")
+
         parser.addoption("--html-cov", action="store_true", default=False,
                         help="write html coverage reports to build/coverage")
 
@@ -132,9 +204,36 @@ class Tester(object):
         parser.addoption("--bench", action="store_true", default=False,
                         help="only run tests that use the 'benchmark' fixture")
 
+        parser.addoption("--bench-reduce", action="store_true", default=False,
+                        help="only write the statistics of the benchmark samples of each rank, "
+                             "not the samples")
 
-    @staticmethod
-    def pytest_collection_modifyitems(session, config, items):
+        parser.addoption("--bench-history", type=str,
+                        help="the database to append the benchmark results of each run to; "
+                             "default is history.db in the benchmark dir, '' to disable")
+
+        parser.addoption("--bench-compare", type=str,
+                        help="compare the benchmark results to a baseline: a directory or file "
+                             "of results, or the git hash of a run in the history")
+
+        parser.addoption("--bench-threshold", type=float, default=0.05,
+                        help="the relative change of a benchmark time that is a regression or "
+                             "an improvement; default is 0.05")
+
+        parser.addoption("--bench-memory", action="store_true", default=False,
+                        help="also record the peak RSS increase and the peak Python allocations "
+                             "of each benchmark tag")
+
+        parser.addoption("--bench-profile", choices=['cprofile', 'perf-stat', 'sample'],
+                        help="profile each benchmark tag: with cProfile, saving a .pstats file "
+                             "per tag and rank; with the hardware counters of perf_event; "
+                             "or with a sampling profiler")
+
+        parser.addoption("--bench-fail-on-regression", action="store_true", default=False,
+                        help="fail the run if a benchmark regressed compared to --bench-compare")
+
+
+    def pytest_collection_modifyitems(self, session, config, items):
         """
         Modify the ordering of tests, such that the ordering will be
         well-defined across all ranks running
@@ -151,6 +250,165 @@ class Tester(object):
         # sort the tests
         items[:] = sorted(items, key=lambda x: str(x))
 
+        # only run the tests affected by changes
+        if config.getoption('affected'):
+            selected = set(self._get_affected(item.nodeid for item in items))
+            deselected = [item for item in items if item.nodeid not in selected]
+            items[:] = [item for item in items if item.nodeid in selected]
+            if len(deselected) > 0:
+                config.hook.pytest_deselected(items=deselected)
+                self._deselected += len(deselected)
+
+        # reorder based on the durations and outcomes of previous runs
+        order = config.getoption('order')
+        if order != 'default':
+            nodeids = self._get_order([item.nodeid for item in items], order)
+            position = dict((nodeid, i) for i, nodeid in enumerate(nodeids))
+            items[:] = sorted(items, key=lambda x: position[x.nodeid])
+
+    def _get_order(self, nodeids, order):
+        """
+        Return the node ids in the order to run them; computed on the root
+        rank, such that all ranks agree.
+        """
+        comm = self.comm if hasattr(self, 'comm') else None
+        if comm is None or comm.rank == 0:
+            nodeids = self.durations.order(nodeids, order)
+        else:
+            nodeids = None
+        if comm is not None:
+            nodeids = comm.bcast(nodeids)
+        return nodeids
+
+    def _get_affected(self, nodeids):
+        """
+        Return the node ids affected by the changes since the revision
+        in the impact map; computed on the root rank.
+        """
+        nodeids = list(nodeids)
+        comm = self.comm if hasattr(self, 'comm') else None
+        if comm is None or comm.rank == 0:
+            impact = ImpactMap(self.IMPACT_FILE, self.PROJECT_MODULE)
+            if impact.git_hash is None:
+                print("No impact recorded with --record-impact; running all tests")
+                affected = nodeids
+            else:
+                changed = get_changed_files(self.ROOT_DIR, impact.git_hash)
+                affected = impact.affected(nodeids, changed)
+        else:
+            affected = None
+        if comm is not None:
+            affected = comm.bcast(affected)
+        return affected
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        """
+        Attribute coverage to the test, for ``--record-impact``.
+        """
+        if self._coverage is not None:
+            self._coverage.switch_context(nodeid)
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        if self._coverage is not None:
+            self._coverage.switch_context('')
+
+    def _run_workers(self, session):
+        """
+        Run the tests in worker processes if requested with ``--workers``;
+        otherwise return None to fall back to the default loop. Called
+        first in ``pytest_runtestloop``.
+        """
+        nworkers = session.config.getoption('workers')
+        if nworkers <= 1 or session.config.option.collectonly:
+            return None
+
+        if session.testsfailed and not session.config.option.continue_on_collection_errors:
+            raise session.Interrupted("%d errors during collection" % session.testsfailed)
+
+        pool = WorkerPool(session, nworkers, self.durations,
+                          on_fork=self._begin_worker, on_exit=self._end_worker)
+        try:
+            pool.run()
+        finally:
+            # merge the benchmarks of all workers into a single report,
+            # also when the session stopped early
+            results = []
+            for payload in pool.messages.get('benchmark', []):
+                results.extend(payload)
+            if len(results) > 0:
+                logger = self._make_benchmark_logger(session.config)
+                results = sorted(results, key=lambda x: (x[0].rsplit('_', 1)[0], x[1]['testname']))
+                for name, r in results:
+                    logger.add_result(name.rsplit('_', 1)[0], r)
+                logger.report()
+        return True
+
+    def pytest_runtest_logreport(self, report):
+        """
+        Accumulate the duration and outcome of each test.
+        """
+        duration, failed = self._run_durations.get(report.nodeid, (0., False))
+        self._run_durations[report.nodeid] = (duration + report.duration,
+                                              failed or report.failed)
+
+    def _finish_session(self, session):
+        """
+        Save the durations and outcomes of the tests that ran; called last
+        in ``pytest_sessionfinish``, after the session fixtures are
+        finalized, as they report the benchmarks.
+        """
+        if (self._bench_logger is not None and self._bench_logger.regressions > 0
+            and session.config.getoption('bench_fail_on_regression')
+            and session.exitstatus == 0):
+            session.exitstatus = 1
+
+        # nothing left to run after deselecting (e.g. nothing affected by
+        # the changes) is a success
+        if self._deselected > 0 and session.exitstatus == 5:
+            session.exitstatus = 0
+
+        if len(self._run_durations) == 0:
+            return
+        comm = self.comm if hasattr(self, 'comm') else None
+        if comm is None or comm.rank == 0:
+            for nodeid in self._run_durations:
+                duration, failed = self._run_durations[nodeid]
+                self.durations.record(nodeid, duration, failed)
+            self._save_durations()
+
+    def _save_durations(self):
+        self.durations.save()
+
+    def pytest_terminal_summary(self, terminalreporter):
+        """
+        Print the benchmark changes compared to --bench-compare.
+        """
+        if self._bench_logger is None or self._bench_logger.changes is None:
+            return
+        from .compare import format_changes
+        terminalreporter.section('benchmark comparison')
+        for line in format_changes(self._bench_logger.changes,
+                                   self._bench_logger.baseline_description):
+            terminalreporter.write_line(line)
+
+    @property
+    def durations(self):
+        """
+        The :class:`DurationStore` of previous runs, in ``build/durations.json``
+        """
+        if not hasattr(self, '_durations'):
+            self._durations = DurationStore(self.DURATIONS_FILE)
+        return self._durations
+
+    def _begin_worker(self, channel):
+        self._worker = channel
+        if self._coverage is not None:
+            self._coverage.begin_worker(channel.index)
+
+    def _end_worker(self, channel):
+        if self._coverage is not None:
+            self._coverage.end_worker()
+
     def __init__(self, package_file, module,
             extra_path =['/usr/lib/ccache', '/usr/lib/f90cache',
                          '/usr/local/lib/ccache', '/usr/local/lib/f90cache']
@@ -173,6 +431,9 @@ class Tester(object):
         self.DEST_DIR = os.path.join(self.ROOT_DIR, 'build', 'testenv')
         self.BUILD_DIR = os.path.join(self.ROOT_DIR, 'build')
         self.BENCHMARK_DIR = os.path.join(self.ROOT_DIR, 'build', 'benchmarks')
+        self.INSTALL_RECORD = os.path.join(self.DEST_DIR, 'tmp_install_log.txt')
+        self.MANIFEST_FILE = os.path.join(self.DEST_DIR, 'source_manifest.json')
+        self.BUILD_CACHE_DIR = os.path.join(self.ROOT_DIR, 'build', 'cache')
 
         from distutils.sysconfig import get_python_lib
         site_dir = get_python_lib(prefix=self.DEST_DIR, plat_specific=True)
@@ -181,19 +442,73 @@ class Tester(object):
         # the true site dir will be found after build_project.
         self.SITE_DIRS = [site_dir, site_dir_noarch]
 
+        self.SOURCE_VERSION_CACHE = os.path.join(self.ROOT_DIR, 'build', 'source_version.json')
+        self.DURATIONS_FILE = os.path.join(self.ROOT_DIR, 'build', 'durations.json')
+        self.IMPACT_FILE = os.path.join(self.ROOT_DIR, 'build', 'impact.json')
+
+        # the worker channel, in a worker process of --workers
+        self._worker = None
+        self._coverage = None
+        self._run_durations = {}
+        self._deselected = 0
+        self._bench_logger = None
 
-        # the source version
+    @property
+    def source_version(self):
+        """
+        The version of the source package, as reported by ``setup.py --version``.
+
+        This is computed on first use, and cached in ``build/`` until the mtime
+        of setup.py or the git HEAD changes. MPI ranks receive the value
+        computed by the launcher via the environment.
+        """
+        if not hasattr(self, '_source_version'):
+            if 'RUNTESTS_SOURCE_VERSION' in os.environ:
+                self._source_version = os.environ['RUNTESTS_SOURCE_VERSION'] or None
+            else:
+                self._source_version = self._get_cached_source_version()
+        return self._source_version
+
+    @property
+    def source_git_hash(self):
+        """
+        The short git hash of the source package; computed on first use.
+        """
+        if not hasattr(self, '_source_git_hash'):
+            if 'RUNTESTS_SOURCE_GIT_HASH' in os.environ:
+                self._source_git_hash = os.environ['RUNTESTS_SOURCE_GIT_HASH'] or None
+            else:
+                try:
+                    self._source_git_hash = get_git_revision_short_hash(self.ROOT_DIR)
+                except:
+                    self._source_git_hash = None
+        return self._source_git_hash
+
+    def _get_cached_source_version(self):
+        """
+        Return the source version, reusing the value cached in ``build/``
+        if setup.py and the git HEAD are unchanged.
+        """
+        key = _source_version_key(self.ROOT_DIR)
         try:
-            self.source_version = get_source_version(module)
-        except:
-            self.source_version = None
+            with open(self.SOURCE_VERSION_CACHE, 'r') as ff:
+                cached = json.load(ff)
+            if cached['key'] == key:
+                return cached['version']
+        except (IOError, ValueError, KeyError):
+            pass
 
-        # the git str
         try:
-            self.source_git_hash = get_git_revision_short_hash()
+            version = get_source_version(self.PROJECT_MODULE, self.ROOT_DIR)
         except:
-            self.source_git_hash = None
+            version = None
 
+        try:
+            with open(self.SOURCE_VERSION_CACHE, 'w') as ff:
+                json.dump({'key' : key, 'version' : version}, ff)
+        except IOError:
+            pass
+        return version
 
     def main(self, argv):
         """
@@ -204,6 +519,11 @@ class Tester(object):
         argv : list of str
             the command-line arguments -- should be equal to ``sys.argv[1:]``
         """
+        # forward the command line to the persistent server before paying
+        # for the pytest startup; the server builds and runs the tests
+        if '--server' in argv and not any(a in argv for a in ['-h', '--help', '--shell']):
+            sys.exit(self._run_in_server(argv))
+
         # initialize the pytest configuration from the command-line args
         config = self._get_pytest_config(argv)
         args = config.known_args_namespace
@@ -212,12 +532,54 @@ class Tester(object):
         if args.help:
             return config.hook.pytest_cmdline_main(config=config)
 
-        # verify bench was provided if a benchmarks dir was provided
+        self._check_bench_args(config)
+
+        if args.server_daemon:
+            self._serve(args)
+
+        if args.server_stop:
+            self._stop_server()
+            sys.exit(0)
+
+        # make the test directory exists, build the project
+        self._prepare(config)
+
+        if args.shell:
+            self._do_shell(args, config)
+
+        if args.build_only:
+            sys.exit(0)
+
+        # extract the coverage-related options
+        covargs = self._get_coverage_args(args)
+
+        # run the tests
+        try:
+            code = None
+            with self._run_from_testdir(args):
+                code = self._test(config, **covargs)
+        except:
+            traceback.print_exc()
+            sys.exit(1)
+
+        sys.exit(code)
+
+    def _check_bench_args(self, config):
+        """
+        Verify that ``--bench`` was given with the options that need it.
+        """
         benchdir = config.getoption('bench_dir')
         if benchdir is not None and not config.getoption('bench'):
             raise ValueError("please specify '--bench' on the command-line to run benchmarks")
+        if config.getoption('bench_compare') is not None and not config.getoption('bench'):
+            raise ValueError("please specify '--bench' on the command-line to compare benchmarks")
 
-        # make the test directory exists
+    def _prepare(self, config):
+        """
+        Initialize the directories, build the project and point the test
+        paths to the installation.
+        """
+        args = config.known_args_namespace
         self._initialize_dirs(args)
 
         # import project from system path
@@ -227,35 +589,171 @@ class Tester(object):
         # build the project, returning the site directory
         if not args.no_build:
             site_dir = self._do_build(args)
+        else:
+            site_dir = self._find_site_dir()
 
-        if not args.bench:
+        if not args.bench and site_dir is not None:
             # tests are part of package, thus installed; we use those
             # but benchs are not part of package, thus not installed.
             config.args = self._fix_test_paths(site_dir, config.args)
 
-        if args.shell:
-            self._do_shell(args, config)
+    def _run_in_server(self, argv):
+        """
+        Run the tests in the persistent server, starting it if it
+        is not running; return the exit code.
+        """
+        from .server import get_socket_path, connect, send_request, RESTART
+
+        if sys.stdout.isatty() and not any(a.startswith('--color') for a in argv):
+            argv = argv + ['--color=yes']
+
+        request = {'argv' : argv, 'cwd' : os.getcwd(), 'built' : False}
+        request['columns'] = shutil.get_terminal_size().columns \
+                if hasattr(shutil, 'get_terminal_size') else 80
+
+        path = get_socket_path(self.ROOT_DIR)
+        p = None
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            sock = connect(path)
+            if sock is None:
+                if p is None:
+                    p = self._start_server(_get_raw_option(argv, '--server-preload', ''))
+                elif p.poll() is not None:
+                    break
+                time.sleep(0.05)
+                continue
+
+            # the server drops requests while restarting; try again
+            code = send_request(sock, request)
+            if code == RESTART:
+                # the build changed modules the server had imported;
+                # run again in the restarted server, without building
+                request['built'] = True
+                deadline = time.time() + 60
+            elif code is not None:
+                return code
+            time.sleep(0.05)
+
+        print("Failed to run the tests in the server, see build/server.log")
+        return 1
+
+    def _start_server(self, preload):
+        """
+        Start the persistent server in the background; returns the process.
+        """
+        cmdargs = [sys.executable, sys.argv[0], '--server-daemon']
+        cmdargs.append('--server-preload=' + preload)
+        site_dir = self._find_site_dir()
+        if site_dir is not None:
+            cmdargs.append('--server-site-dir=' + site_dir)
+
+        if not os.path.exists(self.BUILD_DIR):
+            os.makedirs(self.BUILD_DIR)
+
+        print("Starting the test server, see build/server.log...")
+        with open(os.path.join(self.BUILD_DIR, 'server.log'), 'w') as log:
+            return subprocess.Popen(cmdargs, stdout=log, stderr=log,
+                                    cwd=self.ROOT_DIR, preexec_fn=os.setsid)
+
+    def _stop_server(self):
+        """
+        Stop the persistent server, if it is running.
+        """
+        from .server import get_socket_path, connect, send_request
+
+        sock = connect(get_socket_path(self.ROOT_DIR))
+        if sock is not None:
+            send_request(sock, {'stop' : True})
+            print("Stopped the test server")
+
+    def _serve(self, args):
+        """
+        Run as the persistent server; does not return.
+        """
+        from .server import TestServer, get_socket_path
+
+        if args.server_site_dir:
+            # same as _do_build: replace the project directory with the site dir
+            sys.path.pop(0)
+            sys.path.insert(0, args.server_site_dir)
+
+        # the client does not import pytest and coverage; the sessions
+        # fork from the server with them imported
+        from . import plugin, coverage
+
+        preload = [m.strip() for m in args.server_preload.split(',') if m.strip()]
+        server = TestServer(self, get_socket_path(self.ROOT_DIR),
+                            watch_dirs=[d for d in self.SITE_DIRS if os.path.exists(d)],
+                            preload=preload)
+        server.serve_forever()
+        sys.exit(0)
+
+    def _serve_request(self, request, server):
+        """
+        Run one test session on behalf of the persistent server; this runs
+        in a forked child of the server. Returns the exit code, or
+        :data:`~runtests.server.RESTART_STATUS` if the build changed the
+        modules imported by the server.
+        """
+        from .server import RESTART_STATUS
+
+        try:
+            import importlib
+            importlib.invalidate_caches()
+        except AttributeError:
+            pass
+
+        os.chdir(request['cwd'])
+        os.environ['COLUMNS'] = str(request['columns'])
+        config = self._get_pytest_config(list(request['argv']))
+        args = config.known_args_namespace
+
+        self._check_bench_args(config)
+
+        # keep the installation of the previous session; only the source
+        # files that changed since then are installed, and the project is
+        # rebuilt only if that is not enough
+        args.incremental = True
+
+        if request['built']:
+            args.no_build = True
+
+        self._prepare(config)
+
+        if server.installation_changed():
+            return RESTART_STATUS
 
         if args.build_only:
-            sys.exit(0)
+            return 0
 
+        covargs = self._get_coverage_args(args)
 
-        # extract the coverage-related options
+        with self._run_from_testdir(args):
+            return self._test(config, **covargs)
+
+    def _find_site_dir(self):
+        """
+        Return the site directory the package is installed to, or None.
+        """
+        for site_dir in self.SITE_DIRS:
+            if os.path.exists(os.path.join(site_dir, self.PROJECT_MODULE)):
+                return site_dir
+        return None
+
+    def _get_coverage_args(self, args):
+        """
+        Extract the keywords of :class:`Coverage` from the command-line
+        arguments.
+        """
         covargs = {}
-        covargs['with_coverage'] = args.with_coverage
+        covargs['with_coverage'] = args.with_coverage or args.record_impact
         covargs['config_file'] = args.cov_config
         covargs['html_cov'] = args.html_cov
-
-        # run the tests
-        try:
-            code = None
-            with self._run_from_testdir(args):
-                code = self._test(config, **covargs)
-        except:
-            traceback.print_exc()
-            sys.exit(1)
-
-        sys.exit(code)
+        if args.record_impact:
+            covargs['impact'] = ImpactMap(self.IMPACT_FILE, self.PROJECT_MODULE,
+                                          git_hash=self.source_git_hash)
+        return covargs
 
     def _test(self, config, **kwargs):
         """
@@ -269,8 +767,10 @@ class Tester(object):
         kwargs :
             additional keywords to pass to the Coverage class
         """
+        from .coverage import Coverage
         try:
-            with Coverage(self.PROJECT_MODULE, root=self.ROOT_DIR, **kwargs):
+            self._coverage = Coverage(self.PROJECT_MODULE, root=self.ROOT_DIR, **kwargs)
+            with self._coverage:
                 config.pluginmanager.check_pending()
                 return config.hook.pytest_cmdline_main(config=config)
         finally:
@@ -281,7 +781,30 @@ class Tester(object):
         Build the project and return the site directory in the
         build/ directory
         """
-        self._build_project(args)
+        if args.build_cache:
+            cache = BuildCache(self.BUILD_CACHE_DIR)
+            key = cache.key(self.ROOT_DIR, debug=args.enable_debug)
+        else:
+            cache = None
+
+        if cache is not None and cache.restore(key, self.DEST_DIR):
+            print("Restored build %s from %s" % (key[:10], self.BUILD_CACHE_DIR))
+        else:
+            if cache is not None:
+                # the installation may share files with a cache entry
+                unshare_tree(self.DEST_DIR)
+
+            if not args.incremental:
+                self._build_project(args)
+            elif not self._install_changed_files(args):
+                # snapshot before building, such that edits made during
+                # the build are picked up by the next run
+                manifest = SourceManifest.scan(self.ROOT_DIR)
+                self._build_project(args)
+                manifest.save(self.MANIFEST_FILE)
+
+            if cache is not None:
+                cache.store(key, self.DEST_DIR)
 
         for site_dir in self.SITE_DIRS:
             if os.path.exists(os.path.join(site_dir, self.PROJECT_MODULE)):
@@ -340,8 +863,9 @@ class Tester(object):
         command-line arguments
         """
         import _pytest.config as _config
+        from .plugin import TesterPlugin
 
-        plugins = [self]
+        plugins = [self, TesterPlugin(self)]
 
         # disable pytest-cov
         argv += ['-p', 'no:pytest_cov']
@@ -375,11 +899,54 @@ class Tester(object):
         if args.clean_build:
             _make_clean_dir(self.BUILD_DIR)
 
-        if not args.no_build:
+        if not args.no_build and not args.incremental:
             _make_clean_dir(self.DEST_DIR)
 
         _make_clean_dir(self.TEST_DIR)
 
+    def _install_changed_files(self, args):
+        """
+        Bring an existing installation in ``build/testenv`` up to date by
+        copying the source files that changed since the last build.
+
+        Returns
+        -------
+        bool
+            True if the installation is up to date; False if a full
+            build is required, e.g. a non-Python file or a file that is
+            not part of the installation has changed.
+        """
+        previous = SourceManifest.load(self.ROOT_DIR, self.MANIFEST_FILE)
+        if previous is None:
+            return False
+
+        manifest = SourceManifest.scan(self.ROOT_DIR, previous)
+        changed = manifest.changed(previous)
+
+        installed = read_install_record(self.INSTALL_RECORD, self.SITE_DIRS)
+        if installed is None:
+            return len(changed) == 0
+
+        for path in changed:
+            if not path.endswith('.py') or path not in installed:
+                return False
+            if not os.path.exists(os.path.join(self.ROOT_DIR, path)):
+                return False
+
+        for path in changed:
+            dest = installed[path]
+            # replace rather than write into the installed file
+            if os.path.exists(dest):
+                os.remove(dest)
+            shutil.copy2(os.path.join(self.ROOT_DIR, path), dest)
+
+        manifest.save(self.MANIFEST_FILE)
+        if len(changed) == 0:
+            print("Installation in %s is up to date" % self.DEST_DIR)
+        else:
+            print("Incrementally installed %d changed file(s)" % len(changed))
+        return True
+
     def _clean_build(self):
         """
         Clean the build directory.
@@ -421,7 +988,7 @@ class Tester(object):
         cmd = [sys.executable, 'setup.py']
 
         # Always use ccache, if installed
-        env['PATH'] = os.pathsep.join(self.EXTRA_PATH + env.get('PATH', '').split(os.pathsep))
+        ccache = CompilerCache(self.EXTRA_PATH, env)
 
         # easy_install won't install to a path that Python by default cannot see
         # and isn't on the PYTHONPATH.  Plus, it has to exist.
@@ -439,7 +1006,15 @@ class Tester(object):
 
         cmd += ['build']
 
-        if args.parallel > 1:
+        if args.compile_pool:
+            # compile in a pool rather than passing -j to setup.py
+            npool = args.parallel if args.parallel > 0 else get_cpu_count()
+            cmd = [sys.executable, '-c',
+                   'from runtests.build import run_setup_with_compile_pool; run_setup_with_compile_pool()',
+                   str(npool)] + cmd[1:]
+            runtests_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            env['PYTHONPATH'] = env['PYTHONPATH'] + ':' + runtests_dir
+        elif args.parallel > 1:
             cmd += ["-j", str(args.parallel)]
 
         if args.enable_debug:
@@ -458,38 +1033,36 @@ class Tester(object):
         if use_setuptools:
             cmd += ['install', '--prefix=' + self.DEST_DIR,
                     '--single-version-externally-managed',
-                    '--record=' + self.DEST_DIR + 'tmp_install_log.txt']
+                    '--record=' + self.INSTALL_RECORD]
         else:
             cmd += ['install', '--prefix=' + self.DEST_DIR]
 
+        cache_stats = ccache.stats()
+
         log_filename = os.path.join(self.ROOT_DIR, 'build.log')
         if args.show_build_log:
             ret = subprocess.call(cmd, env=env, cwd=self.ROOT_DIR)
+            summary = None
         else:
             print("Building, see build.log...")
-            with open(log_filename, 'w') as log:
-                p = subprocess.Popen(cmd, env=env, stdout=log, stderr=log,
-                                     cwd=self.ROOT_DIR)
-
-            # Wait for it to finish, and print something to indicate the
-            # process is alive, but only if the log file has grown (to
-            # allow continuous integration environments kill a hanging
-            # process accurately if it produces no output)
-            last_blip = time.time()
-            last_log_size = os.stat(log_filename).st_size
-            while p.poll() is None:
-                time.sleep(0.5)
-                if time.time() - last_blip > 60:
-                    log_size = os.stat(log_filename).st_size
-                    if log_size > last_log_size:
-                        print("    ... build in progress")
-                        last_blip = time.time()
-                        last_log_size = log_size
-
-            ret = p.wait()
+            sys.stdout.flush()
+            with open(log_filename, 'wb') as log:
+                p = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, cwd=self.ROOT_DIR)
+
+                # follow the output as it arrives, until the build exits
+                monitor = BuildMonitor(log)
+                ret = monitor.run(p)
+                summary = monitor.summary()
 
         if ret == 0:
-            print("Build OK")
+            if summary is not None:
+                print("Build OK (%s)" % summary)
+            else:
+                print("Build OK")
+            report = ccache.report(cache_stats, ccache.stats())
+            if report is not None:
+                print("    " + report)
         else:
             if not args.show_build_log:
                 with open(log_filename, 'r') as f:
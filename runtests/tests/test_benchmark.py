@@ -15,3 +15,34 @@ def test_benchmark2(benchmark, x):
 
     # store some meta-data about this run
     benchmark.attrs.update(x=x)
+
+def test_benchmark3(benchmark):
+    # nested tags; repeated tags keep every sample
+    with benchmark("solve"):
+        for i in range(3):
+            with benchmark("iteration"):
+                time.sleep(0.1)
+
+def test_benchmark4(benchmark):
+    # calibrated and repeated, with warm-up and outlier rejection
+    stats = benchmark.run("sum", sum, args=(range(1000),), repeat=5, target_time=0.05)
+
+    # the value of the tag is the median; the samples are only samples
+    assert benchmark.benchmark["sum"] == stats['wall']['median']
+    assert sorted(benchmark.benchmark['samples']["sum"]) == ['cpu', 'wall']
+    calibration = benchmark.benchmark['calibration']["sum"]
+    assert calibration['number'] >= 1
+    assert calibration['rejected'] == 5 - stats['wall']['n']
+
+    with pytest.raises(ValueError):
+        with benchmark("sum"):
+            pass
+
+def test_benchmark5(benchmark):
+    # with --bench-memory, the memory used by each tag is also recorded
+    with benchmark("allocate"):
+        x = bytearray(32 * 1024 ** 2)
+        with benchmark("touch"):
+            for i in range(0, len(x), 4096):
+                x[i] = 1
+        del x
@@ -0,0 +1,16 @@
+from runtests.build import BuildMonitor
+import subprocess
+import time
+import io
+
+def test_monitor_daemon_holds_pipe():
+    # the background sleep inherits stdout, like a compiler cache daemon
+    cmd = ['sh', '-c', 'echo "building \'foo\' extension"; printf partial; sleep 30 &']
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    log = io.BytesIO()
+    monitor = BuildMonitor(log, stream=io.StringIO())
+    t0 = time.time()
+    assert monitor.run(p) == 0
+    assert time.time() - t0 < 10
+    assert monitor.extension == 'foo'
+    assert log.getvalue().endswith(b'partial')
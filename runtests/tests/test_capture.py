@@ -0,0 +1,40 @@
+from runtests.mpi.capture import Window, SpillCapture, parse_size
+import gzip
+import os
+
+def test_parse_size():
+    assert parse_size('100') == 100
+    assert parse_size('1k') == 1024
+    assert parse_size('1.5M') == 1536 * 1024
+
+def test_window():
+    w = Window(4)
+    for s in ['ab', 'cdef', 'g', 'hijklm', 'n']:
+        w.write(s)
+    assert w.head == 'abcd'
+    assert w.tail == 'klmn'
+    assert w.getvalue() == 'abcd\n... 6 characters omitted ...\nklmn'
+
+    w = Window(4)
+    w.write('abcdef')
+    assert w.getvalue() == 'abcdef'
+
+def test_spill_capture(tmpdir):
+    filename = str(tmpdir.join('output.gz'))
+    capture = SpillCapture(filename, limit=10, window=4)
+    capture.begin('test_a')
+    capture.write('hello ')
+    assert capture.getvalue() == 'hello '
+    capture.begin('test_b')
+    capture.write('world, again')
+    capture.close()
+
+    assert capture.spilled
+    with gzip.open(filename, 'rb') as ff:
+        assert ff.read() == b'hello world, again'
+    assert capture.getvalue().startswith('hell\n... 10 characters omitted')
+    assert capture.getvalue().endswith('gain')
+    assert capture.segment('test_a') == 'hello '
+    assert capture.segment('test_b') == ('worl\n... 4 characters omitted; the full output is in %s ...\ngain'
+                                         % filename)
+    assert capture.segment('test_c') is None
@@ -0,0 +1,66 @@
+from runtests.compare import mann_whitney, critical_path, compare, format_changes
+from runtests.compare import load_baseline
+from runtests.history import BenchmarkHistory
+
+def test_mann_whitney():
+    # U = 0; the normal approximation with continuity correction
+    p = mann_whitney([1., 2., 3., 4.], [5., 6., 7., 8.])
+    assert abs(p - 0.0303828) < 1e-6
+    assert mann_whitney([1., 2., 3., 4.], [4., 3., 2., 1.]) == 1.
+    # all tied
+    assert mann_whitney([1.] * 4, [1.] * 4) == 1.
+
+def test_critical_path():
+    # the ranks take the samples in step
+    assert critical_path([3., None, 4.], [[1., 2.], None, [2., 2.]]) == (4., [2., 2.])
+    # else the samples of the slowest rank
+    assert critical_path([3., 4.], [[1., 2.], [2., 1., 1.]]) == (4., [2., 1., 1.])
+    assert critical_path([3., 4.], None) == (4., None)
+    assert critical_path([None, None], None) == (None, None)
+
+def test_compare():
+    fast = [1., 1.1, 0.9, 1., 1.05]
+    slow = [2., 2.1, 1.9, 2., 2.05]
+    baseline = {('t', 'a') : ([1.], [fast]),
+                ('t', 'b') : ([2.], [slow]),
+                ('t', 'c') : ([1.], None),
+                ('t', 'd') : ([1.], [fast])}
+    current = {('t', 'a') : ([2.], [slow]),
+               ('t', 'b') : ([1.], [fast]),
+               ('t', 'c') : ([1.01], None),
+               ('t', 'd') : ([1.5], [[1., 1.1, 0.9, 1., 5.]]),
+               ('t', 'e') : ([1.], None)}
+    changes = compare(baseline, current, threshold=0.05)
+    assert [(c['tag'], c['status']) for c in changes] == [
+        ('a', 'regression'), ('b', 'improvement'), ('c', 'unchanged'),
+        ('d', 'unchanged'), ('e', 'new')]
+    assert changes[0]['ratio'] == 2.
+    # slower by the values, but not by the rank test of the samples
+    assert changes[3]['p'] > 0.05
+
+    lines = format_changes(changes, 'baseline')
+    assert lines[-1] == "1 regression(s), 1 improvement(s), 2 unchanged, 1 new"
+    assert len(lines) == 5
+
+def test_load_baseline(tmpdir):
+    def results(**values):
+        # one output file per test, with the tag A on one rank
+        return dict(('test_mod.' + name, {'tests' : [name + '_0'],
+                     name + '_0' : {'testname' : name, 'tags' : ['A'], 'attrs' : {}, 'A' : [value]}})
+                    for name, value in values.items())
+
+    filename = str(tmpdir.join('history.db'))
+    history = BenchmarkHistory(filename)
+    # two partial runs of a git hash, and a later run of another hash
+    run1 = history.append({'git_hash' : 'aaaa111'}, results(test_a=1., test_b=2.))
+    run2 = history.append({'git_hash' : 'aaaa111'}, results(test_b=3.))
+    history.append({'git_hash' : 'bbbb222'}, results(test_a=4.))
+    history.close()
+
+    baseline, description = load_baseline('aaaa', history=filename)
+    assert baseline == {('test_mod.test_a', 'A') : ([1.], None),
+                        ('test_mod.test_b', 'A') : ([3.], None)}
+    assert description == "git hash aaaa (runs %d, %d of the history)" % (run1, run2)
+
+    baseline, description = load_baseline('cccc', history=filename)
+    assert baseline == {}
@@ -0,0 +1,28 @@
+from runtests.durations import DurationStore
+
+def test_record(tmpdir):
+    filename = str(tmpdir.join('durations.json'))
+    store = DurationStore(filename, smoothing=0.5)
+    store.record('test_a', 2.)
+    store.record('test_a', 4.)
+    store.record('test_b', 1., failed=True)
+    store.save()
+
+    store = DurationStore(filename)
+    assert store.get('test_a') == 3.
+    assert store.get('test_c') is None
+    assert store.failed('test_b')
+    assert not store.failed('test_a')
+
+def test_order(tmpdir):
+    store = DurationStore(str(tmpdir.join('durations.json')))
+    store.record('test_a', 1., failed=True)
+    store.record('test_b', 3.)
+    store.record('test_c', 2.)
+    store.record('test_d', 1.)
+    nodeids = ['test_a', 'test_b', 'test_c', 'test_d', 'test_e']
+    # unknown first, then the longest; ties keep the default order
+    assert store.order(nodeids, 'duration') == ['test_e', 'test_b', 'test_c', 'test_a', 'test_d']
+    assert store.order(nodeids, 'failed-first') == nodeids
+    assert store.order(nodeids[::-1], 'failed-first') == ['test_a', 'test_e', 'test_d', 'test_c', 'test_b']
+    assert store.order(nodeids, 'default') == nodeids
@@ -0,0 +1,43 @@
+from runtests.history import BenchmarkHistory, flatten_results
+
+def make_results(a, b):
+    # two ranks; tag B only ran on rank 1, without samples
+    variant = {'testname' : 'test_func[1]', 'tags' : ['A', 'B'], 'attrs' : {'x' : 1},
+               'A' : a, 'B' : [None, b],
+               'samples' : {'A' : [{'wall' : [a[0]], 'cpu' : [0.]}, {'wall' : [a[1]], 'cpu' : [0.]}]},
+               'stats' : {}}
+    return {'test_mod.test_func' : {'tests' : ['test_func_0'], 'test_func_0' : variant}}
+
+def header(git_hash):
+    return {'git_hash' : git_hash, 'host' : 'host', 'commsize' : 2}
+
+def test_flatten_results():
+    rows = list(flatten_results(make_results([1., 2.], 3.)))
+    assert rows == [
+        ('test_mod.test_func[1]', 'A', [1., 2.], [[1.], [2.]], None, None, {'x' : 1}),
+        ('test_mod.test_func[1]', 'B', [None, 3.], None, None, None, {'x' : 1}),
+    ]
+
+def test_history(tmpdir):
+    history = BenchmarkHistory(str(tmpdir.join('history.db')))
+    run1 = history.append(header('aaaa111'), make_results([1., 2.], 3.))
+    run2 = history.append(header('bbbb222'), make_results([4., 2.], 5.))
+    history.close()
+
+    history = BenchmarkHistory(str(tmpdir.join('history.db')))
+    assert [run['git_hash'] for run in history.runs()] == ['aaaa111', 'bbbb222']
+    assert history.tests() == [('test_mod.test_func[1]', 'A'), ('test_mod.test_func[1]', 'B')]
+
+    series = history.series('test_mod.test_func[1]', 'A')
+    assert [(s['git_hash'], s['value']) for s in series] == [('aaaa111', 2.), ('bbbb222', 4.)]
+    series = history.series('test_mod.test_func[1]', 'A', reduce='min', git_hash='bbbb222')
+    assert [s['value'] for s in series] == [2.]
+
+    assert history.find_runs('bbbb') == [run2]
+    assert history.find_runs('cccc') == []
+    assert history.samples(run1, 'test_mod.test_func[1]', 'A') == [[1.], [2.]]
+    assert history.results(run1) == {
+        ('test_mod.test_func[1]', 'A') : ([1., 2.], [[1.], [2.]]),
+        ('test_mod.test_func[1]', 'B') : ([None, 3.], None),
+    }
+    history.close()
@@ -0,0 +1,30 @@
+from runtests.impact import ImpactMap
+
+def make_map(tmpdir):
+    impact = ImpactMap(str(tmpdir.join('impact.json')), 'mypkg')
+    impact.tests = {
+        'mypkg/tests/test_core.py::test_a' : ['mypkg/core.py'],
+        'mypkg/tests/test_core.py::test_b' : ['mypkg/core.py', 'mypkg/util.py'],
+        'mypkg/tests/test_io.py::test_c' : ['mypkg/io.py'],
+    }
+    return impact
+
+def test_affected(tmpdir):
+    impact = make_map(tmpdir)
+    nodeids = sorted(impact.tests) + ['mypkg/tests/test_new.py::test_d']
+
+    # unknown tests are always selected
+    assert impact.affected(nodeids, ['mypkg/util.py']) == [
+            'mypkg/tests/test_core.py::test_b', 'mypkg/tests/test_new.py::test_d']
+    # the file of a test is a dependency of the test
+    assert impact.affected(nodeids, ['mypkg/tests/test_io.py']) == [
+            'mypkg/tests/test_io.py::test_c', 'mypkg/tests/test_new.py::test_d']
+    # changes outside of the package do not matter
+    assert impact.affected(nodeids, ['README.md']) == ['mypkg/tests/test_new.py::test_d']
+
+def test_affected_build(tmpdir):
+    impact = make_map(tmpdir)
+    nodeids = sorted(impact.tests)
+    # a build input may affect any test
+    assert impact.affected(nodeids, ['setup.py']) == nodeids
+    assert impact.affected(nodeids, ['mypkg/_ext.c']) == nodeids
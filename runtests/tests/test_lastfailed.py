@@ -0,0 +1,25 @@
+from runtests.mpi.lastfailed import LastFailedStore
+import os
+
+def test_lastfailed_fragments(tmpdir):
+    store = LastFailedStore(str(tmpdir.join('lastfailed.json')))
+
+    # a test fails on rank 1 only
+    assert store.collect() == {}
+    store.save_fragment(1, ['test_a'])
+    store.update(['test_a', 'test_b'], [])
+    assert store.load() == {'test_a' : [1]}
+
+    # the next run folds the fragment, and the test passes
+    assert store.collect() == {'test_a' : [1]}
+    assert not os.path.exists(store.filename + '.rank-1')
+    store.update(['test_a', 'test_b'], [])
+
+    assert store.collect() == {}
+
+def test_lastfailed_update(tmpdir):
+    store = LastFailedStore(str(tmpdir.join('lastfailed.json')))
+    store.update(['test_a', 'test_b'], ['test_a', 'test_b'])
+    # tests that did not run are kept
+    store.update(['test_a'], [])
+    assert store.collect() == {'test_b' : [0]}
@@ -0,0 +1,59 @@
+from runtests.benchmark import BenchmarkLogger
+import pytest
+import json
+import os
+
+def variant(tags):
+    return {'tags' : tags, 'testname' : 'test_func', 'attrs' : {},
+            'memory' : False, 'profile' : False}
+
+def result(value):
+    samples = {'wall' : [value], 'cpu' : [value]}
+    return (value, samples, None, None, None, None, None)
+
+class FakeComm(object):
+    """ the root of two ranks; the other rank sent ``other`` """
+    rank = 0
+    size = 2
+    def __init__(self, other):
+        self.other = other
+        self.bcasts = []
+    def gather(self, local, root=0):
+        return [local, self.other]
+    def bcast(self, value):
+        self.bcasts.append(value)
+        return value
+
+def test_report_union(tmpdir):
+    # test_func_1 and tag 'b' only ran on rank 1
+    other = {'index' : {'test_mod.test_func' : ['test_mod/test_func_0', 'test_mod/test_func_1']},
+             'meta' : {'test_mod/test_func_0' : variant(['a', 'b']),
+                       'test_mod/test_func_1' : variant(['c'])},
+             'results' : {'test_mod/test_func_0' : {'a' : result(2.), 'b' : result(3.)},
+                          'test_mod/test_func_1' : {'c' : result(4.)}}}
+    logger = BenchmarkLogger(str(tmpdir), comm=FakeComm(other))
+    logger.add_result('test_mod/test_func',
+                      {'filename' : 'test_mod.test_func', 'testname' : 'test_func',
+                       'tags' : ['a'], 'samples' : {'a' : {'wall' : [1.], 'cpu' : [1.]}},
+                       'a' : 1., 'attrs' : {}})
+    logger.report()
+
+    with open(os.path.join(str(tmpdir), 'test_mod.test_func.json')) as ff:
+        r = json.load(ff)
+    assert r['tests'] == ['test_func_0', 'test_func_1']
+    assert r['tags'] == ['a', 'b']
+    assert r['test_func_0']['a'] == [1., 2.]
+    assert r['test_func_0']['b'] == [None, 3.]
+    assert r['test_func_1']['c'] == [None, 4.]
+
+def test_report_baseline_error(tmpdir):
+    # a history that is not a database
+    history = tmpdir.join('history.db')
+    history.write('garbage')
+    other = {'index' : {}, 'meta' : {}, 'results' : {}}
+    comm = FakeComm(other)
+    logger = BenchmarkLogger(str(tmpdir), comm=comm, baseline='abc123', history=str(history))
+    with pytest.raises(Exception):
+        logger.report()
+    # the other ranks are not left waiting
+    assert comm.bcasts == [0]
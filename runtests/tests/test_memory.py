@@ -0,0 +1,19 @@
+from runtests.memory import MemoryTracker
+
+def test_memory_tracker():
+    tracker = MemoryTracker(top=3)
+    outer = tracker.start()
+    x = bytearray(4 * 1024 ** 2)
+    inner = tracker.start()
+    y = bytearray(1024 ** 2)
+    usage = tracker.stop(inner)
+    del y
+    assert usage['peak'] >= 1024 ** 2
+    # only the outermost block records the allocation sites
+    assert usage['top'] == []
+
+    usage = tracker.stop(outer)
+    assert usage['peak'] >= 5 * 1024 ** 2
+    assert usage['top'][0][0].endswith('test_memory.py:6')
+    assert usage['top'][0][1] >= 4 * 1024 ** 2
+    del x
@@ -0,0 +1,36 @@
+from runtests.scaling import points, fit_amdahl, fit_gustafson, scaling_table, analyze
+
+def test_fit_amdahl():
+    sizes = [1, 2, 4, 8]
+    times = [10. * (0.2 + 0.8 / p) for p in sizes]
+    assert abs(fit_amdahl(sizes, times) - 0.2) < 1e-12
+    assert fit_amdahl([1], [10.]) is None
+
+def test_fit_gustafson():
+    sizes = [1, 2, 4, 8]
+    speedups = [p - 0.1 * (p - 1) for p in sizes]
+    assert abs(fit_gustafson(sizes, speedups) - 0.1) < 1e-12
+    assert fit_gustafson([1], [1.]) is None
+
+def test_scaling_table():
+    # perfect strong scaling from 2 ranks
+    table = scaling_table({2 : 4., 4 : 2., 8 : 1.}, 'strong')
+    assert table['commsize'] == [2, 4, 8]
+    assert table['speedup'] == [2., 4., 8.]
+    assert table['efficiency'] == [1., 1., 1.]
+    assert table['serial_fraction'] == 0.
+
+    # weak scaling, twice as slow on 4 ranks
+    table = scaling_table({1 : 1., 4 : 2.}, 'weak')
+    assert table['speedup'] == [1., 2.]
+    assert table['efficiency'] == [1., 0.5]
+    assert abs(table['serial_fraction'] - 2. / 3) < 1e-12
+
+def test_analyze():
+    variant = {'tags' : ['commsize=1/solve', 'commsize=2/solve', 'other'],
+               'commsize=1/solve' : [2., None], 'commsize=2/solve' : [0.9, 1.],
+               'other' : [1., 1.],
+               'attrs' : {'scaling' : {'mode' : 'strong'}}}
+    # the maximum over the ranks, by comm size
+    assert points(variant) == {'solve' : {1 : 2., 2 : 1.}}
+    assert analyze(variant)['solve']['speedup'] == [1., 2.]
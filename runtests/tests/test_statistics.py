@@ -0,0 +1,40 @@
+from runtests.benchmark import summarize, reject_outliers, imbalance
+
+def test_summarize():
+    stats = summarize([4., 1., 3., 2.])
+    assert stats['n'] == 4
+    assert stats['total'] == 10.
+    assert (stats['min'], stats['max']) == (1., 4.)
+    assert stats['median'] == 2.5
+    assert stats['mean'] == 2.5
+    assert abs(stats['std'] - (5. / 3) ** 0.5) < 1e-12
+    assert stats['iqr'] == 3.25 - 1.75
+
+    assert summarize([2.])['std'] == 0.
+    assert summarize([]) == {'n' : 0}
+
+def test_reject_outliers():
+    # q1 = 1.25, q3 = 2.75: the fences are [-1, 5]
+    assert reject_outliers([1., 2., 1., 3., 2., 10.]) == [0, 1, 2, 3, 4]
+    assert reject_outliers([1., 2., 1., 3., 2., 10.], k=5.) == [0, 1, 2, 3, 4, 5]
+    # too few samples to tell
+    assert reject_outliers([1., 100., 1.]) == [0, 1, 2]
+
+def test_imbalance():
+    values = [1., 2., None, 3.]
+    samples = [[0.5, 0.5], [1., 1.], None, [1.5, 1.5]]
+    waits = [{'entry' : 0.1}, {'entry' : 0.2}, None, {'entry' : 0.}]
+    result = imbalance(values, samples, waits)
+    assert result['max_over_mean'] == 1.5
+    assert result['slowest_rank'] == 3
+    assert result['spread'] == 2.
+    assert result['wait_exit'] == [2., 1., None, 0.]
+    assert result['wait_entry'] == [0.1, 0.2, None, 0.]
+    assert 'mpi' not in result
+
+    # without samples in step, from the values
+    result = imbalance(values, [[1.], [1., 1.], None, [3.]])
+    assert result['wait_exit'] == [2., 1., None, 0.]
+
+    # a single rank
+    assert imbalance([None, 1.]) is None
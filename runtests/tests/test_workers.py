@@ -0,0 +1,10 @@
+from runtests.workers import schedule
+
+def test_schedule_lpt():
+    # longest first, each to the least loaded worker
+    assert schedule([5., 4., 3., 3., 3.], 2) == [[0, 3], [1, 2, 4]]
+
+def test_schedule_unknown():
+    # unknown durations are taken as the median of the known ones
+    assert schedule([None, 1., 2., 6.], 2) == [[3], [0, 2, 1]]
+    assert schedule([None, None], 3) == [[0], [1], []]
@@ -0,0 +1,241 @@
+"""
+    Run the collected tests of a session in forked worker processes.
+
+    Each worker runs a shard of the items and sends its test reports back
+    to the main process through a pipe, where they are passed to the
+    ``pytest_runtest_logreport`` hook as if the tests had run locally.
+"""
+import os
+import sys
+import struct
+import select
+import signal
+import pickle
+import traceback
+
+def schedule(durations, nworkers):
+    """
+    Partition tests among workers, longest first, to the least loaded
+    worker (the LPT rule).
+
+    Parameters
+    ----------
+    durations : list of float or None
+        the expected duration of each test; None if unknown, in which case
+        the median of the known durations is assumed
+    nworkers : int
+        the number of workers
+
+    Returns
+    -------
+    shards : list of list of int
+        the indices of the tests run by each worker, in the order to run them
+    """
+    known = sorted(d for d in durations if d is not None)
+    default = known[len(known) // 2] if known else 1.0
+    durations = [default if d is None else d for d in durations]
+
+    order = sorted(range(len(durations)), key=lambda i: -durations[i])
+    loads = [0.] * nworkers
+    shards = [[] for i in range(nworkers)]
+    for i in order:
+        w = loads.index(min(loads))
+        shards[w].append(i)
+        loads[w] += durations[i]
+    return shards
+
+def _teardown(session, item):
+    """
+    Tear down the fixtures that are still set up after ``item``, as if it
+    were the last item of the session.
+    """
+    state = session._setupstate
+    if hasattr(state, '_finalizers'):
+        # pytest < 7
+        state.teardown_exact(item, None)
+    else:
+        state.teardown_exact(None)
+
+def _send(fd, message):
+    data = pickle.dumps(message, protocol=2)
+    data = struct.pack('!I', len(data)) + data
+    while data:
+        n = os.write(fd, data)
+        data = data[n:]
+
+class _Channel(object):
+    """
+    The receiving end of the pipe of a worker.
+    """
+    def __init__(self, pid, fd):
+        self.pid = pid
+        self.fd = fd
+        self.buffer = b''
+        self.done = False
+
+    def read(self):
+        """
+        Read available data; return the complete messages received.
+        """
+        data = os.read(self.fd, 65536)
+        if not data:
+            self.done = True
+        self.buffer += data
+        messages = []
+        while len(self.buffer) >= 4:
+            n, = struct.unpack('!I', self.buffer[:4])
+            if len(self.buffer) < 4 + n:
+                break
+            messages.append(pickle.loads(self.buffer[4:4 + n]))
+            self.buffer = self.buffer[4 + n:]
+        return messages
+
+class WorkerChannel(object):
+    """
+    The sending end of the pipe in a worker; available to the tester as
+    ``tester._worker`` for the lifetime of the worker.
+    """
+    def __init__(self, index, fd):
+        self.index = index
+        self.fd = fd
+
+    def send(self, kind, payload):
+        _send(self.fd, (kind, payload))
+
+class WorkerPool(object):
+    """
+    Run the items of a session in forked workers.
+
+    Parameters
+    ----------
+    session :
+        the pytest session, with collected items
+    nworkers : int
+        the number of workers
+    durations : DurationStore
+        the durations of previous runs, used for scheduling
+    on_fork : callable, optional
+        called as ``on_fork(channel)`` in each worker after forking
+    on_exit : callable, optional
+        called as ``on_exit(channel)`` in each worker after running its items
+    """
+    def __init__(self, session, nworkers, durations, on_fork=None, on_exit=None):
+        self.session = session
+        self.config = session.config
+        self.nworkers = nworkers
+        self.durations = durations
+        self.on_fork = on_fork
+        self.on_exit = on_exit
+
+        # payloads of other messages sent by the workers, by kind
+        self.messages = {}
+
+    def run(self):
+        """
+        Run all items; reports are passed to the hooks of the main process
+        as they arrive.
+        """
+        items = self.session.items
+        shards = schedule([self.durations.get(item.nodeid) for item in items],
+                          min(self.nworkers, max(len(items), 1)))
+
+        channels = []
+        try:
+            for index, shard in enumerate(shards):
+                rfd, wfd = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(rfd)
+                    for channel in channels:
+                        os.close(channel.fd)
+                    self._run_worker(WorkerChannel(index, wfd), [items[i] for i in shard])
+                os.close(wfd)
+                channels.append(_Channel(pid, rfd))
+
+            self._receive(channels)
+        finally:
+            for channel in channels:
+                if not channel.done:
+                    os.kill(channel.pid, signal.SIGTERM)
+                os.close(channel.fd)
+                os.waitpid(channel.pid, 0)
+
+        if self.session.shouldfail:
+            raise self.session.Failed(self.session.shouldfail)
+        if self.session.shouldstop:
+            raise self.session.Interrupted(self.session.shouldstop)
+
+    def _receive(self, channels):
+        hook = self.config.hook
+        active = list(channels)
+        stopping = False
+        while active:
+            ready, _, _ = select.select([c.fd for c in active], [], [])
+            for channel in [c for c in active if c.fd in ready]:
+                for kind, payload in channel.read():
+                    if kind == 'report':
+                        report = hook.pytest_report_from_serializable(
+                                    config=self.config, data=payload)
+                        location = tuple(report.location)
+                        if report.when == 'setup':
+                            hook.pytest_runtest_logstart(nodeid=report.nodeid, location=location)
+                        hook.pytest_runtest_logreport(report=report)
+                        if report.when == 'teardown':
+                            hook.pytest_runtest_logfinish(nodeid=report.nodeid, location=location)
+                    else:
+                        self.messages.setdefault(kind, []).append(payload)
+                if channel.done:
+                    active.remove(channel)
+
+            if (self.session.shouldfail or self.session.shouldstop) and not stopping:
+                # let the workers finish their current item and tear down,
+                # such that the session fixtures still send their results
+                stopping = True
+                for channel in active:
+                    os.kill(channel.pid, signal.SIGUSR1)
+
+    def _run_worker(self, channel, items):
+        """
+        The main function of a worker; does not return.
+        """
+        def stop(signum, frame):
+            self.session.shouldstop = "stopped by the main process"
+        signal.signal(signal.SIGUSR1, stop)
+
+        code = 0
+        try:
+            config = self.config
+            pluginmanager = config.pluginmanager
+
+            # the main process reports; the worker only sends its reports
+            reporter = pluginmanager.getplugin('terminalreporter')
+            if reporter is not None:
+                pluginmanager.unregister(reporter)
+
+            class Forwarder(object):
+                def pytest_runtest_logreport(self, report):
+                    channel.send('report',
+                        config.hook.pytest_report_to_serializable(config=config, report=report))
+            pluginmanager.register(Forwarder(), 'runtests-worker-forwarder')
+
+            if self.on_fork is not None:
+                self.on_fork(channel)
+
+            for i, item in enumerate(items):
+                nextitem = items[i + 1] if i + 1 < len(items) else None
+                item.config.hook.pytest_runtest_protocol(item=item, nextitem=nextitem)
+                if nextitem is not None and (self.session.shouldfail or self.session.shouldstop):
+                    # finalize the fixtures that were kept for the next
+                    # item, e.g. session_benchmark sends its results
+                    _teardown(self.session, item)
+                    break
+
+            if self.on_exit is not None:
+                self.on_exit(channel)
+        except:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)